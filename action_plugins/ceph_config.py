@@ -0,0 +1,76 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional
+__metaclass__ = type
+
+from ansible.plugins.action import ActionBase  # type: ignore
+from ansible.utils.vars import merge_hash  # type: ignore
+
+
+class ActionModule(ActionBase):
+    '''
+    When 'options_var' is passed, collect the options defined in that
+    variable for every host of the play and hand them over to a single
+    ceph_config module call, so the admin node runs one `config dump`
+    and one batched `config set` rather than one pair per host.
+    Otherwise, the module is called as is.
+    '''
+
+    def run(self, tmp: Optional[str] = None, task_vars: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        task_vars = task_vars or {}
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        module_args = self._task.args.copy()
+        options_var = module_args.pop('options_var', None)
+
+        if not options_var:
+            return merge_hash(result, self._execute_module(module_name='ceph_config',
+                                                           module_args=module_args,
+                                                           task_vars=task_vars))
+
+        if not self._task.run_once:
+            result['failed'] = True
+            result['msg'] = "'options_var' requires 'run_once: true'."
+            return result
+
+        hosts = task_vars.get('ansible_play_batch') or [task_vars['inventory_hostname']]
+        options: List[Dict[str, Any]] = []
+        owners: List[str] = []
+        for host in hosts:
+            host_options = task_vars['hostvars'][host].get(options_var) or []
+            options.extend(host_options)
+            owners.extend([host] * len(host_options))
+
+        if not options:
+            result['changed'] = False
+            result['msg'] = 'No option defined in {}, skipping.'.format(options_var)
+            result['per_host'] = {host: dict(changed=False, results=[]) for host in hosts}
+            return result
+
+        module_args['options'] = options
+        module_result = self._execute_module(module_name='ceph_config',
+                                             module_args=module_args,
+                                             task_vars=task_vars)
+
+        per_host: Dict[str, Dict[str, Any]] = {host: dict(changed=False, results=[]) for host in hosts}
+        for owner, item in zip(owners, module_result.get('results', [])):
+            per_host[owner]['results'].append(item)
+            per_host[owner]['changed'] = per_host[owner]['changed'] or item.get('changed', False)
+        module_result['per_host'] = per_host
+
+        return merge_hash(result, module_result)
@@ -0,0 +1,143 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional
+__metaclass__ = type
+
+from ansible.errors import AnsibleError  # type: ignore
+from ansible.module_utils.common.json import AnsibleJSONEncoder  # type: ignore
+from ansible.parsing.ajson import AnsibleJSONDecoder  # type: ignore
+from ansible.plugins.cache import BaseCacheModule  # type: ignore
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+
+DOCUMENTATION = '''
+---
+name: cephadm_sqlite
+short_description: compressed facts in a single SQLite database
+description:
+    - This cache stores the facts of each host as a row of a single SQLite
+      database, compressed (zlib) JSON.
+    - Rows are updated per host and loaded lazily, only the hosts whose
+      facts are actually used are read and decompressed.
+options:
+    _uri:
+        required: true
+        description:
+            - Path of the SQLite database. When it is a directory, the
+              database is created in it as 'cephadm_facts.sqlite'.
+        env:
+            - name: ANSIBLE_CACHE_PLUGIN_CONNECTION
+        ini:
+            - key: fact_caching_connection
+              section: defaults
+        type: path
+    _prefix:
+        description: User defined prefix to use when storing the facts.
+        env:
+            - name: ANSIBLE_CACHE_PLUGIN_PREFIX
+        ini:
+            - key: fact_caching_prefix
+              section: defaults
+    _timeout:
+        default: 86400
+        description: Expiration timeout (in seconds) for the cached facts, 0 means never.
+        env:
+            - name: ANSIBLE_CACHE_PLUGIN_TIMEOUT
+        ini:
+            - key: fact_caching_timeout
+              section: defaults
+        type: integer
+'''
+
+DB_NAME = 'cephadm_facts.sqlite'
+COMPRESSION_LEVEL = 1
+
+
+class CacheModule(BaseCacheModule):
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super(CacheModule, self).__init__(*args, **kwargs)
+        path = os.path.expanduser(os.path.expandvars(self.get_option('_uri')))
+        if os.path.isdir(path):
+            path = os.path.join(path, DB_NAME)
+        self._path = path
+        self._prefix = self.get_option('_prefix') or ''
+        self._timeout = float(self.get_option('_timeout'))
+        self._cache: Dict[str, Any] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = os.getpid()
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection mustn't be used across a fork
+        if self._db is not None and self._pid != os.getpid():
+            self._db = None
+        if self._db is None:
+            self._pid = os.getpid()
+            try:
+                os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+                self._db = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('PRAGMA synchronous=NORMAL')
+                self._db.execute('CREATE TABLE IF NOT EXISTS facts (key TEXT PRIMARY KEY, updated REAL NOT NULL, data BLOB NOT NULL)')
+            except (OSError, sqlite3.Error) as e:
+                raise AnsibleError('Error opening the facts cache {}: {}'.format(self._path, e))
+        return self._db
+
+    def _min_updated(self) -> float:
+        return time.time() - self._timeout if self._timeout > 0 else 0
+
+    def get(self, key: str) -> Any:
+        if key not in self._cache:
+            row = self._connect().execute('SELECT data FROM facts WHERE key = ? AND updated >= ?',
+                                          (self._prefix + key, self._min_updated())).fetchone()
+            if row is None:
+                raise KeyError(key)
+            self._cache[key] = json.loads(zlib.decompress(row[0]).decode(), cls=AnsibleJSONDecoder)
+        return self._cache[key]
+
+    def set(self, key: str, value: Any) -> None:
+        data = zlib.compress(json.dumps(value, cls=AnsibleJSONEncoder, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+        self._connect().execute('INSERT OR REPLACE INTO facts (key, updated, data) VALUES (?, ?, ?)',
+                                (self._prefix + key, time.time(), data))
+        self._cache[key] = value
+
+    def keys(self) -> List[str]:
+        rows = self._connect().execute("SELECT key FROM facts WHERE key LIKE ? ESCAPE '\\' AND updated >= ?",
+                                       (self._prefix.replace('\\', '\\\\').replace('%', r'\%').replace('_', r'\_') + '%', self._min_updated()))
+        return [row[0][len(self._prefix):] for row in rows if row[0].startswith(self._prefix)]
+
+    def contains(self, key: str) -> bool:
+        if key in self._cache:
+            return True
+        return self._connect().execute('SELECT 1 FROM facts WHERE key = ? AND updated >= ?',
+                                       (self._prefix + key, self._min_updated())).fetchone() is not None
+
+    def delete(self, key: str) -> None:
+        self._cache.pop(key, None)
+        self._connect().execute('DELETE FROM facts WHERE key = ?', (self._prefix + key,))
+
+    def flush(self) -> None:
+        for key in self.keys():
+            self.delete(key)
+        self._cache = {}
+
+    def copy(self) -> Dict[str, Any]:
+        return {key: self.get(key) for key in self.keys()}
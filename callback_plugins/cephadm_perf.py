@@ -0,0 +1,204 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional
+__metaclass__ = type
+
+from ansible.plugins.callback import CallbackBase  # type: ignore
+import datetime
+import json
+import os
+import re
+import tempfile
+import time
+
+
+DOCUMENTATION = '''
+---
+name: cephadm_perf
+type: aggregate
+short_description: summary of the modules performance
+description:
+    - Collect the timing metadata of each task result (wall time, module
+      'delta', and for the cephadm-ansible modules the number of commands,
+      the time spent running them and waiting for the rate limits).
+    - At the end of the run, print a summary grouped by module, host and
+      fsid and the slowest tasks, and optionally write a JSON report.
+    - The skipped tasks are counted, the unreachable hosts are counted
+      as failed.
+requirements:
+    - enable in configuration
+options:
+    report_dir:
+        description:
+            - the directory where the JSON report is written
+              (cephadm-perf-<date>.json). Nothing is written when not set.
+        env:
+            - name: CEPHADM_PERF_REPORT_DIR
+        ini:
+            - section: callback_cephadm_perf
+              key: report_dir
+        type: path
+    slowest:
+        description: the number of slowest tasks to print.
+        default: 10
+        env:
+            - name: CEPHADM_PERF_SLOWEST
+        ini:
+            - section: callback_cephadm_perf
+              key: slowest
+        type: int
+'''
+
+DELTA_RE = re.compile(r'^(?:(\d+) days?, )?(\d+):(\d+):(\d+(?:\.\d+)?)$')
+
+
+def parse_delta(delta: Any) -> Optional[float]:
+    '''
+    Parse the 'delta' of a module result (str(datetime.timedelta)).
+    '''
+    match = DELTA_RE.match(str(delta or ''))
+    if not match:
+        return None
+    days, hours, minutes, seconds = match.groups()
+    return int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def summarize(records: List[Dict[str, Any]], key: str) -> Dict[str, Dict[str, Any]]:
+    summary: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        entry = summary.setdefault(record[key] or '-', dict(tasks=0, failed=0, skipped=0, wall_time=0.0, module_time=0.0,
+                                                            commands=0, command_time=0.0, queue_wait=0.0))
+        entry['tasks'] += 1
+        entry['failed'] += int(record['status'] in ('failed', 'unreachable'))
+        entry['skipped'] += int(record['status'] == 'skipped')
+        for field in ['wall_time', 'module_time', 'commands', 'command_time', 'queue_wait']:
+            entry[field] += record[field] or 0
+    for entry in summary.values():
+        for field in ['wall_time', 'module_time', 'command_time', 'queue_wait']:
+            entry[field] = round(entry[field], 3)
+    return summary
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'cephadm_perf'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self) -> None:
+        super(CallbackModule, self).__init__()
+        self.records: List[Dict[str, Any]] = []
+        self.started: Dict[Any, float] = {}
+        self.playbook: Optional[str] = None
+
+    def v2_playbook_on_start(self, playbook: Any) -> None:
+        self.playbook = getattr(playbook, '_file_name', None)
+
+    def v2_runner_on_start(self, host: Any, task: Any) -> None:
+        self.started[(host.get_name(), task._uuid)] = time.monotonic()
+
+    def record(self, result: Any, status: str = 'ok') -> None:
+        host = result._host.get_name()
+        task = result._task
+        started = self.started.pop((host, task._uuid), None)
+        wall_time = time.monotonic() - started if started is not None else None
+        data = result._result
+
+        # loops: aggregate the items
+        items = data.get('results') if isinstance(data.get('results'), list) else [data]
+        items = [item for item in items if isinstance(item, dict)]
+        module_args = (items[0].get('invocation', {}).get('module_args', {}) if items else {}) or {}
+        deltas = [parse_delta(item.get('delta')) for item in items]
+
+        def total(field: str) -> Any:
+            values = [item[field] for item in items if isinstance(item.get(field), (int, float))]
+            return sum(values) if values else None
+
+        self.records.append(dict(task=task.get_name(),
+                                 module=task.action,
+                                 host=host,
+                                 fsid=module_args.get('fsid') or task.args.get('fsid'),
+                                 status=status,
+                                 failed=status in ('failed', 'unreachable'),
+                                 wall_time=round(wall_time, 3) if wall_time is not None else None,
+                                 module_time=round(sum(d for d in deltas if d is not None), 3) if any(d is not None for d in deltas) else None,
+                                 commands=total('commands'),
+                                 command_time=total('command_time'),
+                                 queue_wait=total('queue_wait')))
+
+    def v2_runner_on_ok(self, result: Any) -> None:
+        self.record(result)
+
+    def v2_runner_on_failed(self, result: Any, ignore_errors: bool = False) -> None:
+        self.record(result, status='failed')
+
+    def v2_runner_on_skipped(self, result: Any) -> None:
+        self.record(result, status='skipped')
+
+    def v2_runner_on_unreachable(self, result: Any) -> None:
+        self.record(result, status='unreachable')
+
+    def build_report(self) -> Dict[str, Any]:
+        slowest = sorted(self.records, key=lambda r: r['wall_time'] or r['module_time'] or 0, reverse=True)
+        return dict(playbook=self.playbook,
+                    date=datetime.datetime.now().isoformat(),
+                    by_module=summarize(self.records, 'module'),
+                    by_host=summarize(self.records, 'host'),
+                    by_fsid=summarize([r for r in self.records if r['fsid']], 'fsid'),
+                    slowest=slowest[:self.get_option('slowest')],
+                    tasks=self.records)
+
+    def print_summary(self, title: str, summary: Dict[str, Dict[str, Any]]) -> None:
+        if not summary:
+            return
+        self._display.display('{}:'.format(title))
+        for name, entry in sorted(summary.items(), key=lambda i: i[1]['wall_time'], reverse=True):
+            self._display.display(('  {:<40} tasks={:<5} failed={:<3} skipped={:<3} wall={:>10.3f}s commands={:<5} '
+                                   'in_commands={:>10.3f}s queue_wait={:>8.3f}s').format(
+                name, entry['tasks'], entry['failed'], entry['skipped'], entry['wall_time'], entry['commands'],
+                entry['command_time'], entry['queue_wait']))
+
+    def write_report(self, report: Dict[str, Any]) -> None:
+        report_dir = self.get_option('report_dir')
+        if not report_dir:
+            return
+        path = os.path.join(report_dir, 'cephadm-perf-{}.json'.format(datetime.datetime.now().strftime('%Y%m%d-%H%M%S')))
+        try:
+            os.makedirs(report_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=report_dir, prefix='.cephadm-perf-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(report, f)
+            os.replace(tmp, path)
+            self._display.display('Performance report written to {}'.format(path))
+        except OSError as e:
+            self._display.warning('Failed to write the performance report {}: {}'.format(path, e))
+
+    def v2_playbook_on_stats(self, stats: Any) -> None:
+        if not self.records:
+            return
+        report = self.build_report()
+
+        self._display.banner('CEPHADM PERFORMANCE SUMMARY')
+        self.print_summary('By module', report['by_module'])
+        self.print_summary('By host', report['by_host'])
+        self.print_summary('By fsid', report['by_fsid'])
+        self._display.display('Slowest tasks:')
+        for record in report['slowest']:
+            name = '{} ({})'.format(record['task'], record['module'])[:60]
+            self._display.display('  {:<60} {:<20} {:>10.3f}s'.format(name, record['host'], record['wall_time'] or record['module_time'] or 0))
+        self.write_report(report)
@@ -0,0 +1,204 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List
+__metaclass__ = type
+
+from ansible.errors import AnsibleParserError  # type: ignore
+from ansible.plugins.inventory import BaseInventoryPlugin, Constructable, Cacheable  # type: ignore
+import json
+import subprocess
+
+
+DOCUMENTATION = '''
+---
+name: ceph_orch
+short_description: ceph cluster hosts inventory
+description:
+    - Build the inventory from `ceph orch host ls`, run once through an
+      admin host (over ssh) or locally.
+    - Hosts are added to groups according to their labels ('label_groups')
+      and 'ansible_host' is set to the address known by the orchestrator.
+    - The labels, address and status of each host are available in the
+      'ceph_labels', 'ceph_addr' and 'ceph_status' host variables, which
+      can be used with 'keyed_groups', 'groups' and 'compose'.
+    - The configuration file name must end with 'ceph_orch.yml' or
+      'ceph_orch.yaml'.
+extends_documentation_fragment:
+    - constructed
+    - inventory_cache
+options:
+    plugin:
+        description: the name of this plugin.
+        required: true
+        choices: ['ceph_orch']
+    admin_host:
+        description:
+            - the admin host to run `ceph orch host ls` on, over ssh.
+              When not set, the command is run locally.
+        required: false
+        type: str
+    ssh_user:
+        description: the user to connect to 'admin_host' with.
+        required: false
+        type: str
+    become:
+        description:
+            - run cephadm with `sudo -n`, eg. when 'ssh_user' isn't root.
+              Passwordless sudo is required.
+        type: bool
+        default: false
+    ssh_args:
+        description: extra arguments passed to ssh.
+        type: list
+        elements: str
+        default: ['-o', 'BatchMode=yes']
+    fsid:
+        description: the fsid of the Ceph cluster to interact with.
+        required: false
+        type: str
+    image:
+        description: the Ceph container image to use.
+        required: false
+        type: str
+    docker:
+        description: use docker instead of podman.
+        type: bool
+        default: false
+    label_groups:
+        description:
+            - a mapping of label to group name. The hosts having the label
+              are added to the group.
+        type: dict
+        default: {'_admin': 'admin'}
+    group:
+        description: the group all the hosts of the cluster are added to.
+        default: ceph_cluster
+        type: str
+    timeout:
+        description: how long (in seconds) to wait for `ceph orch host ls`.
+        type: int
+        default: 60
+'''
+
+EXAMPLES = '''
+# ceph_orch.yml
+plugin: ceph_orch
+admin_host: ceph-node0
+ssh_user: cephadm
+become: true
+label_groups:
+  _admin: admin
+  client: clients
+keyed_groups:
+  - key: ceph_labels
+    prefix: label
+cache: true
+cache_plugin: jsonfile
+cache_connection: ~/.ansible/inventory_cache
+cache_timeout: 600
+'''
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'ceph_orch'
+
+    def verify_file(self, path: str) -> bool:
+        return bool(super(InventoryModule, self).verify_file(path)) and path.endswith(('ceph_orch.yml', 'ceph_orch.yaml'))
+
+    def build_cmd(self) -> List[str]:
+        cmd = ['cephadm']
+        if self.get_option('docker'):
+            cmd.append('--docker')
+        if self.get_option('image'):
+            cmd.extend(['--image', self.get_option('image')])
+        cmd.append('shell')
+        if self.get_option('fsid'):
+            cmd.extend(['--fsid', self.get_option('fsid')])
+        cmd.extend(['ceph', 'orch', 'host', 'ls', '--format', 'json'])
+        if self.get_option('become'):
+            cmd = ['sudo', '-n'] + cmd
+
+        admin_host = self.get_option('admin_host')
+        if admin_host:
+            if self.get_option('ssh_user'):
+                admin_host = '{}@{}'.format(self.get_option('ssh_user'), admin_host)
+            cmd = ['ssh'] + self.get_option('ssh_args') + [admin_host, '--'] + cmd
+
+        return cmd
+
+    def get_hosts(self) -> List[Dict[str, Any]]:
+        cmd = self.build_cmd()
+        try:
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    stdin=subprocess.DEVNULL, timeout=self.get_option('timeout'))
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise AnsibleParserError('Failed to run {}: {}'.format(' '.join(cmd), e))
+        if result.returncode:
+            raise AnsibleParserError('Failed to run {}: {}'.format(' '.join(cmd), result.stderr.decode(errors='replace')))
+        try:
+            return json.loads(result.stdout)
+        except ValueError as e:
+            raise AnsibleParserError('Invalid output of {}: {}'.format(' '.join(cmd), e))
+
+    def populate(self, hosts: List[Dict[str, Any]]) -> None:
+        label_groups = self.get_option('label_groups')
+        group = self.get_option('group')
+        strict = self.get_option('strict')
+        if group:
+            self.inventory.add_group(group)
+
+        for host in hosts:
+            name = host['hostname']
+            self.inventory.add_host(name, group=group or None)
+            hostvars = dict(ansible_host=host.get('addr') or name,
+                            ceph_addr=host.get('addr'),
+                            ceph_labels=host.get('labels', []),
+                            ceph_status=host.get('status', ''))
+            for var, value in hostvars.items():
+                self.inventory.set_variable(name, var, value)
+
+            for label in hostvars['ceph_labels']:
+                if label in label_groups:
+                    self.inventory.add_group(label_groups[label])
+                    self.inventory.add_child(label_groups[label], name)
+
+            self._set_composite_vars(self.get_option('compose'), hostvars, name, strict=strict)
+            self._add_host_to_composed_groups(self.get_option('groups'), hostvars, name, strict=strict)
+            self._add_host_to_keyed_groups(self.get_option('keyed_groups'), hostvars, name, strict=strict)
+
+    def parse(self, inventory: Any, loader: Any, path: str, cache: bool = True) -> None:
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        use_cache = self.get_option('cache') and cache
+        update_cache = self.get_option('cache') and not cache
+
+        hosts = None
+        if use_cache:
+            try:
+                hosts = self._cache[cache_key]
+            except KeyError:
+                update_cache = True
+
+        if hosts is None:
+            hosts = self.get_hosts()
+        if update_cache:
+            self._cache[cache_key] = hosts
+
+        self.populate(hosts)
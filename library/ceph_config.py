@@ -3,17 +3,23 @@
 # Author: Guillaume Abrioux <gabrioux@redhat.com>
 
 from __future__ import absolute_import, division, print_function
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 __metaclass__ = type
 
 from ansible.module_utils.basic import AnsibleModule  # type: ignore
 try:
-    from ansible.module_utils.ceph_common import exit_module, build_base_cmd_shell, fatal  # type: ignore
+    from ansible.module_utils.ceph_common import (run_command, exit_module, build_base_cmd_shell, fatal, run_batch,  # type: ignore
+                                                  build_config_index, lookup_config, ConfigIndex,
+                                                  normalize_config_value, fail_module)
 except ImportError:
-    from module_utils.ceph_common import exit_module, build_base_cmd_shell, fatal  # type: ignore
-
+    from module_utils.ceph_common import (run_command, exit_module, build_base_cmd_shell, fatal, run_batch,  # type: ignore
+                                          build_config_index, lookup_config, ConfigIndex,
+                                          normalize_config_value, fail_module)
 import datetime
 import json
+import os
+import re
+import tempfile
 
 ANSIBLE_METADATA = {
     'metadata_version': '1.1',
@@ -37,6 +43,52 @@ options:
         description:
             - The Ceph container image to use.
         required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
     action:
         description:
             - whether to get or set the parameter specified in 'option'
@@ -45,15 +97,46 @@ options:
     who:
         description:
             - which daemon the configuration should be set to
-        required: true
+        required: true unless 'options' is set
     option:
         description:
             - name of the parameter to be set
-        required: true
+        required: true unless 'options' is set
     value:
         description:
             - value of the parameter
-        required: true if action is 'set'
+        required: true if action is 'set' and 'options' isn't set
+    options:
+        description:
+            - a list of options (who/option/value) to get or set at once.
+              The current configuration is read only once and all the
+              changes are applied within a single shell.
+            - mutually exclusive with 'who', 'option' and 'value'.
+        required: false
+    schema_cache_dir:
+        description:
+            - the directory where the type of the options (as reported by
+              `ceph config help`) is cached, per Ceph version. Values are
+              compared according to their type, eg. '5G' and '5368709120'
+              or 'true' and '1' are considered equal. The type of an
+              option is only looked up when its current value differs.
+              The cache is keyed by `ceph versions` when `ceph version`
+              can't be parsed, a warning is emitted when it can't be
+              written.
+        required: false
+        default: /var/cache/cephadm-ansible
+    options_var:
+        description:
+            - name of a host variable holding a list of options
+              (who/option/value). The lists of all the hosts of the play
+              are merged and applied at once, see 'options'.
+            - implemented by the ceph_config action plugin, requires
+              'run_once: true'. As with any run_once task, there is a
+              single result (shared by all the hosts of the play when
+              registered): 'results' holds the results of all the options
+              and 'per_host' maps each host of the play to the 'changed'
+              status and the 'results' of its own options.
+        required: false
 
 author:
     - Guillaume Abrioux <gabrioux@redhat.com>
@@ -80,6 +163,38 @@ EXAMPLES = '''
     who: global
     option: osd_pool_default_size
     value: 1
+
+- name: set several options at once
+  ceph_config:
+    action: set
+    options:
+      - who: osd
+        option: osd_max_backfills
+        value: 2
+      - who: osd/host:ceph-osd-02
+        option: osd_memory_target
+        value: 5368709120
+
+# with 'ceph_config_options' defined for each host, eg:
+# ceph_config_options:
+#   - who: "osd/host:{{ inventory_hostname }}"
+#     option: osd_memory_target
+#     value: "{{ my_osd_memory_target }}"
+- name: set host specific options for all hosts at once
+  ceph_config:
+    action: set
+    options_var: ceph_config_options
+  run_once: true
+  delegate_to: "{{ groups['admin'][0] }}"
+  register: host_config
+
+- name: restart the osds of the hosts whose options changed
+  ceph_orch_daemon:
+    state: restarted
+    daemon_type: osd
+    daemon_id: "{{ item }}"
+  loop: "{{ my_osd_ids }}"
+  when: host_config.per_host[inventory_hostname].changed
 '''
 
 RETURN = '''#  '''
@@ -92,40 +207,197 @@ def set_option(module: "AnsibleModule",
     cmd = build_base_cmd_shell(module)
     cmd.extend(['ceph', 'config', 'set', who, option, value])
 
-    rc, out, err = module.run_command(cmd)
+    rc, out, err = run_command(module, cmd)
 
     return rc, cmd, out.strip(), err
 
 
-def get_config_dump(module: "AnsibleModule") -> Tuple[int, List[str], str, str]:
-    cmd = build_base_cmd_shell(module)
-    cmd.extend(['ceph', 'config', 'dump', '--format', 'json'])
-    rc, out, err = module.run_command(cmd)
-    if rc:
-        fatal(message=f"Can't get current configuration via `ceph config dump`.Error:\n{err}", module=module)
-    out = out.strip()
-    return rc, cmd, out, err
-
-
-def get_current_value(who: str, option: str, config_dump: List[Dict[str, Any]]) -> Union[str, None]:
-    for config in config_dump:
-        if config['section'] == who and config['name'] == option:
-            return config['value']
+def get_config_dump(module: "AnsibleModule") -> Tuple[int, List[str], str, Optional[str], str]:
+    rc, cmd, results, err = run_batch(module, [
+        ['ceph', 'config', 'dump', '--format', 'json'],
+        ['ceph', 'version', '--format', 'json']
+    ])
+    (dump_rc, out), (version_rc, version_out) = results
+    if rc or dump_rc:
+        fatal(message=f"Can't get current configuration via `ceph config dump`.Error:\n{err or out}", module=module)
+
+    version = None
+    if not version_rc:
+        try:
+            version = json.loads(version_out)['version']
+        except (ValueError, KeyError):
+            pass
+
+    return rc, cmd, out, version, err
+
+
+def get_schema_version(module: "AnsibleModule", version: Optional[str]) -> Optional[str]:
+    '''
+    The Ceph version the schema cache is keyed by. When `ceph version`
+    can't be parsed, fall back to the versions of the daemons reported
+    by `ceph versions`.
+    '''
+    if version:
+        return version
+    rc, cmd, results, err = run_batch(module, [['ceph', 'versions', '--format', 'json']])
+    (_rc, out), = results
+    if not rc and not _rc:
+        try:
+            versions = sorted(json.loads(out)['overall'])
+        except (ValueError, KeyError, TypeError):
+            versions = []
+        if versions:
+            return ' '.join(versions)
+    module.warn("Can't get the Ceph version, the type of the options won't be cached: {}".format(err or out))
     return None
 
 
+def get_options_schema(module: "AnsibleModule",
+                       version: Optional[str],
+                       options: List[str]) -> Dict[str, Dict[str, Any]]:
+    '''
+    Return the type of each option, from the cache of the current
+    Ceph version or from `ceph config help` for the options not cached yet.
+    '''
+    schema: Dict[str, Dict[str, Any]] = {}
+    if not options:
+        return schema
+
+    path = None
+    version = get_schema_version(module, version)
+    if version:
+        path = os.path.join(module.params.get('schema_cache_dir'),
+                            'config-schema-{}.json'.format(re.sub(r'[^\w.-]+', '_', version)))
+        try:
+            with open(path) as f:
+                schema = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    missing = sorted(set(options) - set(schema))
+    if not missing:
+        return schema
+
+    rc, cmd, results, err = run_batch(module, [['ceph', 'config', 'help', option, '--format', 'json'] for option in missing])
+    updated = False
+    for option, (_rc, out) in zip(missing, results):
+        if rc or _rc:
+            continue
+        try:
+            option_help = json.loads(out)
+        except ValueError:
+            continue
+        option_help = option_help.get(option, option_help)
+        schema[option] = dict(type=option_help.get('type'))
+        updated = True
+
+    if path and updated:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(schema, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            module.warn("Can't cache the type of the options in {}: {}".format(os.path.dirname(path), e))
+
+    return schema
+
+
+def get_current_value(who: str, option: str, config_index: ConfigIndex) -> Union[str, None]:
+    return lookup_config(config_index, who, option)
+
+
+def get_diff(value: str, current_value: Union[str, None]) -> Dict[str, str]:
+    '''
+    Return the current and the desired values as strings, as expected by
+    the --diff output of ansible.
+    '''
+    return dict(before='' if current_value is None else current_value, after=value)
+
+
+def get_normalized(value: str, current_value: Union[str, None], option_type: Optional[str]) -> Dict[str, Any]:
+    '''
+    Return the current and the desired values, normalized according to
+    the type of the option.
+    '''
+    return dict(before=None if current_value is None else normalize_config_value(current_value, option_type),
+                after=normalize_config_value(value, option_type))
+
+
+def needs_update(normalized: Dict[str, Any]) -> bool:
+    return bool(normalized['before'] != normalized['after'])
+
+
+def set_options(module: "AnsibleModule",
+                options: List[Dict[str, str]],
+                config_index: ConfigIndex,
+                schema: Dict[str, Dict[str, Any]]) -> Tuple[int, List[str], str, str, List[Dict[str, Any]]]:
+    '''
+    Set all the options that differ from the current configuration
+    within a single shell.
+    '''
+    rc, cmd, out, err = 0, [], '', ''
+    results: List[Dict[str, Any]] = []
+    to_set = []
+
+    for item in options:
+        current_value = get_current_value(item['who'], item['option'], config_index)
+        normalized = get_normalized(item['value'], current_value, schema.get(item['option'], {}).get('type'))
+        result = dict(who=item['who'], option=item['option'], value=item['value'],
+                      before=current_value, diff=get_diff(item['value'], current_value),
+                      normalized=normalized, changed=False, rc=0)
+        if needs_update(normalized):
+            result['changed'] = True
+            to_set.append(result)
+        results.append(result)
+
+    if to_set:
+        rc, cmd, batch_results, err = run_batch(module,
+                                                [['ceph', 'config', 'set', r['who'], r['option'], r['value']] for r in to_set])
+        for result, (_rc, _out) in zip(to_set, batch_results):
+            result['rc'] = _rc
+            result['stdout'] = _out
+            if _rc:
+                rc = _rc
+
+    out = '{} option(s) updated.'.format(len(to_set))
+    return rc, cmd, out, err, results
+
+
+def get_options(options: List[Dict[str, str]],
+                config_index: ConfigIndex) -> List[Dict[str, Any]]:
+    return [dict(who=item['who'], option=item['option'],
+                 value=get_current_value(item['who'], item['option'], config_index))
+            for item in options]
+
+
 def main() -> None:
     module = AnsibleModule(
         argument_spec=dict(
-            who=dict(type='str', required=True),
+            who=dict(type='str', required=False),
             action=dict(type='str', required=False, choices=['get', 'set'], default='set'),
-            option=dict(type='str', required=True),
+            option=dict(type='str', required=False),
             value=dict(type='str', required=False),
+            options=dict(type='list', elements='dict', required=False,
+                         options=dict(who=dict(type='str', required=True),
+                                      option=dict(type='str', required=True),
+                                      value=dict(type='str', required=False))),
             fsid=dict(type='str', required=False),
-            image=dict(type='str', required=False)
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            schema_cache_dir=dict(type='str', required=False, default='/var/cache/cephadm-ansible')
         ),
         supports_check_mode=True,
-        required_if=[['action', 'set', ['value']]]
+        mutually_exclusive=[('options', 'who'), ('options', 'option'), ('options', 'value')],
+        required_one_of=[('option', 'options')],
+        required_together=[('who', 'option')],
+        required_if=[['action', 'set', ['value', 'options'], True]]
     )
 
     # Gather module parameters in variables
@@ -133,6 +405,7 @@ def main() -> None:
     option = module.params.get('option')
     value = module.params.get('value')
     action = module.params.get('action')
+    options = module.params.get('options')
 
     if module.check_mode:
         module.exit_json(
@@ -149,12 +422,39 @@ def main() -> None:
     startd = datetime.datetime.now()
     changed = False
 
-    rc, cmd, out, err = get_config_dump(module)
-    config_dump = json.loads(out)
-    current_value = get_current_value(who, option, config_dump)
+    rc, cmd, out, version, err = get_config_dump(module)
+    config_index = build_config_index(json.loads(out))
+
+    if options is not None:
+        if action == 'set':
+            if any(item['value'] is None for item in options):
+                fatal("'value' is required for each element of 'options' when action is 'set'.", module)
+            # the options already set to the very same value don't need their type
+            schema = get_options_schema(module, version,
+                                        [item['option'] for item in options
+                                         if get_current_value(item['who'], item['option'], config_index) != item['value']])
+            rc, cmd, out, err, results = set_options(module, options, config_index, schema)
+            changed = any(result['changed'] for result in results)
+            if rc:
+                failed = [f"{r['who']} {r['option']}: {r['stdout']}" for r in results if r['rc']]
+                fail_module(module, msg='Failed to set option(s):\n{}'.format('\n'.join(failed)),
+                            cmd=cmd, rc=rc, stderr=err, results=results)
+        else:
+            results = get_options(options, config_index)
+            out = ''
+        exit_module(module=module, out=out, rc=rc,
+                    cmd=cmd, err=err, startd=startd,
+                    changed=changed, results=results)
+
+    current_value = get_current_value(who, option, config_index)
+    diff = dict(before='', after='')
+    normalized: Dict[str, Any] = dict(before=None, after=None)
 
     if action == 'set':
-        if value.lower() == current_value:
+        schema = get_options_schema(module, version, [option] if current_value != value else [])
+        diff = get_diff(value, current_value)
+        normalized = get_normalized(value, current_value, schema.get(option, {}).get('type'))
+        if not needs_update(normalized):
             out = 'who={} option={} value={} already set. Skipping.'.format(who, option, value)
         else:
             rc, cmd, out, err = set_option(module, who, option, value)
@@ -168,7 +468,7 @@ def main() -> None:
 
     exit_module(module=module, out=out, rc=rc,
                 cmd=cmd, err=err, startd=startd,
-                changed=changed)
+                changed=changed, diff=diff, normalized=normalized)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,304 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal, run_batch  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal, run_batch
+import datetime
+import json
+import os
+import tempfile
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_key
+short_description: manage cephx entities and their keyrings
+version_added: "2.9"
+description:
+    - Create cephx entities with their caps, update their caps or remove
+      them, and optionally write their keyring to a file.
+    - The current entities are read once (`ceph auth ls`) and only the
+      entities which differ are created (`ceph auth get-or-create`),
+      updated (`ceph auth caps`) or removed (`ceph auth rm`), within a
+      single shell.
+    - The keys are never returned.
+options:
+    fsid:
+        description:
+            - the fsid of the Ceph cluster to interact with.
+        required: false
+    image:
+        description:
+            - The Ceph container image to use.
+        required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    entities:
+        description:
+            - the entities to manage, each one with the following keys.
+            - 'name': the entity name, eg. client.rbd-mirror.
+            - 'caps': a mapping of daemon type to caps, eg.
+              {mon: 'profile rbd', osd: 'profile rbd pool=rbd'}. When
+              set, the caps of the entity are replaced with these ones.
+            - 'state': 'present' (default) or 'absent'.
+            - 'dest': the path of a keyring file to write the key and
+              the caps to, on the host running the module.
+            - 'mode', 'owner', 'group': the permissions of 'dest'. The
+              default mode is '0600'.
+        required: true
+'''
+
+EXAMPLES = '''
+- name: create the client keyrings
+  ceph_key:
+    entities:
+      - name: client.glance
+        caps:
+          mon: profile rbd
+          osd: profile rbd pool=images
+        dest: /etc/ceph/ceph.client.glance.keyring
+      - name: client.cinder
+        caps:
+          mon: profile rbd
+          osd: profile rbd pool=volumes, profile rbd pool=images
+      - name: client.old
+        state: absent
+'''
+
+RETURN = '''
+entities:
+    description:
+        - for each entity, its 'name', the 'action' taken (created,
+          updated, removed or none) and whether its keyring file has been
+          written ('dest_changed').
+    returned: always
+    type: list
+'''
+
+
+def get_auth(module: "AnsibleModule") -> Dict[str, Dict[str, Any]]:
+    rc, cmd, results, err = run_batch(module, [['ceph', 'auth', 'ls', '--format', 'json']])
+    if rc or results[0][0]:
+        fatal("Can't list the cephx entities: {}".format(results[0][1] or err), module)
+    return {entry['entity']: entry for entry in json.loads(results[0][1]).get('auth_dump', [])}
+
+
+def caps_args(caps: Dict[str, str]) -> List[str]:
+    args = []
+    for daemon, cap in sorted(caps.items()):
+        args.extend([daemon, cap])
+    return args
+
+
+def plan_entities(entities: List[Dict[str, Any]], current: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    '''
+    Compute the action to take for each entity.
+    '''
+    plan = []
+    for entity in entities:
+        name = entity['name']
+        caps = {daemon: str(cap) for daemon, cap in (entity.get('caps') or {}).items()}
+        if entity.get('state') == 'absent':
+            action = 'removed' if name in current else 'none'
+        elif name not in current:
+            action = 'created'
+        elif entity.get('caps') is not None and caps != current[name].get('caps', {}):
+            action = 'updated'
+        else:
+            action = 'none'
+        plan.append(dict(entity, caps=caps if entity.get('caps') is not None else None, action=action))
+    return plan
+
+
+def build_cmds(plan: List[Dict[str, Any]]) -> List[List[str]]:
+    cmds = []
+    for entity in plan:
+        if entity['action'] == 'created':
+            cmds.append(['ceph', 'auth', 'get-or-create', entity['name']] + caps_args(entity['caps'] or {}) + ['--format', 'json'])
+        elif entity['action'] == 'updated':
+            cmds.append(['ceph', 'auth', 'caps', entity['name']] + caps_args(entity['caps']))
+        elif entity['action'] == 'removed':
+            cmds.append(['ceph', 'auth', 'rm', entity['name']])
+    return cmds
+
+
+def format_keyring(name: str, key: str, caps: Dict[str, str]) -> str:
+    lines = ['[{}]'.format(name), '\tkey = {}'.format(key)]
+    for daemon, cap in sorted(caps.items()):
+        lines.append('\tcaps {} = "{}"'.format(daemon, cap))
+    return '\n'.join(lines) + '\n'
+
+
+def write_keyring(module: "AnsibleModule", entity: Dict[str, Any], content: str) -> bool:
+    dest = entity['dest']
+    changed = False
+    try:
+        with open(dest) as f:
+            current: Optional[str] = f.read()
+    except IOError:
+        current = None
+
+    if current != content:
+        changed = True
+        if not module.check_mode:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest) or '.', prefix='.ceph_key-')
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, dest)
+
+    if os.path.exists(dest):
+        changed = module.set_mode_if_different(dest, entity.get('mode') or '0600', changed)
+        changed = module.set_owner_if_different(dest, entity.get('owner'), changed)
+        changed = module.set_group_if_different(dest, entity.get('group'), changed)
+    return changed
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            entities=dict(type='list', elements='dict', required=True,
+                          options=dict(name=dict(type='str', required=True),
+                                       caps=dict(type='dict', required=False),
+                                       state=dict(type='str', required=False, choices=['present', 'absent'], default='present'),
+                                       dest=dict(type='path', required=False),
+                                       mode=dict(type='raw', required=False),
+                                       owner=dict(type='str', required=False),
+                                       group=dict(type='str', required=False)))
+        ),
+        supports_check_mode=True
+    )
+
+    startd = datetime.datetime.now()
+
+    current = get_auth(module)
+    plan = plan_entities(module.params.get('entities'), current)
+    cmds = build_cmds(plan)
+
+    rc, cmd, err = 0, ['ceph', 'auth', 'ls'], ''
+    keys = {name: entry.get('key') for name, entry in current.items()}
+    if cmds and not module.check_mode:
+        rc, cmd, results, err = run_batch(module, cmds)
+        failed = []
+        for entity, (_rc, out) in zip([e for e in plan if e['action'] != 'none'], results):
+            if rc or _rc:
+                failed.append('{}: {}'.format(entity['name'], out.strip() or err))
+            elif entity['action'] == 'created':
+                keys[entity['name']] = json.loads(out)[0]['key']
+        if failed:
+            fatal("Can't update the cephx entities: {}".format('; '.join(failed)), module)
+
+    changed = bool(cmds)
+    report = []
+    for entity in plan:
+        dest_changed = False
+        if entity.get('dest') and entity.get('state') != 'absent':
+            caps = entity['caps'] if entity['caps'] is not None else current.get(entity['name'], {}).get('caps', {})
+            key = keys.get(entity['name'])
+            if key:
+                dest_changed = write_keyring(module, entity, format_keyring(entity['name'], key, caps))
+            else:
+                # created in check mode
+                dest_changed = True
+        changed = changed or dest_changed
+        report.append(dict(name=entity['name'], action=entity['action'], dest_changed=dest_changed))
+
+    exit_module(
+        module=module,
+        out='',
+        rc=rc,
+        cmd=cmd,
+        err=err,
+        startd=startd,
+        changed=changed,
+        entities=report
+    )
+
+
+if __name__ == '__main__':
+    main()
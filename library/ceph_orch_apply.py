@@ -20,9 +20,9 @@ __metaclass__ = type
 
 from ansible.module_utils.basic import AnsibleModule  # type: ignore
 try:
-    from ansible.module_utils.ceph_common import exit_module, build_base_cmd_orch  # type: ignore
+    from ansible.module_utils.ceph_common import run_command, exit_module, build_base_cmd_orch, fail_module  # type: ignore
 except ImportError:
-    from module_utils.ceph_common import exit_module, build_base_cmd_orch
+    from module_utils.ceph_common import run_command, exit_module, build_base_cmd_orch, fail_module
 import datetime
 
 
@@ -48,6 +48,52 @@ options:
         description:
             - The Ceph container image to use.
         required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
     spec:
         description:
             - The service spec to apply
@@ -74,7 +120,7 @@ def apply_spec(module: "AnsibleModule",
                data: str) -> Tuple[int, List[str], str, str]:
     cmd = build_base_cmd_orch(module)
     cmd.extend(['apply', '-i', '-'])
-    rc, out, err = module.run_command(cmd, data=data)
+    rc, out, err = run_command(module, cmd, data=data)
 
     if rc:
         raise RuntimeError(err)
@@ -82,19 +128,7 @@ def apply_spec(module: "AnsibleModule",
     return rc, cmd, out, err
 
 
-def main() -> None:
-    module = AnsibleModule(
-        argument_spec=dict(
-            fsid=dict(type='str', required=False),
-            spec=dict(type='str', required=True),
-            docker=dict(type=bool,
-                        required=False,
-                        default=False),
-            image=dict(type='str', required=False)
-        ),
-        supports_check_mode=True
-    )
-
+def run_module(module: "AnsibleModule") -> None:
     spec = module.params.get('spec')
 
     startd = datetime.datetime.now()
@@ -125,5 +159,30 @@ def main() -> None:
     )
 
 
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            spec=dict(type='str', required=True),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False)
+        ),
+        supports_check_mode=True
+    )
+
+    try:
+        run_module(module)
+    except RuntimeError as e:
+        fail_module(module, msg=str(e), rc=1)
+
+
 if __name__ == '__main__':
     main()
@@ -8,9 +8,9 @@ __metaclass__ = type
 
 from ansible.module_utils.basic import AnsibleModule  # type: ignore
 try:
-    from ansible.module_utils.ceph_common import retry, exit_module, build_base_cmd_orch, fatal  # type: ignore
+    from ansible.module_utils.ceph_common import run_command, retry, exit_module, build_base_cmd_orch, fatal, fail_module  # type: ignore
 except ImportError:
-    from module_utils.ceph_common import retry, exit_module, build_base_cmd_orch, fatal  # type: ignore
+    from module_utils.ceph_common import run_command, retry, exit_module, build_base_cmd_orch, fatal, fail_module  # type: ignore
 
 import datetime
 import json
@@ -37,6 +37,52 @@ options:
         description:
             - The Ceph container image to use.
         required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
     state:
         description:
             - The desired state of the service specified in 'name'.
@@ -82,7 +128,7 @@ def get_current_state(module: "AnsibleModule",
                 daemon_type, '--daemon_id',
                 daemon_id, '--format', 'json',
                 '--refresh'])
-    rc, out, err = module.run_command(cmd)
+    rc, out, err = run_command(module, cmd)
 
     return rc, cmd, out, err
 
@@ -92,7 +138,7 @@ def update_daemon_status(module: "AnsibleModule",
                          daemon_name: str) -> Tuple[int, List[str], str, str]:
     cmd = build_base_cmd_orch(module)
     cmd.extend(['daemon', action, daemon_name])
-    rc, out, err = module.run_command(cmd)
+    rc, out, err = run_command(module, cmd)
 
     return rc, cmd, out, err
 
@@ -108,23 +154,7 @@ def validate_updated_status(module: "AnsibleModule",
         raise RuntimeError("Status for {}.{} isn't reported as expected.".format(daemon_type, daemon_id))
 
 
-def main() -> None:
-    module = AnsibleModule(
-        argument_spec=dict(
-            state=dict(type='str',
-                       required=True,
-                       choices=['started', 'stopped', 'restarted']),
-            daemon_id=dict(type='str', required=True),
-            daemon_type=dict(type='str', required=True),
-            docker=dict(type=bool,
-                        required=False,
-                        default=False),
-            fsid=dict(type='str', required=False),
-            image=dict(type='str', required=False)
-        ),
-        supports_check_mode=True,
-    )
-
+def run_module(module: "AnsibleModule") -> None:
     # Gather module parameters in variables
     state = module.params.get('state')
     daemon_id = module.params.get('daemon_id')
@@ -170,12 +200,41 @@ def main() -> None:
         rc, cmd, out, err = update_daemon_status(module, action, daemon_name)
 
     if rc:
-        fatal("Can't {} {}: {}".format(action, daemon_name, err))
+        fatal("Can't {} {}: {}".format(action, daemon_name, err), module)
 
     exit_module(module=module, out=out, rc=rc,
                 cmd=cmd, err=err, startd=startd,
                 changed=changed)
 
 
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            state=dict(type='str',
+                       required=True,
+                       choices=['started', 'stopped', 'restarted']),
+            daemon_id=dict(type='str', required=True),
+            daemon_type=dict(type='str', required=True),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False)
+        ),
+        supports_check_mode=True,
+    )
+
+    try:
+        run_module(module)
+    except RuntimeError as e:
+        fail_module(module, msg=str(e), rc=1)
+
+
 if __name__ == '__main__':
     main()
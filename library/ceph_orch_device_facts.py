@@ -0,0 +1,379 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional, Tuple
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal, run_batch, normalize_config_value  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal, run_batch, normalize_config_value
+import datetime
+import json
+import time
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_orch_device_facts
+short_description: list the devices known by the orchestrator
+version_added: "2.9"
+description:
+    - Return a compact inventory of the devices of the cluster hosts
+      (host, path, size, rotational, available, rejected reasons, model).
+    - The inventory cached by the orchestrator is used, only the hosts
+      missing from the cache or whose inventory is older than 'max_age'
+      are refreshed (`ceph orch device ls <hosts> --refresh`).
+options:
+    fsid:
+        description:
+            - the fsid of the Ceph cluster to interact with.
+        required: false
+    image:
+        description:
+            - The Ceph container image to use.
+        required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    hosts:
+        description:
+            - only list the devices of these hosts. Default is all hosts.
+        required: false
+    refresh:
+        description:
+            - If 'auto', only the hosts with a missing or stale inventory
+              are refreshed.
+            - If 'always', all the (selected) hosts are refreshed.
+            - If 'never', the cached inventory is returned as is.
+        required: false
+        default: auto
+    max_age:
+        description:
+            - the age (in seconds) after which the cached inventory of a
+              host is considered stale.
+        required: false
+        default: 1800
+    refresh_timeout:
+        description:
+            - how long (in seconds) to wait for the refreshed inventories.
+              Hosts which aren't refreshed in time are reported in
+              'stale_hosts'.
+        required: false
+        default: 300
+    poll_interval:
+        description:
+            - how long (in seconds) to wait between two checks of the
+              refreshed inventories.
+        required: false
+        default: 5
+    available:
+        description:
+            - only return the devices available (true) or unavailable
+              (false) for new OSDs.
+        required: false
+    rotational:
+        description:
+            - only return the rotational (true) or non rotational (false)
+              devices.
+        required: false
+    min_size:
+        description:
+            - only return the devices at least this big (eg. 100G).
+        required: false
+    max_size:
+        description:
+            - only return the devices at most this big (eg. 2T).
+        required: false
+    model:
+        description:
+            - only return the devices of this model.
+        required: false
+'''
+
+EXAMPLES = '''
+- name: list the available devices
+  ceph_orch_device_facts:
+    available: true
+  register: inventory
+
+- name: list the ssd of ceph-node0 with a fresh inventory
+  ceph_orch_device_facts:
+    hosts:
+      - ceph-node0
+    rotational: false
+    refresh: always
+'''
+
+RETURN = '''
+devices:
+    description: the devices matching the filters.
+    returned: always
+    type: list
+refreshed_hosts:
+    description: the hosts whose inventory has been refreshed.
+    returned: always
+    type: list
+stale_hosts:
+    description: the hosts whose inventory is still missing or stale.
+    returned: always
+    type: list
+'''
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return None
+
+
+def host_inventory_date(host: Dict[str, Any]) -> Optional[datetime.datetime]:
+    '''
+    The date of the oldest device inventory of a host.
+    '''
+    dates = [parse_timestamp(device.get('created')) for device in host.get('devices', [])]
+    return min([d for d in dates if d], default=None)
+
+
+def get_device_ls(module: "AnsibleModule",
+                  hosts: List[str],
+                  refresh: bool = False,
+                  with_hosts: bool = False) -> Tuple[Dict[str, Dict[str, Any]], Optional[List[str]]]:
+    cmds = []
+    if with_hosts:
+        cmds.append(['ceph', 'orch', 'host', 'ls', '--format', 'json'])
+    cmd = ['ceph', 'orch', 'device', 'ls'] + hosts + ['--format', 'json']
+    if refresh:
+        cmd.append('--refresh')
+    cmds.append(cmd)
+
+    rc, cmd, results, err = run_batch(module, cmds)
+    for _rc, out in results:
+        if rc or _rc:
+            fatal("Can't list devices: {}".format(out or err), module)
+
+    host_names = [host['hostname'] for host in json.loads(results[0][1])] if with_hosts else None
+    inventory = {host['name']: host for host in json.loads(results[-1][1] or '[]')}
+    return inventory, host_names
+
+
+def find_stale_hosts(inventory: Dict[str, Dict[str, Any]],
+                     hosts: List[str],
+                     max_age: int,
+                     now: datetime.datetime) -> List[str]:
+    stale = []
+    for host in hosts:
+        date = host_inventory_date(inventory[host]) if host in inventory else None
+        if date is None or (now - date).total_seconds() > max_age:
+            stale.append(host)
+    return stale
+
+
+def refresh_hosts(module: "AnsibleModule",
+                  inventory: Dict[str, Dict[str, Any]],
+                  hosts: List[str]) -> List[str]:
+    '''
+    Ask the orchestrator to refresh the inventory of `hosts` and wait
+    for it. Return the hosts that got refreshed.
+    '''
+    previous = {host: host_inventory_date(inventory[host]) if host in inventory else None for host in hosts}
+    timeout = module.params.get('refresh_timeout')
+    start = time.monotonic()
+
+    updated, _ = get_device_ls(module, hosts, refresh=True)
+    refreshed: List[str] = []
+    while True:
+        for host in hosts:
+            if host in refreshed or host not in updated:
+                continue
+            date, before = host_inventory_date(updated[host]), previous[host]
+            if date is not None and (before is None or date > before):
+                inventory[host] = updated[host]
+                refreshed.append(host)
+
+        if len(refreshed) == len(hosts) or time.monotonic() - start >= timeout:
+            return sorted(refreshed)
+
+        time.sleep(module.params.get('poll_interval'))
+        updated, _ = get_device_ls(module, [host for host in hosts if host not in refreshed])
+
+
+def to_bool(value: Any) -> bool:
+    return str(value).lower() in ['1', 'true']
+
+
+def compact_devices(inventory: Dict[str, Dict[str, Any]], hosts: List[str]) -> List[Dict[str, Any]]:
+    devices = []
+    for host in hosts:
+        for device in inventory.get(host, {}).get('devices', []):
+            sys_api = device.get('sys_api', {})
+            devices.append(dict(host=host,
+                                path=device.get('path'),
+                                size=int(sys_api.get('size') or 0),
+                                rotational=to_bool(sys_api.get('rotational')),
+                                available=bool(device.get('available')),
+                                rejected_reasons=device.get('rejected_reasons', []),
+                                model=sys_api.get('model', '').strip(),
+                                device_id=device.get('device_id'),
+                                type=device.get('human_readable_type')))
+    return devices
+
+
+def filter_devices(devices: List[Dict[str, Any]],
+                   available: Optional[bool] = None,
+                   rotational: Optional[bool] = None,
+                   min_size: Optional[int] = None,
+                   max_size: Optional[int] = None,
+                   model: Optional[str] = None) -> List[Dict[str, Any]]:
+    return [device for device in devices
+            if (available is None or device['available'] == available)
+            and (rotational is None or device['rotational'] == rotational)
+            and (min_size is None or device['size'] >= min_size)
+            and (max_size is None or device['size'] <= max_size)
+            and (model is None or device['model'] == model)]
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            hosts=dict(type='list', elements='str', required=False, default=[]),
+            refresh=dict(type='str', required=False, choices=['auto', 'always', 'never'], default='auto'),
+            max_age=dict(type='int', required=False, default=1800),
+            refresh_timeout=dict(type='int', required=False, default=300),
+            poll_interval=dict(type='int', required=False, default=5),
+            available=dict(type='bool', required=False),
+            rotational=dict(type='bool', required=False),
+            min_size=dict(type='str', required=False),
+            max_size=dict(type='str', required=False),
+            model=dict(type='str', required=False)
+        ),
+        supports_check_mode=True
+    )
+
+    refresh = module.params.get('refresh')
+    sizes: Dict[str, Any] = {}
+    for arg in ['min_size', 'max_size']:
+        sizes[arg] = normalize_config_value(module.params.get(arg), 'size') if module.params.get(arg) else None
+        if sizes[arg] is not None and not isinstance(sizes[arg], int):
+            fatal('Invalid size for {}: {}'.format(arg, module.params.get(arg)), module)
+
+    startd = datetime.datetime.now()
+
+    inventory, all_hosts = get_device_ls(module, module.params.get('hosts'), with_hosts=True)
+    hosts = module.params.get('hosts') or all_hosts or []
+
+    if refresh == 'always':
+        stale = list(hosts)
+    else:
+        stale = find_stale_hosts(inventory, hosts, module.params.get('max_age'), datetime.datetime.utcnow())
+
+    refreshed: List[str] = []
+    if stale and refresh != 'never':
+        refreshed = refresh_hosts(module, inventory, stale)
+        stale = [host for host in stale if host not in refreshed]
+
+    devices = filter_devices(compact_devices(inventory, hosts),
+                             module.params.get('available'),
+                             module.params.get('rotational'),
+                             sizes['min_size'],
+                             sizes['max_size'],
+                             module.params.get('model'))
+
+    exit_module(
+        module=module,
+        out='{} device(s) found.'.format(len(devices)),
+        rc=0,
+        cmd=['ceph', 'orch', 'device', 'ls'],
+        err='',
+        startd=startd,
+        changed=False,
+        devices=devices,
+        refreshed_hosts=refreshed,
+        stale_hosts=stale
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -15,16 +15,17 @@
 # limitations under the License.
 
 from __future__ import absolute_import, division, print_function
-from typing import Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple
 __metaclass__ = type
 
 from ansible.module_utils.basic import AnsibleModule  # type: ignore
 try:
-    from ansible.module_utils.ceph_common import exit_module, build_base_cmd_orch  # type: ignore
+    from ansible.module_utils.ceph_common import run_command, exit_module, build_base_cmd_orch, run_batch, fail_module, fatal  # type: ignore
 except ImportError:
-    from module_utils.ceph_common import exit_module, build_base_cmd_orch
+    from module_utils.ceph_common import run_command, exit_module, build_base_cmd_orch, run_batch, fail_module, fatal
 import datetime
 import json
+import time
 
 
 ANSIBLE_METADATA = {
@@ -48,11 +49,63 @@ options:
     name:
         description:
             - name of the host
-        required: true
+            - mutually exclusive with 'names'.
+        required: true unless 'names' is set
+    names:
+        description:
+            - list of hosts to drain. All hosts are drained in parallel.
+            - only supported when state is 'drain'.
+        required: false
     image:
         description:
             - The Ceph container image to use.
         required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
     address:
         description:
             - address of the host
@@ -75,9 +128,31 @@ options:
             - if set to 'absent', it will remove the host specified in
               'name'.
             - if set to 'drain', it will schedule to remove all daemons
-              from the host specified in 'name'.
+              from the host specified in 'name'. The command, rc and
+              output of each host are reported in 'drain_results'.
         required: false
         default: present
+    wait:
+        description:
+            - when state is 'drain', wait until all daemons have been
+              removed from the host(s). The progress (PGs and bytes moved
+              per minute, ETA) is reported in 'drain_status'. The PGs
+              moved are computed from the PG count of each OSD of the
+              host (`ceph osd df`), an OSD counts as empty once its
+              removal is complete.
+        required: false
+        default: false
+    wait_timeout:
+        description:
+            - how long (in seconds) to wait for the drain to complete.
+        required: false
+        default: 3600
+    poll_interval:
+        description:
+            - how long (in seconds) to wait between two checks of the
+              drain progress.
+        required: false
+        default: 10
 author:
     - Guillaume Abrioux <gabrioux@redhat.com>
 '''
@@ -101,13 +176,23 @@ EXAMPLES = '''
   ceph_orch_host:
     name: my-node-01
     state: absent
+
+- name: drain all hosts of a rack and wait for completion
+  ceph_orch_host:
+    names:
+      - my-node-03
+      - my-node-04
+      - my-node-05
+    state: drain
+    wait: true
+    wait_timeout: 7200
 '''
 
 
 def get_current_state(module: "AnsibleModule") -> Tuple[int, List[str], str, str]:
     cmd = build_base_cmd_orch(module)
     cmd.extend(['host', 'ls', '--format', 'json'])
-    rc, out, err = module.run_command(cmd)
+    rc, out, err = run_command(module, cmd)
 
     if rc:
         raise RuntimeError(err)
@@ -122,7 +207,7 @@ def update_label(module: "AnsibleModule",
     cmd = build_base_cmd_orch(module)
     cmd.extend(['host', 'label', action,
                 host, label])
-    rc, out, err = module.run_command(cmd)
+    rc, out, err = run_command(module, cmd)
 
     if rc:
         raise RuntimeError(err)
@@ -141,7 +226,7 @@ def update_host(module: "AnsibleModule",
         cmd.append(address)
     if labels:
         cmd.extend(["--labels", ",".join(labels)])
-    rc, out, err = module.run_command(cmd)
+    rc, out, err = run_command(module, cmd)
 
     if rc:
         raise RuntimeError(err)
@@ -149,34 +234,136 @@ def update_host(module: "AnsibleModule",
     return rc, cmd, out, err
 
 
-def main() -> None:
-    module = AnsibleModule(
-        argument_spec=dict(
-            name=dict(type='str', required=True),
-            address=dict(type='str', required=False),
-            set_admin_label=dict(type=bool, required=False, default=False),
-            labels=dict(type='list', required=False, default=[]),
-            state=dict(type='str',
-                       required=False,
-                       choices=['present', 'absent', 'drain'],
-                       default='present'),
-            docker=dict(type=bool,
-                        required=False,
-                        default=False),
-            fsid=dict(type='str', required=False),
-            image=dict(type='str', required=False)
-        ),
-        supports_check_mode=True
-    )
+def drain_host(module: "AnsibleModule", host: str) -> Tuple[int, List[str], str, str]:
+    cmd = build_base_cmd_orch(module)
+    cmd.extend(['host', 'drain', host])
+    rc, out, err = run_command(module, cmd)
+
+    return rc, cmd, out, err
 
+
+def get_drain_state(module: "AnsibleModule") -> Tuple[List[Dict[str, Any]],
+                                                      List[Dict[str, Any]],
+                                                      List[Dict[str, Any]]]:
+    '''
+    Fetch the daemon list, the OSD removal queue and the OSD usage
+    within a single shell.
+    '''
+    rc, cmd, results, err = run_batch(module, [
+        ['ceph', 'orch', 'ps', '--format', 'json'],
+        ['ceph', 'orch', 'osd', 'rm', 'status', '--format', 'json'],
+        ['ceph', 'osd', 'df', '--format', 'json']
+    ])
+    (ps_rc, ps_out), (_, rm_out), (df_rc, df_out) = results
+
+    if rc or ps_rc or df_rc:
+        fatal("Can't get the drain progress: {}".format(err or (ps_out if ps_rc else df_out)), module)
+
+    # `orch osd rm status` doesn't return json when the queue is empty.
+    try:
+        rm_queue = json.loads(rm_out)
+    except ValueError:
+        rm_queue = []
+
+    return json.loads(ps_out), rm_queue or [], json.loads(df_out).get('nodes', [])
+
+
+def get_drain_progress(hosts: List[str],
+                       daemons: List[Dict[str, Any]],
+                       rm_queue: List[Dict[str, Any]],
+                       osd_df: List[Dict[str, Any]],
+                       tracked: Optional[Dict[str, Dict[int, Dict[str, int]]]] = None) -> Dict[str, Dict[str, Any]]:
+    '''
+    The daemons left on each host and the PGs and bytes still held by
+    its OSDs. `tracked` keeps the usage of each OSD seen so far between
+    two calls: an OSD missing from `osd_df` keeps its last known usage,
+    and an OSD gone from both the host and the removal queue has been
+    removed, which only happens once it is empty.
+    '''
+    progress = {}
+    usage = {node['id']: node for node in osd_df}
+    if tracked is None:
+        tracked = {}
+
+    for host in hosts:
+        host_daemons = [d for d in daemons if d.get('hostname') == host]
+        osds = set(int(d['daemon_id']) for d in host_daemons if d.get('daemon_type') == 'osd')
+        osds.update(int(osd['osd_id']) for osd in rm_queue if osd.get('hostname') == host)
+        host_osds = tracked.setdefault(host, {})
+        for osd in set(host_osds) - osds:
+            host_osds[osd] = dict(pgs=0, bytes_used=0)
+        for osd in osds:
+            if osd in usage:
+                host_osds[osd] = dict(pgs=usage[osd].get('pgs', 0), bytes_used=usage[osd].get('kb_used', 0) * 1024)
+        progress[host] = dict(
+            daemons=sorted(d.get('daemon_name', '{}.{}'.format(d.get('daemon_type'), d.get('daemon_id')))
+                           for d in host_daemons),
+            osds=sorted(osds),
+            pgs=sum(osd['pgs'] for osd in host_osds.values()),
+            bytes_used=sum(osd['bytes_used'] for osd in host_osds.values()),
+            done=not host_daemons
+        )
+
+    return progress
+
+
+def update_drain_rates(progress: Dict[str, Dict[str, Any]],
+                       baseline: Dict[str, Dict[str, Any]],
+                       elapsed: float) -> None:
+    minutes = elapsed / 60
+    for host, status in progress.items():
+        status['pgs_moved'] = max(baseline[host]['pgs'] - status['pgs'], 0)
+        status['bytes_moved'] = max(baseline[host]['bytes_used'] - status['bytes_used'], 0)
+        status['pgs_per_minute'] = round(status['pgs_moved'] / minutes, 2) if minutes else 0
+        status['bytes_per_minute'] = int(status['bytes_moved'] / minutes) if minutes else 0
+        status['eta_seconds'] = None
+        if status['done']:
+            status['eta_seconds'] = 0
+        elif status['pgs_per_minute']:
+            status['eta_seconds'] = int(status['pgs'] / status['pgs_per_minute'] * 60)
+
+
+def wait_for_drain(module: "AnsibleModule",
+                   hosts: List[str],
+                   timeout: int,
+                   interval: int) -> Dict[str, Dict[str, Any]]:
+    start = time.monotonic()
+    baseline: Dict[str, Dict[str, Any]] = {}
+    tracked: Dict[str, Dict[int, Dict[str, int]]] = {}
+
+    while True:
+        elapsed = time.monotonic() - start
+        progress = get_drain_progress(hosts, *get_drain_state(module), tracked=tracked)
+        if not baseline:
+            baseline = progress
+        update_drain_rates(progress, baseline, elapsed)
+
+        if all(status['done'] for status in progress.values()):
+            return progress
+
+        if elapsed >= timeout:
+            pending = [host for host, status in progress.items() if not status['done']]
+            fail_module(module, msg='Timed out after {}s waiting for {} to be drained.'.format(timeout, ','.join(pending)),
+                        drain_status=progress,
+                        rc=1)
+
+        time.sleep(interval)
+
+
+def run_module(module: "AnsibleModule") -> None:
     name = module.params.get('name')
+    names = module.params.get('names')
     address = module.params.get('address')
     set_admin_label = module.params.get('set_admin_label')
     labels = module.params.get('labels')
     state = module.params.get('state')
+    wait = module.params.get('wait')
     if state == 'absent':
         state = 'rm'
 
+    if names and state != 'drain':
+        fail_module(module, msg="'names' is only supported when state is 'drain'.", rc=1)
+
     startd = datetime.datetime.now()
     changed = False
 
@@ -226,13 +413,44 @@ def main() -> None:
             if not rc:
                 changed = True
 
-    if state in ['rm', 'drain']:
+    if state == 'rm':
         if name not in current_names:
             out = '{} is not present, skipping.'.format(name)
         else:
             rc, cmd, out, err = update_host(module, state, name)
             changed = True
 
+    drain_status = None
+    drain_results: Optional[Dict[str, Dict[str, Any]]] = None
+    if state == 'drain':
+        drain_results = {}
+        for host in names or [name]:
+            if host not in current_names:
+                drain_results[host] = dict(rc=0, cmd=[], stdout='{} is not present, skipping.'.format(host), stderr='', changed=False)
+            else:
+                # schedule all drains first so the hosts get drained in parallel
+                _rc, _cmd, _out, _err = drain_host(module, host)
+                drain_results[host] = dict(rc=_rc, cmd=_cmd, stdout=_out, stderr=_err, changed=not _rc)
+        failed = [host for host, result in drain_results.items() if result['rc']]
+        if failed:
+            fail_module(module,
+                        msg="Can't drain {}: {}".format(','.join(failed), '; '.join(drain_results[host]['stderr'] for host in failed)),
+                        rc=1,
+                        drain_results=drain_results)
+        to_drain = [host for host, result in drain_results.items() if result['changed']]
+        changed = bool(to_drain)
+        rc = 0
+        # the per host commands and outputs are in drain_results
+        cmd = next((result['cmd'] for result in reversed(list(drain_results.values())) if result['cmd']), cmd)
+        out = '\n'.join(result['stdout'] for result in drain_results.values())
+        err = '\n'.join(result['stderr'] for result in drain_results.values() if result['stderr'])
+
+        if wait and to_drain:
+            drain_status = wait_for_drain(module,
+                                          to_drain,
+                                          module.params.get('wait_timeout'),
+                                          module.params.get('poll_interval'))
+
     exit_module(
         module=module,
         out=out,
@@ -240,9 +458,49 @@ def main() -> None:
         cmd=cmd,
         err=err,
         startd=startd,
-        changed=changed
+        changed=changed,
+        drain_results=drain_results,
+        drain_status=drain_status
     )
 
 
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            name=dict(type='str', required=False),
+            names=dict(type='list', elements='str', required=False),
+            address=dict(type='str', required=False),
+            set_admin_label=dict(type=bool, required=False, default=False),
+            labels=dict(type='list', required=False, default=[]),
+            state=dict(type='str',
+                       required=False,
+                       choices=['present', 'absent', 'drain'],
+                       default='present'),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            wait=dict(type=bool, required=False, default=False),
+            wait_timeout=dict(type='int', required=False, default=3600),
+            poll_interval=dict(type='int', required=False, default=10)
+        ),
+        supports_check_mode=True,
+        mutually_exclusive=[('name', 'names')],
+        required_one_of=[('name', 'names')]
+    )
+
+    try:
+        run_module(module)
+    except RuntimeError as e:
+        fail_module(module, msg=str(e), rc=1)
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,476 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional, Tuple
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal, fail_module, run_batch, host_domains  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal, fail_module, run_batch, host_domains
+import datetime
+import json
+import time
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_orch_host_maintenance
+short_description: put hosts in or out of maintenance, in waves
+version_added: "2.9"
+description:
+    - Make hosts enter or exit the orchestrator maintenance mode
+      (`ceph orch host maintenance enter|exit`), wave after wave.
+    - The hosts are grouped in waves by CRUSH failure domain (eg. one
+      rack at a time), each wave having at most 'max_batch_size' hosts.
+    - Before entering maintenance, each host of a wave is checked with
+      `ceph orch host ok-to-stop` and the OSDs of the whole wave with
+      `ceph osd ok-to-stop`.
+    - After each wave, the module waits for the cluster to settle before
+      starting the next one, ie. the OSDs of the wave to be reported
+      down (enter) or up (exit) and the placement groups to be active
+      (enter) or active+clean (exit).
+options:
+    fsid:
+        description:
+            - the fsid of the Ceph cluster to interact with.
+        required: false
+    image:
+        description:
+            - The Ceph container image to use.
+        required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    hosts:
+        description:
+            - the hosts to put in (or out of) maintenance. Hosts already
+              in the requested state are left untouched.
+        required: true
+    state:
+        description:
+            - If 'enter', the hosts enter maintenance.
+            - If 'exit', the hosts exit maintenance.
+        required: false
+        default: enter
+    failure_domain:
+        description:
+            - the CRUSH bucket type the waves are built from. Hosts
+              without OSDs are a failure domain of their own.
+        required: false
+        default: host
+    max_batch_size:
+        description:
+            - the maximum number of hosts per wave. Default is all the
+              hosts of a failure domain.
+        required: false
+    wave:
+        description:
+            - only process the wave with this index (from 0), so that a
+              playbook can enter maintenance, patch and exit maintenance
+              one wave at a time. The waves are planned the same way for
+              the same hosts, run the module in check mode to get them.
+            - required when state is 'enter', except in check mode, so
+              that the waves never are in maintenance at the same time.
+              When exiting, default is all the waves, in turn.
+        required: false
+    ok_to_stop:
+        description:
+            - If 'fail', the module fails when a host of a wave isn't ok
+              to stop.
+            - If 'skip', those hosts (or the whole wave when its OSDs
+              can't be stopped together) are skipped and reported in
+              'skipped_hosts'.
+        required: false
+        default: fail
+    force:
+        description:
+            - skip the ok-to-stop checks and pass `--force` to
+              `ceph orch host maintenance enter`.
+        required: false
+        default: false
+    wait:
+        description:
+            - wait for the cluster to settle after each wave.
+        required: false
+        default: true
+    settle_timeout:
+        description:
+            - how long (in seconds) to wait for the cluster to settle
+              after each wave.
+        required: false
+        default: 1800
+    poll_interval:
+        description:
+            - how long (in seconds) to wait between two checks of the
+              cluster state.
+        required: false
+        default: 10
+'''
+
+EXAMPLES = '''
+- name: plan the maintenance waves, one rack at a time
+  ceph_orch_host_maintenance:
+    hosts: "{{ ansible_play_hosts }}"
+    failure_domain: rack
+    max_batch_size: 10
+  check_mode: true
+  run_once: true
+  delegate_to: "{{ groups['admin'][0] }}"
+  register: plan
+
+- name: patch the hosts, one wave at a time
+  include_tasks: patch-wave.yml
+  loop: "{{ plan.waves }}"
+  loop_control:
+    index_var: wave_index
+
+# patch-wave.yml
+- name: enter maintenance
+  ceph_orch_host_maintenance:
+    hosts: "{{ ansible_play_hosts }}"
+    failure_domain: rack
+    max_batch_size: 10
+    wave: "{{ wave_index }}"
+    ok_to_stop: skip
+  run_once: true
+  delegate_to: "{{ groups['admin'][0] }}"
+  register: wave
+
+- name: patch and reboot the hosts in maintenance
+  when: inventory_hostname in wave.waves[0].changed
+  block:
+    - name: upgrade the packages
+      package:
+        name: '*'
+        state: latest
+
+    - name: reboot
+      reboot:
+
+- name: exit maintenance
+  ceph_orch_host_maintenance:
+    hosts: "{{ ansible_play_hosts }}"
+    failure_domain: rack
+    max_batch_size: 10
+    wave: "{{ wave_index }}"
+    state: exit
+  run_once: true
+  delegate_to: "{{ groups['admin'][0] }}"
+
+- name: take ceph-node1 out of maintenance
+  ceph_orch_host_maintenance:
+    hosts:
+      - ceph-node1
+    state: exit
+'''
+
+RETURN = '''
+waves:
+    description:
+        - the waves, with their failure domain, hosts, the hosts actually
+          changed, the time spent running the maintenance commands
+          ('duration') and waiting for the cluster to settle ('settle_time').
+          Only the wave processed when 'wave' is set.
+    returned: always
+    type: list
+skipped_hosts:
+    description: the hosts skipped because they weren't ok to stop.
+    returned: always
+    type: list
+'''
+
+# placement group states which aren't clean
+UNCLEAN_PG_STATES = ['degraded', 'undersized', 'recovering', 'recovery_wait', 'backfilling',
+                     'backfill_wait', 'remapped', 'peering', 'stale', 'down', 'incomplete']
+
+
+def get_cluster_state(module: "AnsibleModule") -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+    '''
+    Return the status of each host (`orch host ls`) and the CRUSH
+    nodes (`osd tree`).
+    '''
+    rc, cmd, results, err = run_batch(module, [['ceph', 'orch', 'host', 'ls', '--format', 'json'],
+                                               ['ceph', 'osd', 'tree', '--format', 'json']])
+    for _rc, out in results:
+        if rc or _rc:
+            fatal("Can't get the cluster state: {}".format(out or err), module)
+
+    status = {host['hostname']: host.get('status', '').lower() for host in json.loads(results[0][1])}
+    return status, json.loads(results[1][1]).get('nodes', [])
+
+
+def host_osds(nodes: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+    by_id = {node['id']: node for node in nodes}
+    return {node['name']: [child for child in node.get('children', []) if by_id.get(child, {}).get('type') == 'osd']
+            for node in nodes if node.get('type') == 'host'}
+
+
+def plan_waves(hosts: List[str],
+               nodes: List[Dict[str, Any]],
+               failure_domain: str,
+               max_batch_size: Optional[int]) -> List[Dict[str, Any]]:
+    '''
+    Group `hosts` by failure domain, in the order they're first seen,
+    and split the groups in waves of at most `max_batch_size` hosts.
+    '''
+    domains = host_domains(nodes, failure_domain)
+    groups: Dict[str, List[str]] = {}
+    for host in hosts:
+        hosts_in_domain = groups.setdefault(domains.get(host, host), [])
+        if host not in hosts_in_domain:
+            hosts_in_domain.append(host)
+
+    waves = []
+    for domain, members in groups.items():
+        size = max_batch_size or len(members)
+        for i in range(0, len(members), size):
+            waves.append(dict(domain=domain, hosts=members[i:i + size]))
+    return waves
+
+
+def check_ok_to_stop(module: "AnsibleModule",
+                     hosts: List[str],
+                     osds: Dict[str, List[int]]) -> Tuple[List[str], List[str]]:
+    '''
+    Return the hosts which are ok to stop and the reasons why the
+    others aren't.
+    '''
+    cmds = [['ceph', 'orch', 'host', 'ok-to-stop', host] for host in hosts]
+    wave_osds = [str(osd) for host in hosts for osd in osds.get(host, [])]
+    if wave_osds:
+        cmds.append(['ceph', 'osd', 'ok-to-stop'] + wave_osds)
+    rc, cmd, results, err = run_batch(module, cmds)
+    if rc:
+        fatal("Can't run the ok-to-stop checks: {}".format(err), module)
+
+    ok, reasons = [], []
+    for host, (_rc, out) in zip(hosts, results):
+        if _rc:
+            reasons.append('{}: {}'.format(host, out.strip() or 'not ok to stop'))
+        else:
+            ok.append(host)
+    if wave_osds and results[-1][0]:
+        # the osds of the wave can't be stopped together
+        reasons.append('osd.{}: {}'.format(',osd.'.join(wave_osds), results[-1][1].strip() or 'not ok to stop'))
+        ok = []
+    return ok, reasons
+
+
+def maintenance(module: "AnsibleModule", action: str, hosts: List[str]) -> None:
+    cmds = []
+    for host in hosts:
+        cmd = ['ceph', 'orch', 'host', 'maintenance', action, host]
+        if action == 'enter' and module.params.get('force'):
+            cmd.append('--force')
+        cmds.append(cmd)
+    rc, cmd, results, err = run_batch(module, cmds)
+    failed = ['{}: {}'.format(host, out.strip() or err) for host, (_rc, out) in zip(hosts, results) if rc or _rc]
+    if failed:
+        fatal("Can't {} maintenance: {}".format(action, '; '.join(failed)), module)
+
+
+def pg_states(out: str) -> Dict[str, int]:
+    stat = json.loads(out)
+    # `pg stat` has been moved to 'pg_summary' with quincy
+    stat = stat.get('pg_summary', stat)
+    return {state['name']: state['num'] for state in stat.get('num_pg_by_state', [])}
+
+
+def is_settled(action: str, states: Dict[str, int], osd_status: Dict[int, str], wave_osds: List[int]) -> bool:
+    expected = 'down' if action == 'enter' else 'up'
+    if any(osd_status.get(osd) != expected for osd in wave_osds):
+        return False
+    for state, num in states.items():
+        flags = state.split('+')
+        if not num:
+            continue
+        if 'active' not in flags:
+            return False
+        if action == 'exit' and ('clean' not in flags or any(flag in UNCLEAN_PG_STATES for flag in flags)):
+            return False
+    return True
+
+
+def wait_for_settle(module: "AnsibleModule", action: str, wave_osds: List[int], waves: List[Dict[str, Any]]) -> None:
+    timeout = module.params.get('settle_timeout')
+    start = time.monotonic()
+    while True:
+        rc, cmd, results, err = run_batch(module, [['ceph', 'pg', 'stat', '--format', 'json'],
+                                                   ['ceph', 'osd', 'tree', '--format', 'json']])
+        (pg_rc, pg_out), (tree_rc, tree_out) = results
+        if not (rc or pg_rc or tree_rc):
+            osd_status = {node['id']: node.get('status') for node in json.loads(tree_out).get('nodes', []) if node.get('type') == 'osd'}
+            if is_settled(action, pg_states(pg_out), osd_status, wave_osds):
+                return
+
+        if time.monotonic() - start >= timeout:
+            fail_module(module, msg='Timed out after {}s waiting for the cluster to settle.'.format(timeout),
+                        waves=waves, rc=1)
+        time.sleep(module.params.get('poll_interval'))
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            hosts=dict(type='list', elements='str', required=True),
+            state=dict(type='str', required=False, choices=['enter', 'exit'], default='enter'),
+            failure_domain=dict(type='str', required=False, default='host'),
+            max_batch_size=dict(type='int', required=False),
+            wave=dict(type='int', required=False),
+            ok_to_stop=dict(type='str', required=False, choices=['fail', 'skip'], default='fail'),
+            force=dict(type=bool, required=False, default=False),
+            wait=dict(type=bool, required=False, default=True),
+            settle_timeout=dict(type='int', required=False, default=1800),
+            poll_interval=dict(type='int', required=False, default=10)
+        ),
+        supports_check_mode=True
+    )
+
+    hosts = module.params.get('hosts')
+    action = module.params.get('state')
+
+    startd = datetime.datetime.now()
+    changed = False
+
+    status, nodes = get_cluster_state(module)
+    unknown = [host for host in hosts if host not in status]
+    if unknown:
+        fatal('Unknown host(s): {}'.format(', '.join(unknown)), module)
+
+    osds = host_osds(nodes)
+    waves = plan_waves(hosts, nodes, module.params.get('failure_domain'), module.params.get('max_batch_size'))
+    index = module.params.get('wave')
+    if index is None and action == 'enter' and not module.check_mode:
+        fatal("'wave' is required to enter maintenance, the {} wave(s) would be in maintenance at the same time. "
+              "Plan the waves in check mode and enter them one at a time.".format(len(waves)), module)
+    if index is not None:
+        if not 0 <= index < len(waves):
+            fatal('Invalid wave {}, there are {} wave(s).'.format(index, len(waves)), module)
+        waves = waves[index:index + 1]
+    skipped: List[str] = []
+
+    for wave in waves:
+        wave['changed'] = [host for host in wave['hosts'] if (status[host] == 'maintenance') != (action == 'enter')]
+        wave['duration'] = 0.0
+        wave['settle_time'] = 0.0
+        if not wave['changed'] or module.check_mode:
+            continue
+
+        wave_start = time.monotonic()
+        if action == 'enter' and not module.params.get('force'):
+            ok, reasons = check_ok_to_stop(module, wave['changed'], osds)
+            if reasons and module.params.get('ok_to_stop') == 'fail':
+                fail_module(module, msg='Not ok to stop: {}'.format('; '.join(reasons)), waves=waves, skipped_hosts=skipped, rc=1)
+            skipped.extend(host for host in wave['changed'] if host not in ok)
+            wave['changed'] = ok
+            if not ok:
+                continue
+
+        maintenance(module, action, wave['changed'])
+        changed = True
+        wave['duration'] = round(time.monotonic() - wave_start, 3)
+
+        if module.params.get('wait'):
+            settle_start = time.monotonic()
+            wait_for_settle(module, action, [osd for host in wave['changed'] for osd in osds.get(host, [])], waves)
+            wave['settle_time'] = round(time.monotonic() - settle_start, 3)
+
+    if module.check_mode:
+        changed = any(wave['changed'] for wave in waves)
+
+    exit_module(
+        module=module,
+        out='{} host(s) {} maintenance in {} wave(s).'.format(sum(len(wave['changed']) for wave in waves),
+                                                              'entered' if action == 'enter' else 'exited', len(waves)),
+        rc=0,
+        cmd=['ceph', 'orch', 'host', 'maintenance', action],
+        err='',
+        startd=startd,
+        changed=changed,
+        waves=waves,
+        skipped_hosts=skipped
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional, Tuple
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal, normalize_config_value  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal, normalize_config_value
+import datetime
+import json
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_orch_osd_spec
+short_description: generate osd service specs from a device inventory
+version_added: "2.9"
+description:
+    - Group the hosts with identical available devices (rotational,
+      model and size) and generate one OSD service spec per group,
+      ready to be passed to ceph_orch_apply.
+    - On hosts with both rotational and non rotational devices, the
+      rotational devices are the data devices and the non rotational
+      ones hold their DB/WAL. On hosts with only non rotational devices,
+      large devices can be split in several OSDs.
+    - No command is run, the module only computes the specs and never
+      reports a change.
+options:
+    devices:
+        description:
+            - the device inventory, as returned by ceph_orch_device_facts
+              (host, path, size, rotational, available, model). Only the
+              available devices are used.
+        required: true
+    db_ratio:
+        description:
+            - the maximum number of rotational data devices sharing a non
+              rotational DB device. Groups above it are reported as
+              errors.
+        required: false
+        default: 12
+    block_db_size:
+        description:
+            - the size of the DB of each OSD (eg. 60G). Default is the
+              size of the smallest DB device of the group divided by its
+              number of DB slots, rounded down to the GiB.
+        required: false
+    osds_per_device:
+        description:
+            - the number of OSDs per device on hosts with only non
+              rotational devices, when they are all at least
+              'split_min_size'.
+        required: false
+        default: 1
+    split_min_size:
+        description:
+            - the size (eg. 4T) from which non rotational data devices are
+              split in 'osds_per_device' OSDs.
+        required: false
+        default: 4T
+    service_id_prefix:
+        description:
+            - the prefix of the generated service ids.
+        required: false
+        default: osd
+    extra_spec:
+        description:
+            - settings merged into the 'spec' section of each generated
+              spec (eg. encrypted).
+        required: false
+        default: {}
+'''
+
+EXAMPLES = '''
+- name: get the available devices
+  ceph_orch_device_facts:
+    available: true
+  register: inventory
+
+- name: generate the osd specs
+  ceph_orch_osd_spec:
+    devices: "{{ inventory.devices }}"
+    db_ratio: 6
+    osds_per_device: 2
+    extra_spec:
+      encrypted: true
+  register: osd_spec
+
+- name: apply the osd specs
+  ceph_orch_apply:
+    spec: "{{ osd_spec.spec }}"
+'''
+
+RETURN = '''
+specs:
+    description: the generated OSD service specs.
+    returned: always
+    type: list
+spec:
+    description: the generated OSD service specs as a multi-document string.
+    returned: always
+    type: str
+groups:
+    description: the hosts, devices and number of OSDs per host of each spec.
+    returned: always
+    type: list
+skipped_hosts:
+    description: the hosts without available devices.
+    returned: always
+    type: list
+'''
+
+GIB = 1024 * 1024 * 1024
+
+
+def hardware(devices: List[Dict[str, Any]]) -> Tuple[Tuple[bool, str, int], ...]:
+    '''
+    The fingerprint of the devices of a host.
+    '''
+    return tuple(sorted((bool(device['rotational']), device.get('model') or '', int(device['size']))
+                        for device in devices))
+
+
+def group_hosts(devices: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    '''
+    Group the hosts by fingerprint of their available devices, in the
+    order the hosts are first seen. Returns the groups and the hosts
+    without available devices.
+    '''
+    host_devices: Dict[str, List[Dict[str, Any]]] = {}
+    for device in devices:
+        host_devices.setdefault(device['host'], [])
+        if device.get('available', True):
+            host_devices[device['host']].append(device)
+
+    groups: Dict[Tuple[Tuple[bool, str, int], ...], Dict[str, Any]] = {}
+    skipped = []
+    for host, available in host_devices.items():
+        if not available:
+            skipped.append(host)
+            continue
+        group = groups.setdefault(hardware(available), dict(hosts=[], devices=available))
+        group['hosts'].append(host)
+    return list(groups.values()), skipped
+
+
+def plan_group(group: Dict[str, Any],
+               db_ratio: int,
+               block_db_size: Optional[int],
+               osds_per_device: int,
+               split_min_size: int) -> Dict[str, Any]:
+    '''
+    The OSD settings ('spec' section) of a group of identical hosts.
+    Raises ValueError when the policy can't be met.
+    '''
+    data = [device for device in group['devices'] if device['rotational']]
+    flash = [device for device in group['devices'] if not device['rotational']]
+    spec: Dict[str, Any] = {}
+    osds = len(data)
+
+    if data and flash:
+        db_slots = -(-len(data) // len(flash))
+        if db_slots > db_ratio:
+            raise ValueError('{} data devices for {} DB devices, more than {} per DB device'.format(len(data), len(flash), db_ratio))
+        db_device_size = min(device['size'] for device in flash)
+        if block_db_size is None:
+            block_db_size = db_device_size // db_slots // GIB * GIB
+        elif block_db_size * db_slots > db_device_size:
+            raise ValueError('{} DB of {} bytes do not fit on a DB device of {} bytes'.format(db_slots, block_db_size, db_device_size))
+        spec = dict(data_devices=dict(rotational=1),
+                    db_devices=dict(rotational=0),
+                    db_slots=db_slots,
+                    block_db_size=block_db_size)
+    elif data:
+        spec = dict(data_devices=dict(rotational=1))
+    else:
+        osds = len(flash)
+        spec = dict(data_devices=dict(rotational=0))
+        if osds_per_device > 1 and min(device['size'] for device in flash) >= split_min_size:
+            spec['osds_per_device'] = osds_per_device
+            osds *= osds_per_device
+
+    group.update(data_devices=len(data) if data else len(flash),
+                 db_devices=len(flash) if data else 0,
+                 osds_per_host=osds)
+    return spec
+
+
+def service_id(group: Dict[str, Any], prefix: str, used: List[str]) -> str:
+    rotational = any(device['rotational'] for device in group['devices'])
+    name = '{}-{}{}'.format(prefix, group['data_devices'], 'hdd' if rotational else 'ssd')
+    if group['db_devices']:
+        name += '-{}ssd'.format(group['db_devices'])
+    suffix = 2
+    unique = name
+    while unique in used:
+        unique = '{}-{}'.format(name, suffix)
+        suffix += 1
+    return unique
+
+
+def plan_osd_specs(devices: List[Dict[str, Any]],
+                   db_ratio: int,
+                   block_db_size: Optional[int],
+                   osds_per_device: int,
+                   split_min_size: int,
+                   prefix: str,
+                   extra_spec: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[str], List[str]]:
+    '''
+    Returns the specs, the groups, the skipped hosts and the errors.
+    '''
+    groups, skipped = group_hosts(devices)
+    specs: List[Dict[str, Any]] = []
+    planned: List[Dict[str, Any]] = []
+    errors = []
+    for group in groups:
+        try:
+            settings = plan_group(group, db_ratio, block_db_size, osds_per_device, split_min_size)
+        except ValueError as e:
+            errors.append('{}: {}'.format(','.join(group['hosts']), e))
+            continue
+        settings.update(extra_spec)
+        name = service_id(group, prefix, [spec['service_id'] for spec in specs])
+        specs.append(dict(service_type='osd',
+                          service_id=name,
+                          placement=dict(hosts=group['hosts']),
+                          spec=settings))
+        planned.append(dict(service_id=name,
+                            hosts=group['hosts'],
+                            data_devices=group['data_devices'],
+                            db_devices=group['db_devices'],
+                            osds_per_host=group['osds_per_host']))
+    return specs, planned, skipped, errors
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            devices=dict(type='list', elements='dict', required=True),
+            db_ratio=dict(type='int', required=False, default=12),
+            block_db_size=dict(type='str', required=False),
+            osds_per_device=dict(type='int', required=False, default=1),
+            split_min_size=dict(type='str', required=False, default='4T'),
+            service_id_prefix=dict(type='str', required=False, default='osd'),
+            extra_spec=dict(type='dict', required=False, default={})
+        ),
+        supports_check_mode=True
+    )
+
+    startd = datetime.datetime.now()
+    sizes: Dict[str, Any] = {}
+    for arg in ['block_db_size', 'split_min_size']:
+        sizes[arg] = normalize_config_value(module.params.get(arg), 'size') if module.params.get(arg) else None
+        if sizes[arg] is not None and not isinstance(sizes[arg], int):
+            fatal('Invalid size for {}: {}'.format(arg, module.params.get(arg)), module)
+
+    specs, groups, skipped, errors = plan_osd_specs(module.params.get('devices'),
+                                                    module.params.get('db_ratio'),
+                                                    sizes['block_db_size'],
+                                                    module.params.get('osds_per_device'),
+                                                    sizes['split_min_size'],
+                                                    module.params.get('service_id_prefix'),
+                                                    module.params.get('extra_spec'))
+    if errors:
+        fatal("Can't generate the OSD spec(s):\n{}".format('\n'.join(errors)), module)
+
+    exit_module(
+        module=module,
+        out='',
+        rc=0,
+        cmd=[],
+        err='',
+        startd=startd,
+        changed=False,
+        specs=specs,
+        spec='\n---\n'.join(json.dumps(spec) for spec in specs),
+        groups=groups,
+        skipped_hosts=skipped
+    )
+
+
+if __name__ == '__main__':
+    main()
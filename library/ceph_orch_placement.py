@@ -0,0 +1,359 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Tuple
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal, run_batch, iter_json_array, host_domains  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal, run_batch, iter_json_array, host_domains
+import datetime
+import json
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_orch_placement
+short_description: plan the placement of ceph services
+version_added: "2.9"
+description:
+    - Compute the hosts of each service from the hosts, their labels and
+      their CRUSH location, and return the service specs with an
+      explicit placement, ready to be passed to ceph_orch_apply.
+    - The daemons of a service are spread evenly across the failure
+      domains, then on the hosts with the most CPU and memory relative
+      to the daemons already planned on them. Hosts already running the
+      service are preferred over other hosts of the same failure domain
+      so that a new plan doesn't move daemons needlessly.
+    - Hosts in maintenance or offline are never picked.
+    - Nothing is applied, the module never reports a change.
+options:
+    fsid:
+        description:
+            - the fsid of the Ceph cluster to interact with.
+        required: false
+    image:
+        description:
+            - The Ceph container image to use.
+        required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    services:
+        description:
+            - the services to place, in order. Each item accepts
+              'service_type' (required), 'service_id', 'count'
+              (required), 'label' and 'hosts' (restrict the candidate
+              hosts), 'failure_domain' (overrides the 'failure_domain'
+              option), 'max_per_domain' (the maximum number of daemons
+              of the service in a failure domain), 'anti_affinity' (the
+              daemon types the service must not be colocated with, the
+              services listed later avoid it as well) and 'extra'
+              (merged into the generated spec, eg. 'spec' or
+              'networks').
+        required: true
+    failure_domain:
+        description:
+            - the CRUSH bucket type the daemons are spread across. Hosts
+              which aren't in the CRUSH map are their own failure domain.
+        required: false
+        default: host
+'''
+
+EXAMPLES = '''
+- name: plan the placement of the core services
+  ceph_orch_placement:
+    failure_domain: rack
+    services:
+      - service_type: mon
+        count: 5
+        label: mon
+      - service_type: mgr
+        count: 3
+        label: mon
+        max_per_domain: 1
+      - service_type: rgw
+        service_id: default
+        count: 4
+        label: rgw
+        anti_affinity:
+          - mds
+        extra:
+          spec:
+            rgw_frontend_port: 8080
+  register: placement
+
+- name: apply the service specs
+  ceph_orch_apply:
+    spec: "{{ placement.spec }}"
+'''
+
+RETURN = '''
+specs:
+    description: the generated service specs.
+    returned: always
+    type: list
+spec:
+    description: the generated service specs as a multi-document string.
+    returned: always
+    type: str
+placements:
+    description: the hosts and the number of daemons per failure domain of each service.
+    returned: always
+    type: dict
+'''
+
+UNAVAILABLE_STATUSES = ('maintenance', 'offline')
+
+
+def get_cluster_state(module: "AnsibleModule") -> Dict[str, Any]:
+    rc, cmd, results, err = run_batch(module, [
+        ['ceph', 'orch', 'host', 'ls', '--detail', '--format', 'json'],
+        ['ceph', 'osd', 'tree', '--format', 'json'],
+        ['ceph', 'orch', 'ps', '--format', 'json']
+    ])
+    (hosts_rc, hosts_out), (tree_rc, tree_out), (ps_rc, ps_out) = results
+
+    if rc or hosts_rc or tree_rc or ps_rc:
+        fatal("Can't get the current cluster state: {}".format(err or hosts_out or tree_out or ps_out), module)
+
+    daemons: List[Dict[str, str]] = []
+    if ps_out.lstrip().startswith('['):
+        daemons = [dict(hostname=daemon['hostname'],
+                        daemon_type=daemon['daemon_type'],
+                        service_name=daemon.get('service_name', daemon['daemon_type']))
+                   for daemon in iter_json_array(ps_out)]
+
+    return dict(hosts=json.loads(hosts_out),
+                nodes=json.loads(tree_out).get('nodes', []),
+                daemons=daemons)
+
+
+def service_name(service: Dict[str, Any]) -> str:
+    if service.get('service_id'):
+        return '{}.{}'.format(service['service_type'], service['service_id'])
+    return service['service_type']
+
+
+def host_weights(hosts: List[Dict[str, Any]]) -> Dict[str, float]:
+    '''
+    The capacity of each host relative to the largest one, the average
+    of its CPU and memory ratios. Hosts without facts weigh as much as
+    the largest host.
+    '''
+    weights = {}
+    max_cpu = max([host.get('cpu_count') or 0 for host in hosts] + [0])
+    max_memory = max([host.get('memory_total_kb') or 0 for host in hosts] + [0])
+    for host in hosts:
+        ratios = [1.0, 1.0]
+        if max_cpu and host.get('cpu_count'):
+            ratios[0] = host['cpu_count'] / max_cpu
+        if max_memory and host.get('memory_total_kb'):
+            ratios[1] = host['memory_total_kb'] / max_memory
+        weights[host['hostname']] = sum(ratios) / len(ratios)
+    return weights
+
+
+def plan_placement(services: List[Dict[str, Any]],
+                   hosts: List[Dict[str, Any]],
+                   nodes: List[Dict[str, Any]],
+                   daemons: List[Dict[str, str]],
+                   failure_domain: str) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    '''
+    Pick the hosts of each service, in order. Returns the placements and
+    the errors (services which can't be placed).
+    '''
+    weights = host_weights(hosts)
+    available = [host['hostname'] for host in hosts
+                 if (host.get('status') or '').lower() not in UNAVAILABLE_STATUSES]
+    labels = {host['hostname']: host.get('labels', []) for host in hosts}
+    avoided = {service_name(service): service.get('anti_affinity') or [] for service in services}
+
+    # the daemons of a service stay where they are until it is planned
+    host_daemons: Dict[str, List[Tuple[str, str]]] = {host['hostname']: [] for host in hosts}
+    running: Dict[str, List[str]] = {}
+    for daemon in daemons:
+        running.setdefault(daemon['service_name'], []).append(daemon['hostname'])
+        host_daemons.setdefault(daemon['hostname'], []).append((daemon['daemon_type'], daemon['service_name']))
+    load = {host: 0 for host in weights}
+
+    placements: Dict[str, Dict[str, Any]] = {}
+    errors = []
+    for service in services:
+        name = service_name(service)
+        domains = host_domains(nodes, service.get('failure_domain') or failure_domain)
+        anti_affinity = service.get('anti_affinity') or []
+        max_per_domain = service.get('max_per_domain')
+
+        candidates = [host for host in available
+                      if (not service.get('label') or service['label'] in labels[host])
+                      and (not service.get('hosts') or host in service['hosts'])
+                      and not any(daemon_type in anti_affinity or service['service_type'] in avoided.get(daemon_service, [])
+                                  for daemon_type, daemon_service in host_daemons[host] if daemon_service != name)]
+
+        picked: List[str] = []
+        per_domain: Dict[str, int] = {}
+        while len(picked) < service['count']:
+            remaining = [host for host in candidates if host not in picked
+                         and (not max_per_domain or per_domain.get(domains.get(host, host), 0) < max_per_domain)]
+            if not remaining:
+                break
+            host = min(remaining, key=lambda host: (per_domain.get(domains.get(host, host), 0),
+                                                    host not in running.get(name, []),
+                                                    (load[host] + 1) / weights[host],
+                                                    host))
+            picked.append(host)
+            domain = domains.get(host, host)
+            per_domain[domain] = per_domain.get(domain, 0) + 1
+
+        if len(picked) < service['count']:
+            errors.append('{}: only {} host(s) available for {} daemon(s)'.format(name, len(picked), service['count']))
+            continue
+
+        for host in host_daemons:
+            host_daemons[host] = [daemon for daemon in host_daemons[host] if daemon[1] != name]
+        for host in picked:
+            load[host] += 1
+            host_daemons[host].append((service['service_type'], name))
+        placements[name] = dict(hosts=sorted(picked), domains=per_domain)
+
+    return placements, errors
+
+
+def build_spec(service: Dict[str, Any], hosts: List[str]) -> Dict[str, Any]:
+    spec: Dict[str, Any] = dict(service_type=service['service_type'])
+    if service.get('service_id'):
+        spec['service_id'] = service['service_id']
+    spec['placement'] = dict(hosts=hosts)
+    spec.update(service.get('extra') or {})
+    return spec
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            services=dict(type='list', elements='dict', required=True, options=dict(
+                service_type=dict(type='str', required=True),
+                service_id=dict(type='str', required=False),
+                count=dict(type='int', required=True),
+                label=dict(type='str', required=False),
+                hosts=dict(type='list', elements='str', required=False),
+                failure_domain=dict(type='str', required=False),
+                max_per_domain=dict(type='int', required=False),
+                anti_affinity=dict(type='list', elements='str', required=False),
+                extra=dict(type='dict', required=False)
+            )),
+            failure_domain=dict(type='str', required=False, default='host')
+        ),
+        supports_check_mode=True
+    )
+
+    startd = datetime.datetime.now()
+    services = module.params.get('services')
+
+    state = get_cluster_state(module)
+    placements, errors = plan_placement(services,
+                                        state['hosts'],
+                                        state['nodes'],
+                                        state['daemons'],
+                                        module.params.get('failure_domain'))
+    if errors:
+        fatal("Can't place the service(s):\n{}".format('\n'.join(errors)), module)
+
+    specs = [build_spec(service, placements[service_name(service)]['hosts']) for service in services]
+
+    exit_module(
+        module=module,
+        out='',
+        rc=0,
+        cmd=[],
+        err='',
+        startd=startd,
+        changed=False,
+        specs=specs,
+        spec='\n---\n'.join(json.dumps(spec) for spec in specs),
+        placements=placements
+    )
+
+
+if __name__ == '__main__':
+    main()
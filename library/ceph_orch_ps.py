@@ -0,0 +1,240 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional, Tuple
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import run_command, exit_module, build_base_cmd_orch, fatal, iter_json_array  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import run_command, exit_module, build_base_cmd_orch, fatal, iter_json_array
+import datetime
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_orch_ps
+short_description: list daemons
+version_added: "2.9"
+description:
+    - List the daemons known by the orchestrator, filtered and
+      reduced to the requested fields only.
+options:
+    fsid:
+        description:
+            - the fsid of the Ceph cluster to interact with.
+        required: false
+    image:
+        description:
+            - The Ceph container image to use.
+        required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    daemon_type:
+        description:
+            - only list daemons of this type (eg. osd, mon, rgw).
+        required: false
+    daemon_id:
+        description:
+            - only list the daemon with this id.
+        required: false
+    service_name:
+        description:
+            - only list daemons of this service.
+        required: false
+    hostname:
+        description:
+            - only list daemons running on this host.
+        required: false
+    status:
+        description:
+            - only list daemons with this status
+              (eg. running, stopped, error).
+        required: false
+    fields:
+        description:
+            - the fields to keep for each daemon.
+        required: false
+        default: ['daemon_name', 'daemon_type', 'daemon_id', 'hostname', 'status', 'status_desc']
+    refresh:
+        description:
+            - force the orchestrator to refresh the daemon list
+              rather than using its cache.
+        required: false
+        default: false
+'''
+
+EXAMPLES = '''
+- name: get the image and the host of osd.0
+  ceph_orch_ps:
+    daemon_type: osd
+    daemon_id: 0
+    fields:
+      - container_image_name
+      - hostname
+      - status_desc
+  register: osd0
+
+- name: list the daemons in error
+  ceph_orch_ps:
+    status: error
+'''
+
+RETURN = '''
+daemons:
+    description: the list of daemons matching the filters, reduced to 'fields'.
+    returned: always
+    type: list
+'''
+
+DEFAULT_FIELDS = ['daemon_name', 'daemon_type', 'daemon_id', 'hostname', 'status', 'status_desc']
+
+
+def get_daemons(module: "AnsibleModule") -> Tuple[int, List[str], str, str]:
+    cmd = build_base_cmd_orch(module)
+    cmd.append('ps')
+
+    hostname = module.params.get('hostname')
+    if hostname:
+        cmd.append(hostname)
+    for arg in ['daemon_type', 'daemon_id', 'service_name']:
+        value = module.params.get(arg)
+        if value:
+            cmd.extend(['--{}'.format(arg), value])
+    cmd.extend(['--format', 'json'])
+    if module.params.get('refresh'):
+        cmd.append('--refresh')
+
+    rc, out, err = run_command(module, cmd)
+
+    return rc, cmd, out, err
+
+
+def filter_daemons(data: str,
+                   fields: List[str],
+                   status: Optional[str] = None) -> List[Dict[str, Any]]:
+    daemons = []
+    for daemon in iter_json_array(data):
+        if status and daemon.get('status_desc') != status:
+            continue
+        daemons.append({field: daemon.get(field) for field in fields})
+    return daemons
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            daemon_type=dict(type='str', required=False),
+            daemon_id=dict(type='str', required=False),
+            service_name=dict(type='str', required=False),
+            hostname=dict(type='str', required=False),
+            status=dict(type='str', required=False),
+            fields=dict(type='list', elements='str', required=False, default=DEFAULT_FIELDS),
+            refresh=dict(type=bool, required=False, default=False)
+        ),
+        supports_check_mode=True
+    )
+
+    startd = datetime.datetime.now()
+
+    rc, cmd, out, err = get_daemons(module)
+    if rc:
+        fatal("Can't list daemons: {}".format(err), module)
+
+    # `orch ps` doesn't return json when there's no daemon to list
+    daemons = filter_daemons(out, module.params.get('fields'), module.params.get('status')) if out.lstrip().startswith('[') else []
+
+    exit_module(
+        module=module,
+        out='{} daemon(s) found.'.format(len(daemons)),
+        rc=rc,
+        cmd=cmd,
+        err=err,
+        startd=startd,
+        changed=False,
+        daemons=daemons
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,423 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional, Tuple
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, build_base_cmd_orch, fatal, run_batch, run_command, fail_module  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, build_base_cmd_orch, fatal, run_batch, run_command, fail_module
+import datetime
+import json
+import re
+import time
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_orch_upgrade
+short_description: upgrade a ceph cluster
+version_added: "2.9"
+description:
+    - Start, pause, resume or stop an upgrade of the cluster, optionally
+      limited to some daemon types, hosts or services (staggered upgrade),
+      and wait for it to complete.
+options:
+    fsid:
+        description:
+            - the fsid of the Ceph cluster to interact with.
+        required: false
+    image:
+        description:
+            - The Ceph container image to use.
+        required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    target_image:
+        description:
+            - The container image to upgrade to.
+        required: true when state is 'started'
+    state:
+        description:
+            - If 'started', it ensures the daemons run 'target_image', the
+              upgrade is started unless all the (selected) daemons already
+              run it.
+            - If 'paused', 'resumed' or 'stopped', it pauses, resumes or
+              stops the upgrade in progress.
+        required: false
+        default: started
+    daemon_types:
+        description:
+            - only upgrade these daemon types (eg. mgr, mon).
+        required: false
+    hosts:
+        description:
+            - only upgrade the daemons running on these hosts.
+        required: false
+    services:
+        description:
+            - only upgrade the daemons of these services.
+        required: false
+    limit:
+        description:
+            - only upgrade this number of daemons.
+        required: false
+    wait:
+        description:
+            - wait for the upgrade to complete. The progress (daemons
+              upgraded per minute, ETA) is reported in 'upgrade_status'.
+        required: false
+        default: false
+    wait_timeout:
+        description:
+            - how long (in seconds) to wait for the upgrade to complete.
+        required: false
+        default: 14400
+    poll_interval:
+        description:
+            - how long (in seconds) to wait between two checks of the
+              upgrade progress.
+        required: false
+        default: 30
+    pause_on_health:
+        description:
+            - a list of health checks (eg. PG_AVAILABILITY, OSD_DOWN). While
+              waiting, the upgrade is paused as long as one of them is
+              raised and resumed once they are all cleared.
+        required: false
+        default: []
+'''
+
+EXAMPLES = '''
+- name: upgrade the mgr and mon daemons first
+  ceph_orch_upgrade:
+    target_image: quay.io/ceph/ceph:v18.2.1
+    daemon_types:
+      - mgr
+      - mon
+    wait: true
+
+- name: upgrade the remaining daemons, pause while pgs are unavailable
+  ceph_orch_upgrade:
+    target_image: quay.io/ceph/ceph:v18.2.1
+    wait: true
+    pause_on_health:
+      - PG_AVAILABILITY
+
+- name: pause the upgrade
+  ceph_orch_upgrade:
+    state: paused
+'''
+
+RETURN = '''
+upgrade_status:
+    description: the status of the upgrade (progress, daemons upgraded per minute, ETA).
+    returned: always
+    type: dict
+pending:
+    description: the daemons which don't run the target image yet.
+    returned: when state is 'started'
+    type: list
+'''
+
+PROGRESS_RE = re.compile(r'(\d+)/(\d+)')
+# consecutive failed polls tolerated (eg. during a mgr failover)
+MAX_POLL_FAILURES = 10
+
+
+def parse_status(out: str) -> Dict[str, Any]:
+    status = json.loads(out)
+    match = PROGRESS_RE.search(status.get('progress') or '')
+    status['daemons_upgraded'] = int(match.group(1)) if match else None
+    status['daemons_total'] = int(match.group(2)) if match else None
+    return status
+
+
+def get_upgrade_state(module: "AnsibleModule",
+                      target_image: str,
+                      with_daemons: bool) -> Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]:
+    cmds = [['ceph', 'orch', 'upgrade', 'status', '--format', 'json'],
+            ['ceph', 'orch', 'upgrade', 'check', '--image', target_image, '--format', 'json']]
+    if with_daemons:
+        cmds.append(['ceph', 'orch', 'ps', '--format', 'json'])
+    rc, cmd, results, err = run_batch(module, cmds)
+    for _rc, out in results:
+        if rc or _rc:
+            fatal("Can't get the upgrade status: {}".format(out or err), module)
+
+    daemons = json.loads(results[2][1]) if with_daemons and results[2][1].startswith('[') else []
+    return parse_status(results[0][1]), json.loads(results[1][1]), daemons
+
+
+def get_pending_daemons(check: Dict[str, Any],
+                        daemons: List[Dict[str, Any]],
+                        daemon_types: List[str],
+                        hosts: List[str],
+                        services: List[str]) -> List[str]:
+    '''
+    The daemons reported by `orch upgrade check` as needing an update,
+    restricted to the staggered upgrade selection.
+    '''
+    details = {d.get('daemon_name'): d for d in daemons}
+    pending = []
+    for name in sorted(check.get('needs_update', {})):
+        daemon = details.get(name, {})
+        if daemon_types and name.split('.')[0] not in daemon_types:
+            continue
+        if hosts and daemon.get('hostname') not in hosts:
+            continue
+        if services and daemon.get('service_name') not in services:
+            continue
+        pending.append(name)
+    return pending
+
+
+def upgrade_cmd(module: "AnsibleModule", action: str) -> Tuple[int, List[str], str, str]:
+    cmd = build_base_cmd_orch(module)
+    cmd.extend(['upgrade', action])
+    if action == 'start':
+        cmd.extend(['--image', module.params.get('target_image')])
+        for arg in ['daemon_types', 'hosts', 'services']:
+            if module.params.get(arg):
+                cmd.extend(['--{}'.format(arg.replace('_', '-')), ','.join(module.params.get(arg))])
+        if module.params.get('limit'):
+            cmd.extend(['--limit', str(module.params.get('limit'))])
+    rc, out, err = run_command(module, cmd)
+    if rc:
+        fatal("Can't {} the upgrade: {}".format(action, err), module)
+
+    return rc, cmd, out, err
+
+
+def update_rates(status: Dict[str, Any], baseline: Optional[int], elapsed: float) -> None:
+    done, total = status.get('daemons_upgraded'), status.get('daemons_total')
+    status['daemons_per_minute'] = None
+    status['eta_seconds'] = None
+    if done is None or baseline is None or not elapsed:
+        return
+    status['daemons_per_minute'] = round((done - baseline) / (elapsed / 60), 2)
+    if status['daemons_per_minute'] > 0:
+        status['eta_seconds'] = int((total - done) / status['daemons_per_minute'] * 60)
+
+
+def wait_for_upgrade(module: "AnsibleModule") -> Dict[str, Any]:
+    timeout = module.params.get('wait_timeout')
+    interval = module.params.get('poll_interval')
+    pause_on_health = set(module.params.get('pause_on_health'))
+
+    start = time.monotonic()
+    baseline = None
+    paused_by_module: List[str] = []
+    failures = 0
+    status: Dict[str, Any] = {}
+
+    while True:
+        elapsed = time.monotonic() - start
+        rc, cmd, results, err = run_batch(module, [['ceph', 'orch', 'upgrade', 'status', '--format', 'json'],
+                                                   ['ceph', 'health', '--format', 'json']])
+        (status_rc, status_out), (health_rc, health_out) = results
+        if rc or status_rc or health_rc:
+            # the mgr may be failing over while it gets upgraded
+            failures += 1
+            if failures >= MAX_POLL_FAILURES:
+                fatal("Can't get the upgrade status: {}".format(status_out or health_out or err), module)
+        else:
+            failures = 0
+            status = parse_status(status_out)
+            checks = set(json.loads(health_out).get('checks', {}))
+
+            if baseline is None:
+                baseline = status['daemons_upgraded']
+            update_rates(status, baseline, elapsed)
+
+            if not status.get('in_progress'):
+                status['paused_by_module'] = []
+                return status
+
+            upgrade_errors = sorted(check for check in checks if check.startswith('UPGRADE_'))
+            if upgrade_errors and status.get('is_paused') and not paused_by_module:
+                fail_module(module, msg='Upgrade paused by cephadm: {}'.format(status.get('message') or ','.join(upgrade_errors)),
+                            upgrade_status=status, rc=1)
+
+            blocking = sorted(checks & pause_on_health)
+            if blocking and not status.get('is_paused'):
+                upgrade_cmd(module, 'pause')
+                paused_by_module = blocking
+            elif not blocking and paused_by_module:
+                upgrade_cmd(module, 'resume')
+                paused_by_module = []
+            status['paused_by_module'] = paused_by_module
+
+        if elapsed >= timeout:
+            fail_module(module, msg='Timed out after {}s waiting for the upgrade to complete.'.format(timeout),
+                        upgrade_status=status, rc=1)
+
+        time.sleep(interval)
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            target_image=dict(type='str', required=False),
+            state=dict(type='str',
+                       required=False,
+                       choices=['started', 'paused', 'resumed', 'stopped'],
+                       default='started'),
+            daemon_types=dict(type='list', elements='str', required=False, default=[]),
+            hosts=dict(type='list', elements='str', required=False, default=[]),
+            services=dict(type='list', elements='str', required=False, default=[]),
+            limit=dict(type='int', required=False),
+            wait=dict(type=bool, required=False, default=False),
+            wait_timeout=dict(type='int', required=False, default=14400),
+            poll_interval=dict(type='int', required=False, default=30),
+            pause_on_health=dict(type='list', elements='str', required=False, default=[])
+        ),
+        supports_check_mode=True,
+        required_if=[['state', 'started', ['target_image']]]
+    )
+
+    state = module.params.get('state')
+    target_image = module.params.get('target_image')
+    daemon_types = module.params.get('daemon_types')
+    hosts = module.params.get('hosts')
+    services = module.params.get('services')
+
+    startd = datetime.datetime.now()
+    changed = False
+    rc, out, err = 0, '', ''
+    cmd: List[str] = []
+    extra: Dict[str, Any] = {}
+
+    if state == 'started':
+        status, check, daemons = get_upgrade_state(module, target_image, bool(hosts or services))
+        pending = get_pending_daemons(check, daemons, daemon_types, hosts, services)
+        extra['pending'] = pending
+
+        if status.get('in_progress'):
+            if status.get('target_image') not in [target_image, check.get('target_name'), check.get('target_digest')]:
+                fatal('An upgrade to {} is already in progress.'.format(status.get('target_image')), module)
+            out = 'Upgrade to {} already in progress.'.format(target_image)
+        elif not pending:
+            out = 'All daemons already run {}.'.format(check.get('target_digest') or target_image)
+        elif not module.check_mode:
+            rc, cmd, out, err = upgrade_cmd(module, 'start')
+            changed = True
+        else:
+            changed = True
+
+        if module.params.get('wait') and not module.check_mode and (changed or status.get('in_progress')):
+            status = wait_for_upgrade(module)
+    else:
+        rc, cmd, results, err = run_batch(module, [['ceph', 'orch', 'upgrade', 'status', '--format', 'json']])
+        if rc or results[0][0]:
+            fatal("Can't get the upgrade status: {}".format(results[0][1] or err), module)
+        status = parse_status(results[0][1])
+        action = dict(paused='pause', resumed='resume', stopped='stop')[state]
+        needed = dict(pause=status.get('in_progress') and not status.get('is_paused'),
+                      resume=status.get('in_progress') and status.get('is_paused'),
+                      stop=status.get('in_progress'))[action]
+        if not needed:
+            out = 'Upgrade already {} or not in progress, skipping.'.format(state)
+        elif not module.check_mode:
+            rc, cmd, out, err = upgrade_cmd(module, action)
+            changed = True
+        else:
+            changed = True
+
+    extra['upgrade_status'] = status
+
+    exit_module(
+        module=module,
+        out=out,
+        rc=rc,
+        cmd=cmd,
+        err=err,
+        startd=startd,
+        changed=changed,
+        **extra
+    )
+
+
+if __name__ == '__main__':
+    main()
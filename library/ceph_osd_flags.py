@@ -0,0 +1,284 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal, run_batch  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal, run_batch
+import datetime
+import json
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_osd_flags
+short_description: set or unset osd flags
+version_added: "2.9"
+description:
+    - Set or unset osd flags (eg. noout, norebalance, norecover)
+      cluster-wide (`ceph osd set|unset`) or on some OSDs or CRUSH
+      nodes only (`ceph osd set-group|unset-group`).
+    - The current flags are read from `ceph osd dump`, only the flags
+      which aren't already in the requested state are changed, within
+      a single shell.
+    - The flags actually changed are returned in 'flags_changed', which
+      can be passed to 'restore' to revert exactly those changes once
+      the disruptive operation is done.
+options:
+    fsid:
+        description:
+            - the fsid of the Ceph cluster to interact with.
+        required: false
+    image:
+        description:
+            - The Ceph container image to use.
+        required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    flags:
+        description:
+            - the flags to set or unset. Only noup, nodown, noin and noout
+              can be set on OSDs or CRUSH nodes.
+        required: false
+    targets:
+        description:
+            - the OSDs (eg. 'osd.3' or '3') or CRUSH nodes (eg. a host or
+              a rack) to set the flags on. Default is cluster-wide.
+        required: false
+    state:
+        description:
+            - If 'present', the flags are set.
+            - If 'absent', the flags are unset.
+            - If 'restored', the changes listed in 'restore' are reverted.
+        required: false
+        default: present
+    restore:
+        description:
+            - the 'flags_changed' returned by a previous run of the
+              module, when state is 'restored'.
+        required: false
+'''
+
+EXAMPLES = '''
+- name: set noout on osd.3 while it's down
+  ceph_osd_flags:
+    flags:
+      - noout
+    targets:
+      - osd.3
+  register: osd_flags
+
+- name: restore the flags
+  ceph_osd_flags:
+    state: restored
+    restore: "{{ osd_flags.flags_changed }}"
+
+- name: set noout and norebalance cluster-wide
+  ceph_osd_flags:
+    flags:
+      - noout
+      - norebalance
+'''
+
+RETURN = '''
+flags_changed:
+    description:
+        - the changes made, a list of dicts with the 'flag', the 'target'
+          (null for a cluster-wide flag) and the 'action' (set or unset).
+    returned: always
+    type: list
+'''
+
+# the flags which can be set with `ceph osd set-group`
+GROUP_FLAGS = ['noup', 'nodown', 'noin', 'noout']
+
+
+def normalize_target(target: str) -> str:
+    if target.isdigit():
+        return 'osd.{}'.format(target)
+    return target
+
+
+def get_flags(dump: Dict[str, Any], target: Optional[str]) -> List[str]:
+    '''
+    The flags set cluster-wide (`target` is None), on an OSD or on a
+    CRUSH node according to `ceph osd dump`.
+    '''
+    if target is None:
+        if 'flags_set' in dump:
+            return dump['flags_set']
+        return [flag for flag in dump.get('flags', '').split(',') if flag]
+    if target.startswith('osd.') and target[4:].isdigit():
+        for osd in dump.get('osds', []):
+            if osd.get('osd') == int(target[4:]):
+                return osd.get('state', [])
+        raise KeyError(target)
+    return dump.get('crush_node_flags', {}).get(target, [])
+
+
+def plan_changes(dump: Dict[str, Any], changes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    '''
+    Keep the changes which aren't already applied.
+    '''
+    return [change for change in changes
+            if (change['flag'] in get_flags(dump, change['target'])) != (change['action'] == 'set')]
+
+
+def build_cmds(changes: List[Dict[str, Any]]) -> List[List[str]]:
+    cmds = []
+    groups: Dict[Any, List[str]] = {}
+    for change in changes:
+        if change['target'] is None:
+            cmds.append(['ceph', 'osd', change['action'], change['flag']])
+        else:
+            groups.setdefault((change['action'], change['target']), []).append(change['flag'])
+    for (action, target), flags in groups.items():
+        cmds.append(['ceph', 'osd', '{}-group'.format(action), ','.join(flags), target])
+    return cmds
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            flags=dict(type='list', elements='str', required=False, default=[]),
+            targets=dict(type='list', elements='str', required=False, default=[]),
+            state=dict(type='str', required=False, choices=['present', 'absent', 'restored'], default='present'),
+            restore=dict(type='list', elements='dict', required=False, default=[])
+        ),
+        supports_check_mode=True,
+        required_if=[['state', 'present', ['flags']],
+                     ['state', 'absent', ['flags']]]
+    )
+
+    flags = module.params.get('flags')
+    targets: List[Optional[str]] = [normalize_target(target) for target in module.params.get('targets')]
+    state = module.params.get('state')
+
+    if state == 'restored':
+        changes = [dict(flag=change['flag'],
+                        target=change.get('target'),
+                        action='unset' if change.get('action', 'set') == 'set' else 'set')
+                   for change in module.params.get('restore')]
+    else:
+        if targets:
+            invalid = [flag for flag in flags if flag not in GROUP_FLAGS]
+            if invalid:
+                fatal("Flag(s) {} can't be set on OSDs or CRUSH nodes, only {} can.".format(', '.join(invalid), ', '.join(GROUP_FLAGS)), module)
+        action = 'set' if state == 'present' else 'unset'
+        changes = [dict(flag=flag, target=target, action=action) for target in targets or [None] for flag in flags]
+
+    startd = datetime.datetime.now()
+
+    rc, cmd, results, err = run_batch(module, [['ceph', 'osd', 'dump', '--format', 'json']])
+    if rc or results[0][0]:
+        fatal("Can't get the osd flags: {}".format(results[0][1] or err), module)
+    try:
+        changes = plan_changes(json.loads(results[0][1]), changes)
+    except KeyError as e:
+        fatal('Unknown OSD: {}'.format(e.args[0]), module)
+
+    out = ''
+    if changes and not module.check_mode:
+        rc, cmd, results, err = run_batch(module, build_cmds(changes))
+        failed = [out.strip() or err for _rc, out in results if rc or _rc]
+        if failed:
+            fatal("Can't change the osd flags: {}".format('; '.join(failed)), module)
+        out = '\n'.join(out for _rc, out in results if out)
+
+    exit_module(
+        module=module,
+        out=out,
+        rc=rc,
+        cmd=cmd,
+        err=err,
+        startd=startd,
+        changed=bool(changes),
+        flags_changed=changes
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import (exit_module, fatal, run_batch, iter_json_array,  # type: ignore
+                                                  build_config_index, lookup_config, normalize_config_value, fail_module)
+except ImportError:
+    from module_utils.ceph_common import (exit_module, fatal, run_batch, iter_json_array,  # type: ignore
+                                          build_config_index, lookup_config, normalize_config_value, fail_module)
+import datetime
+import json
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_osd_memory_target
+short_description: compute and set osd_memory_target per host
+version_added: "2.9"
+description:
+    - Compute osd_memory_target for each host from its total memory,
+      its number of OSDs and the other daemons it runs, then set it
+      as 'osd/host:<hostname>' option. Only the values which differ
+      from the current configuration are set, within a single shell.
+    - This is an alternative to the cephadm osd_memory_target_autotune
+      feature, both shouldn't be enabled at the same time.
+    - In check mode, the targets are computed and reported but not set.
+options:
+    fsid:
+        description:
+            - the fsid of the Ceph cluster to interact with.
+        required: false
+    image:
+        description:
+            - The Ceph container image to use.
+        required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    hosts:
+        description:
+            - only compute osd_memory_target for these hosts.
+              Default is all hosts running OSDs.
+        required: false
+    memory_total:
+        description:
+            - a mapping of hostname to total memory (bytes). By default,
+              the memory reported by 'ceph orch host ls --detail' is used.
+        required: false
+        default: {}
+    memory_ratio:
+        description:
+            - the fraction of the total memory that ceph daemons may use.
+        required: false
+        default: 0.7
+    reserved_memory:
+        description:
+            - a mapping of daemon type to the memory (bytes) to reserve for
+              each daemon of that type colocated with OSDs. It is merged
+              with the default values.
+        required: false
+        default: {}
+    min_target:
+        description:
+            - the lowest osd_memory_target to set. Hosts for which the
+              computed value is lower are reported and left untouched.
+        required: false
+        default: 939524096
+    max_target:
+        description:
+            - the highest osd_memory_target to set.
+        required: false
+'''
+
+EXAMPLES = '''
+- name: set osd_memory_target on all hosts
+  ceph_osd_memory_target:
+
+- name: keep more memory for the os and rgw
+  ceph_osd_memory_target:
+    memory_ratio: 0.6
+    reserved_memory:
+      rgw: 8589934592
+'''
+
+RETURN = '''
+targets:
+    description: the computed osd_memory_target of each host.
+    returned: always
+    type: dict
+'''
+
+MIB = 1024 * 1024
+GIB = 1024 * MIB
+
+DEFAULT_RESERVED_MEMORY = {
+    'mon': 2 * GIB,
+    'mgr': 4 * GIB,
+    'mds': 4 * GIB,
+    'rgw': 4 * GIB,
+    'crash': 128 * MIB,
+    'node-exporter': 128 * MIB,
+    'haproxy': 128 * MIB,
+    'keepalived': 128 * MIB,
+    'default': 1 * GIB
+}
+
+
+def get_cluster_state(module: "AnsibleModule") -> Dict[str, Any]:
+    rc, cmd, results, err = run_batch(module, [
+        ['ceph', 'orch', 'host', 'ls', '--detail', '--format', 'json'],
+        ['ceph', 'orch', 'ps', '--format', 'json'],
+        ['ceph', 'config', 'dump', '--format', 'json']
+    ])
+    (hosts_rc, hosts_out), (ps_rc, ps_out), (dump_rc, dump_out) = results
+
+    if rc or hosts_rc or ps_rc or dump_rc:
+        fatal("Can't get the current cluster state: {}".format(err or hosts_out or ps_out or dump_out), module)
+
+    daemons: Dict[str, List[str]] = {}
+    if ps_out.lstrip().startswith('['):
+        for daemon in iter_json_array(ps_out):
+            daemons.setdefault(daemon['hostname'], []).append(daemon['daemon_type'])
+
+    return dict(hosts=json.loads(hosts_out),
+                daemons=daemons,
+                config_index=build_config_index(json.loads(dump_out)))
+
+
+def compute_osd_memory_target(memory_total: int,
+                              daemons: List[str],
+                              memory_ratio: float,
+                              reserved_memory: Dict[str, int],
+                              max_target: Optional[int] = None) -> Optional[int]:
+    osds = daemons.count('osd')
+    if not osds:
+        return None
+
+    reserved = sum(reserved_memory.get(daemon, reserved_memory['default']) for daemon in daemons if daemon != 'osd')
+    target = int((memory_total * memory_ratio - reserved) / osds)
+    if max_target:
+        target = min(target, max_target)
+
+    # round down to the MiB
+    return target // MIB * MIB
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            hosts=dict(type='list', elements='str', required=False),
+            memory_total=dict(type='dict', required=False, default={}),
+            memory_ratio=dict(type='float', required=False, default=0.7),
+            reserved_memory=dict(type='dict', required=False, default={}),
+            min_target=dict(type='int', required=False, default=939524096),
+            max_target=dict(type='int', required=False)
+        ),
+        supports_check_mode=True
+    )
+
+    memory_total = module.params.get('memory_total')
+    reserved_memory = dict(DEFAULT_RESERVED_MEMORY, **module.params.get('reserved_memory'))
+    min_target = module.params.get('min_target')
+
+    startd = datetime.datetime.now()
+    changed = False
+
+    state = get_cluster_state(module)
+    hosts_memory = {host['hostname']: host.get('memory_total_kb', 0) * 1024 for host in state['hosts']}
+    hosts_memory.update({host: int(memory) for host, memory in memory_total.items()})
+    hosts = module.params.get('hosts') or sorted(host for host, daemons in state['daemons'].items() if 'osd' in daemons)
+
+    targets: Dict[str, Dict[str, Any]] = {}
+    to_set = []
+    skipped = []
+    for host in hosts:
+        daemons = state['daemons'].get(host, [])
+        target = None
+        if hosts_memory.get(host):
+            target = compute_osd_memory_target(hosts_memory[host],
+                                               daemons,
+                                               module.params.get('memory_ratio'),
+                                               reserved_memory,
+                                               module.params.get('max_target'))
+        current = lookup_config(state['config_index'], 'osd/host:{}'.format(host), 'osd_memory_target')
+        targets[host] = dict(memory_total=hosts_memory.get(host),
+                             osds=daemons.count('osd'),
+                             target=target,
+                             current=current,
+                             changed=False)
+        if target is None or target < min_target:
+            skipped.append(host)
+            continue
+        if current is None or normalize_config_value(current, 'size') != target:
+            targets[host]['changed'] = True
+            to_set.append(host)
+
+    rc, cmd, err = 0, [], ''
+    if to_set and not module.check_mode:
+        rc, cmd, results, err = run_batch(module,
+                                          [['ceph', 'config', 'set', 'osd/host:{}'.format(host), 'osd_memory_target', str(targets[host]['target'])]
+                                           for host in to_set])
+        failed = ['{}: {}'.format(host, out) for host, (_rc, out) in zip(to_set, results) if _rc]
+        if rc or failed:
+            fail_module(module, msg="Can't set osd_memory_target:\n{}".format('\n'.join(failed) or err),
+                        cmd=cmd, rc=rc or 1, targets=targets)
+    changed = bool(to_set)
+
+    out = 'osd_memory_target updated on {} host(s).'.format(len(to_set))
+    if skipped:
+        out += ' Skipped (no OSD, unknown memory or target lower than {}): {}'.format(min_target, ','.join(skipped))
+
+    exit_module(
+        module=module,
+        out=out,
+        rc=rc,
+        cmd=cmd,
+        err=err,
+        startd=startd,
+        changed=changed,
+        targets=targets
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional, Union
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal, run_batch  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal, run_batch
+import datetime
+import json
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_osd_perf
+short_description: capture osd performance metrics
+version_added: "2.9"
+description:
+    - Capture a few performance metrics of an OSD (`ceph tell osd.N bench`,
+      BlueStore/RocksDB perf counters and DB size) and optionally compare
+      them with a previous capture.
+    - When the bench runs, the perf counters are reset first
+      (`ceph tell osd.N perf reset all`) so that the latencies are
+      averages over the bench only and two captures (eg. before and
+      after a restart) measure the same workload. Otherwise, they are
+      averages since the OSD started.
+options:
+    fsid:
+        description:
+            - the fsid of the Ceph cluster to interact with.
+        required: false
+    image:
+        description:
+            - The Ceph container image to use.
+        required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    osd_id:
+        description:
+            - The id of the OSD.
+        required: true
+    bench:
+        description:
+            - reset the perf counters and run `ceph tell osd.N bench`
+              before dumping them. The module reports a change when
+              they run. Skipped in check mode.
+        required: false
+        default: true
+    bench_total_bytes:
+        description:
+            - the amount of data written by the bench.
+        required: false
+        default: 1073741824
+    bench_block_size:
+        description:
+            - the block size used by the bench.
+        required: false
+        default: 4194304
+    baseline:
+        description:
+            - the 'metrics' returned by a previous run of this module.
+              When set, a comparison is returned in 'comparison'.
+        required: false
+'''
+
+EXAMPLES = '''
+- name: capture osd.0 metrics before a change
+  ceph_osd_perf:
+    osd_id: 0
+  register: perf_before
+
+- name: capture osd.0 metrics after the change and compare
+  ceph_osd_perf:
+    osd_id: 0
+    baseline: "{{ perf_before.metrics }}"
+  register: perf_after
+'''
+
+RETURN = '''
+metrics:
+    description: the captured metrics.
+    returned: always
+    type: dict
+comparison:
+    description: for each metric, the value before, after and the relative change (percent).
+    returned: when baseline is set
+    type: dict
+'''
+
+
+def get_avg(counter: Any) -> Optional[float]:
+    if isinstance(counter, dict):
+        if counter.get('avgcount'):
+            return counter['sum'] / counter['avgcount']
+        return None
+    return counter
+
+
+def extract_metrics(bench: Optional[Dict[str, Any]], perf_dump: Dict[str, Any]) -> Dict[str, Union[int, float, None]]:
+    rocksdb = perf_dump.get('rocksdb', {})
+    bluefs = perf_dump.get('bluefs', {})
+    bluestore = perf_dump.get('bluestore', {})
+    metrics: Dict[str, Union[int, float, None]] = dict(
+        rocksdb_get_latency=get_avg(rocksdb.get('get_latency')),
+        rocksdb_submit_latency=get_avg(rocksdb.get('submit_latency')),
+        rocksdb_compact=rocksdb.get('compact'),
+        rocksdb_compact_range=rocksdb.get('compact_range'),
+        bluestore_kv_commit_latency=get_avg(bluestore.get('kv_commit_lat')),
+        bluefs_db_total_bytes=bluefs.get('db_total_bytes'),
+        bluefs_db_used_bytes=bluefs.get('db_used_bytes'),
+        bluefs_slow_used_bytes=bluefs.get('slow_used_bytes')
+    )
+    if bench:
+        metrics['bench_bytes_per_sec'] = bench.get('bytes_per_sec')
+        metrics['bench_iops'] = bench.get('iops')
+    return metrics
+
+
+def compare_metrics(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    comparison = {}
+    for name, value in after.items():
+        previous = before.get(name)
+        change = None
+        if isinstance(value, (int, float)) and isinstance(previous, (int, float)) and previous:
+            change = round((value - previous) / previous * 100, 2)
+        comparison[name] = dict(before=previous, after=value, change_pct=change)
+    return comparison
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            osd_id=dict(type='int', required=True),
+            bench=dict(type=bool, required=False, default=True),
+            bench_total_bytes=dict(type='int', required=False, default=1073741824),
+            bench_block_size=dict(type='int', required=False, default=4194304),
+            baseline=dict(type='dict', required=False)
+        ),
+        supports_check_mode=True
+    )
+
+    osd = 'osd.{}'.format(module.params.get('osd_id'))
+    # the bench writes data to the OSD and the counters are reset
+    bench = module.params.get('bench') and not module.check_mode
+    baseline = module.params.get('baseline')
+
+    startd = datetime.datetime.now()
+
+    cmds: List[List[str]] = []
+    if bench:
+        cmds.append(['ceph', 'tell', osd, 'perf', 'reset', 'all'])
+        cmds.append(['ceph', 'tell', osd, 'bench',
+                     str(module.params.get('bench_total_bytes')),
+                     str(module.params.get('bench_block_size')),
+                     '--format', 'json'])
+    cmds.append(['ceph', 'tell', osd, 'perf', 'dump', '--format', 'json'])
+
+    rc, cmd, results, err = run_batch(module, cmds)
+    for _rc, out in results:
+        if rc or _rc:
+            fatal("Can't capture performance metrics of {}: {}".format(osd, out or err), module)
+
+    bench_result = json.loads(results[1][1]) if bench else None
+    metrics = extract_metrics(bench_result, json.loads(results[-1][1]))
+
+    extra: Dict[str, Any] = dict(metrics=metrics)
+    if baseline:
+        extra['comparison'] = compare_metrics(baseline, metrics)
+
+    exit_module(
+        module=module,
+        out='',
+        rc=rc,
+        cmd=cmd,
+        err=err,
+        startd=startd,
+        changed=bool(bench),
+        **extra
+    )
+
+
+if __name__ == '__main__':
+    main()
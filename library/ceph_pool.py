@@ -0,0 +1,385 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Tuple
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal, run_batch  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal, run_batch
+import datetime
+import json
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: ceph_pool
+short_description: manage ceph pools
+version_added: "2.9"
+description:
+    - Create or update a list of pools (replicated or erasure coded).
+    - The current pools are read once (`ceph osd pool ls detail`) and
+      only the differences are applied, within a single shell.
+    - The pg_num of the new pools is computed from the number of OSDs,
+      'target_pgs_per_osd', the size of the pool and its
+      'target_size_ratio' (rounded to the nearest power of two), the
+      same way the pg autoscaler does, so that they don't start with a
+      bad number of placement groups. The capacity is shared with the
+      existing pools: the ratios of all the pools are normalized when
+      their sum is greater than 1 and the 'bulk' pools without a ratio
+      share the capacity left by the ratios. The pg_num of the
+      existing pools is left to the autoscaler unless 'pg_num' is set.
+options:
+    fsid:
+        description:
+            - the fsid of the Ceph cluster to interact with.
+        required: false
+    image:
+        description:
+            - The Ceph container image to use.
+        required: false
+    max_concurrency:
+        description:
+            - the maximum number of commands run at the same time against
+              the cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    rate_limit:
+        description:
+            - the maximum number of commands per second run against the
+              cluster from the host executing the module. The limit is
+              shared by all the modules targeting the same fsid.
+              Default is unlimited.
+        required: false
+    metrics_dir:
+        description:
+            - the directory where the execution metrics of the module
+              (duration, commands, retries, changed/failed runs) are
+              written in Prometheus textfile format, eg. the directory
+              of the node_exporter textfile collector.
+        required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run. When
+              exceeded, the process group of the command (including the
+              container) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Commands
+              still running when it is exceeded are killed the same way.
+              Default is unlimited.
+        required: false
+    cephadm_inprocess:
+        description:
+            - import cephadm within the module process and call it
+              directly rather than starting a new interpreter for each
+              command. It falls back to running cephadm as a command when
+              the installed version can't be imported or when a timeout
+              is set. The calls, the import time and the time saved
+              (the estimated interpreter startup and import of each
+              call, less the single import) are reported in
+              'cephadm_inprocess'.
+        required: false
+        default: false
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    pools:
+        description:
+            - the pools to manage, each one with the following keys.
+            - 'name' (required).
+            - 'type': 'replicated' (default) or 'erasure'.
+            - 'size', 'min_size': the number of replicas (replicated
+              pools only) and the minimum number of replicas/chunks to
+              serve I/O.
+            - 'erasure_profile': the erasure code profile of an erasure
+              coded pool. Default is 'default'.
+            - 'rule_name': the CRUSH rule of a new pool.
+            - 'application': the application enabled on the pool (eg.
+              rbd, rgw, cephfs).
+            - 'target_size_ratio': the expected fraction of the cluster
+              capacity the pool will use.
+            - 'bulk': whether the pool is expected to be large.
+            - 'pg_autoscale_mode': 'on', 'off' or 'warn'.
+            - 'pg_num': the number of placement groups, overrides the
+              planned value.
+        required: true
+    target_pgs_per_osd:
+        description:
+            - the number of placement group replicas per OSD targeted by
+              the pg_num planner.
+        required: false
+        default: 100
+'''
+
+EXAMPLES = '''
+- name: create the openstack pools
+  ceph_pool:
+    pools:
+      - name: images
+        application: rbd
+        target_size_ratio: 0.2
+      - name: volumes
+        application: rbd
+        target_size_ratio: 0.6
+        bulk: true
+      - name: backups
+        type: erasure
+        erasure_profile: ec42
+        application: rbd
+'''
+
+RETURN = '''
+pools:
+    description:
+        - for each pool, its 'name', the 'action' taken (created, updated,
+          or none) and the settings changed ('changes', a mapping
+          of setting to [before, after]).
+    returned: always
+    type: list
+pg_plan:
+    description: the pg_num computed for each new pool.
+    returned: always
+    type: dict
+'''
+
+# osd_pool_default_pg_num
+DEFAULT_PG_NUM = 32
+POOL_TYPES = {1: 'replicated', 3: 'erasure'}
+
+
+def nearest_power_of_two(n: float) -> int:
+    '''
+    Round `n` to the nearest power of two (same as the pg autoscaler).
+    '''
+    if n <= 1:
+        return 1
+    lower = 1 << (int(n).bit_length() - 1)
+    upper = lower << 1
+    return lower if n - lower <= upper - n else upper
+
+
+def plan_pg_num(pools: List[Dict[str, Any]],
+                existing: List[Dict[str, Any]],
+                osd_count: int,
+                target_pgs_per_osd: int) -> Dict[str, int]:
+    '''
+    Compute the pg_num of each new pool of `pools` (dicts with 'name',
+    'pool_size' ie. replicas or k+m, and the optional
+    'target_size_ratio' and 'bulk'). The capacity is shared with the
+    `existing` pools (dicts with 'target_size_ratio' and 'bulk'):
+    the ratios of all the pools are normalized when their sum is
+    greater than 1 and the bulk pools without a ratio share the
+    capacity the ratios leave. The other pools get DEFAULT_PG_NUM.
+    '''
+    all_pools = pools + existing
+    total_ratio = sum(pool.get('target_size_ratio') or 0 for pool in all_pools)
+    bulk_pools = len([pool for pool in all_pools if pool.get('bulk') and not pool.get('target_size_ratio')])
+    plan = {}
+    for pool in pools:
+        ratio = pool.get('target_size_ratio') or 0
+        if ratio and total_ratio > 1:
+            ratio = ratio / total_ratio
+        elif not ratio and pool.get('bulk'):
+            ratio = max(0.0, 1 - total_ratio) / bulk_pools
+        if not ratio or not osd_count:
+            plan[pool['name']] = DEFAULT_PG_NUM
+            continue
+        target = ratio * osd_count * target_pgs_per_osd / max(pool['pool_size'], 1)
+        plan[pool['name']] = max(nearest_power_of_two(target), DEFAULT_PG_NUM)
+    return plan
+
+
+def get_state(module: "AnsibleModule", profiles: List[str]) -> Tuple[Dict[str, Dict[str, Any]], int, Dict[str, Dict[str, Any]]]:
+    '''
+    Return the current pools, the number of OSDs and the erasure code
+    profiles `profiles`.
+    '''
+    cmds = [['ceph', 'osd', 'pool', 'ls', 'detail', '--format', 'json'],
+            ['ceph', 'osd', 'stat', '--format', 'json']]
+    cmds.extend(['ceph', 'osd', 'erasure-code-profile', 'get', profile, '--format', 'json'] for profile in profiles)
+    rc, cmd, results, err = run_batch(module, cmds)
+    for _rc, out in results:
+        if rc or _rc:
+            fatal("Can't get the current pools: {}".format(out or err), module)
+
+    pools = {pool['pool_name']: pool for pool in json.loads(results[0][1])}
+    osd_stat = json.loads(results[1][1])
+    # `osd stat` has been moved to 'osdmap' with pacific
+    osd_count = osd_stat.get('osdmap', osd_stat).get('num_osds', 0)
+    ec_profiles = {profile: json.loads(out) for profile, (_rc, out) in zip(profiles, results[2:])}
+    return pools, osd_count, ec_profiles
+
+
+def current_settings(pool: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(size=pool.get('size'),
+                min_size=pool.get('min_size'),
+                pg_num=pool.get('pg_num_target', pool.get('pg_num')),
+                pg_autoscale_mode=pool.get('pg_autoscale_mode'),
+                target_size_ratio=float(pool.get('options', {}).get('target_size_ratio', 0)),
+                bulk='bulk' in (pool.get('flags_names') or '').split(','))
+
+
+def diff_pool(pool: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, List[Any]]:
+    '''
+    The settings of `pool` which differ from `current`.
+    '''
+    settings = current_settings(current)
+    changes = {}
+    for key in ['size', 'min_size', 'pg_num', 'pg_autoscale_mode', 'target_size_ratio', 'bulk']:
+        wanted = pool.get(key)
+        if wanted is None or (key == 'size' and pool['type'] == 'erasure'):
+            continue
+        if key == 'target_size_ratio':
+            wanted = float(wanted)
+        if wanted != settings[key]:
+            changes[key] = [settings[key], wanted]
+    application = pool.get('application')
+    if application and application not in current.get('application_metadata', {}):
+        changes['application'] = [sorted(current.get('application_metadata', {})), application]
+    return changes
+
+
+def set_cmds(name: str, changes: Dict[str, List[Any]]) -> List[List[str]]:
+    cmds = []
+    for key, (before, after) in changes.items():
+        if key == 'application':
+            cmds.append(['ceph', 'osd', 'pool', 'application', 'enable', name, after])
+        else:
+            value = str(after).lower() if isinstance(after, bool) else str(after)
+            cmds.append(['ceph', 'osd', 'pool', 'set', name, key, value])
+    return cmds
+
+
+def pool_size(pool: Dict[str, Any], ec_profiles: Dict[str, Dict[str, Any]]) -> int:
+    if pool['type'] == 'erasure':
+        profile = ec_profiles.get(pool.get('erasure_profile') or 'default', {})
+        return int(profile.get('k', 2)) + int(profile.get('m', 1))
+    return pool.get('size') or 3
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            fsid=dict(type='str', required=False),
+            image=dict(type='str', required=False),
+            max_concurrency=dict(type='int', required=False),
+            rate_limit=dict(type='float', required=False),
+            metrics_dir=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False),
+            cephadm_inprocess=dict(type=bool, required=False, default=False),
+            docker=dict(type=bool,
+                        required=False,
+                        default=False),
+            pools=dict(type='list', elements='dict', required=True,
+                       options=dict(name=dict(type='str', required=True),
+                                    type=dict(type='str', required=False, choices=['replicated', 'erasure'], default='replicated'),
+                                    size=dict(type='int', required=False),
+                                    min_size=dict(type='int', required=False),
+                                    erasure_profile=dict(type='str', required=False),
+                                    rule_name=dict(type='str', required=False),
+                                    application=dict(type='str', required=False),
+                                    target_size_ratio=dict(type='float', required=False),
+                                    bulk=dict(type='bool', required=False),
+                                    pg_autoscale_mode=dict(type='str', required=False, choices=['on', 'off', 'warn']),
+                                    pg_num=dict(type='int', required=False))),
+            target_pgs_per_osd=dict(type='int', required=False, default=100)
+        ),
+        supports_check_mode=True
+    )
+
+    pools = module.params.get('pools')
+    startd = datetime.datetime.now()
+
+    profiles = sorted(set(pool.get('erasure_profile') or 'default' for pool in pools if pool['type'] == 'erasure'))
+    current, osd_count, ec_profiles = get_state(module, profiles)
+
+    new_pools = [dict(name=pool['name'], pool_size=pool_size(pool, ec_profiles),
+                      target_size_ratio=pool.get('target_size_ratio'), bulk=pool.get('bulk'))
+                 for pool in pools if pool['name'] not in current]
+    # the existing pools as they will be once updated
+    wanted = {pool['name']: pool for pool in pools}
+    existing = []
+    for name, detail in current.items():
+        settings = current_settings(detail)
+        for key in ['target_size_ratio', 'bulk']:
+            if wanted.get(name, {}).get(key) is not None:
+                settings[key] = wanted[name][key]
+        existing.append(settings)
+    pg_plan = plan_pg_num(new_pools, existing, osd_count, module.params.get('target_pgs_per_osd'))
+
+    cmds = []
+    report = []
+    for pool in pools:
+        name = pool['name']
+        changes: Dict[str, List[Any]] = {}
+        if name not in current:
+            action = 'created'
+            pg_num = pool.get('pg_num') or pg_plan[name]
+            cmd = ['ceph', 'osd', 'pool', 'create', name, str(pg_num), str(pg_num), pool['type']]
+            if pool['type'] == 'erasure':
+                cmd.append(pool.get('erasure_profile') or 'default')
+            if pool.get('rule_name'):
+                cmd.append(pool['rule_name'])
+            cmds.append(cmd)
+            changes = diff_pool(dict(pool, pg_num=None), dict(pool_name=name, pg_num=pg_num))
+            cmds.extend(set_cmds(name, changes))
+        else:
+            current_type = POOL_TYPES.get(int(current[name].get('type', 1)), pool['type'])
+            if pool['type'] != current_type:
+                fatal("Pool {} is {}, it can't be changed to {}.".format(name, current_type, pool['type']), module)
+            changes = diff_pool(pool, current[name])
+            action = 'updated' if changes else 'none'
+            cmds.extend(set_cmds(name, changes))
+        report.append(dict(name=name, action=action, changes=changes))
+
+    rc, cmd, out, err = 0, ['ceph', 'osd', 'pool', 'ls', 'detail'], '', ''
+    if cmds and not module.check_mode:
+        rc, cmd, results, err = run_batch(module, cmds)
+        failed = ['{}: {}'.format(' '.join(_cmd[3:6]), _out.strip() or err) for _cmd, (_rc, _out) in zip(cmds, results) if rc or _rc]
+        if failed:
+            fatal("Can't update the pools: {}".format('; '.join(failed)), module)
+        out = '\n'.join(_out for _rc, _out in results if _out)
+
+    exit_module(
+        module=module,
+        out=out,
+        rc=rc,
+        cmd=cmd,
+        err=err,
+        startd=startd,
+        changed=bool(cmds),
+        pools=report,
+        pg_plan=pg_plan
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -21,9 +21,9 @@ __metaclass__ = type
 
 from ansible.module_utils.basic import AnsibleModule  # type: ignore
 try:
-    from ansible.module_utils.ceph_common import exit_module  # type: ignore
+    from ansible.module_utils.ceph_common import exit_module, run_command  # type: ignore
 except ImportError:
-    from module_utils.ceph_common import exit_module
+    from module_utils.ceph_common import exit_module, run_command
 import datetime
 import os
 
@@ -124,6 +124,18 @@ options:
         description:
             - subnet to use for cluster replication, recovery and heartbeats.
         required: false
+    command_timeout:
+        description:
+            - the maximum time (in seconds) the bootstrap may run. When
+              exceeded, the process group of cephadm (including the
+              containers) is killed and the module fails with the output
+              collected so far. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Default is
+              unlimited.
+        required: false
 author:
     - Dimitri Savineau <dsavinea@redhat.com>
     - Teoman ONAY <tonay@ibm.com>
@@ -168,6 +180,11 @@ def run_module() -> None:
         dashboard_user=dict(type='str', required=False),
     )
 
+    timeout_params = dict(
+        command_timeout=dict(type='int', required=False),
+        module_timeout=dict(type='int', required=False),
+    )
+
     cephadm_params = dict(
         docker=dict(type='bool', required=False, default=False),
         image=dict(type='str', required=False),
@@ -243,7 +260,8 @@ def run_module() -> None:
     module = AnsibleModule(
         argument_spec={**cephadm_params,
                        **cephadm_bootstrap_params,
-                       **backward_compat},
+                       **backward_compat,
+                       **timeout_params},
         supports_check_mode=True,
         mutually_exclusive=[
             ('registry_json', 'registry_url'),
@@ -351,7 +369,7 @@ def run_module() -> None:
             changed=False
         )
     else:
-        rc, out, err = module.run_command(cmd)
+        rc, out, err = run_command(module, cmd)
         exit_module(
             module=module,
             out=out,
@@ -0,0 +1,430 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Callable, Dict, List, Optional, Tuple
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal
+import datetime
+import errno
+import mmap
+import os
+import random
+import statistics
+import threading
+import time
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: cephadm_disk_benchmark
+short_description: qualify the candidate OSD devices of a host
+version_added: "2.9"
+description:
+    - Run a short, time limited benchmark on each device (sequential
+      read and 4k random read, with O_DIRECT when the device supports
+      it) and report the devices which are much slower than the other
+      devices of the same model.
+    - The read tests don't modify the devices. The optional sequential
+      write test only runs on empty devices, ie. without partitions,
+      holders, mounts or any signature reported by `blkid -p`.
+    - Block devices, loop devices and regular files can be tested.
+options:
+    devices:
+        description:
+            - the devices to test. Default is all the whole disks of the
+              host without partitions, holders or mounts.
+        required: false
+    runtime:
+        description:
+            - how long (in seconds) each test runs on each device.
+        required: false
+        default: 5
+    block_size:
+        description:
+            - the block size (in bytes) of the sequential tests.
+        required: false
+        default: 1048576
+    iodepth:
+        description:
+            - the number of concurrent 4k random reads.
+        required: false
+        default: 4
+    write:
+        description:
+            - also run a sequential write test (zeros) on the empty
+              devices.
+        required: false
+        default: false
+    outlier_threshold:
+        description:
+            - a device is reported as an outlier when one of its results
+              is lower than the median of the devices of the same model
+              (or the 'baseline') by more than this fraction.
+        required: false
+        default: 0.2
+    baseline:
+        description:
+            - a mapping of device model to reference results
+              (seq_read_mbps, rand_read_iops, seq_write_mbps), eg. the
+              results of a known good host. It is used rather than the
+              median of the devices of the host, which requires at least
+              two devices of the same model.
+        required: false
+    min_seq_read_mbps:
+        description:
+            - report the devices whose sequential read throughput (MB/s)
+              is lower than this value.
+        required: false
+    min_rand_read_iops:
+        description:
+            - report the devices whose 4k random read IOPS are lower than
+              this value.
+        required: false
+'''
+
+EXAMPLES = '''
+- name: benchmark the candidate devices
+  cephadm_disk_benchmark:
+    runtime: 10
+  register: disk_benchmark
+
+- name: fail when a device is an outlier
+  fail:
+    msg: "{{ disk_benchmark.outliers }}"
+  when: disk_benchmark.outliers | length > 0
+'''
+
+RETURN = '''
+devices:
+    description:
+        - the results of each device (path, model, size, rotational,
+          direct, seq_read_mbps, rand_read_iops, rand_read_latency_ms,
+          seq_write_mbps) and the reasons why it is an outlier, if any.
+    returned: always
+    type: list
+outliers:
+    description: the devices reported as outliers.
+    returned: always
+    type: list
+'''
+
+RANDOM_BLOCK_SIZE = 4096
+METRICS = ['seq_read_mbps', 'rand_read_iops', 'seq_write_mbps']
+# the devices never selected by default
+EXCLUDED_PREFIXES = ('loop', 'ram', 'zram', 'sr', 'dm-', 'md', 'nbd', 'rbd', 'fd')
+
+
+class DirectIOUnsupported(Exception):
+    pass
+
+
+def read_sysfs(path: str) -> str:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except IOError:
+        return ''
+
+
+def mounted_devices() -> List[str]:
+    try:
+        with open('/proc/self/mounts') as f:
+            return [os.path.realpath(line.split()[0]) for line in f if line.startswith('/')]
+    except IOError:
+        return []
+
+
+def device_info(path: str, mounts: List[str]) -> Dict[str, Any]:
+    real = os.path.realpath(path)
+    name = os.path.basename(real)
+    sysfs = os.path.join('/sys/class/block', name)
+    is_block = os.path.exists(sysfs)
+    partitions = [entry for entry in os.listdir(sysfs) if entry.startswith(name)] if is_block else []
+    holders = os.listdir(os.path.join(sysfs, 'holders')) if os.path.isdir(os.path.join(sysfs, 'holders')) else []
+    rotational = read_sysfs(os.path.join(sysfs, 'queue', 'rotational'))
+    return dict(path=path,
+                model=read_sysfs(os.path.join(sysfs, 'device', 'model')) or ('loop' if name.startswith('loop') else ''),
+                rotational=rotational == '1' if rotational else None,
+                partitions=partitions,
+                holders=holders,
+                mounted=real in mounts or any('/dev/' + part in mounts for part in partitions))
+
+
+def discover_devices(mounts: List[str]) -> List[str]:
+    devices = []
+    for name in sorted(os.listdir('/sys/block')):
+        if name.startswith(EXCLUDED_PREFIXES) or read_sysfs(os.path.join('/sys/block', name, 'size')) in ['', '0']:
+            continue
+        info = device_info('/dev/' + name, mounts)
+        if not (info['partitions'] or info['holders'] or info['mounted']):
+            devices.append('/dev/' + name)
+    return devices
+
+
+def is_empty(module: "AnsibleModule", info: Dict[str, Any]) -> bool:
+    if info['partitions'] or info['holders'] or info['mounted']:
+        return False
+    blkid = module.get_bin_path('blkid')
+    if not blkid:
+        return False
+    rc, out, err = module.run_command([blkid, '-p', info['path']])
+    # 2: no signature found
+    return rc == 2
+
+
+def device_size(path: str) -> int:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.close(fd)
+
+
+def run_io(path: str,
+           write: bool,
+           direct: bool,
+           block_size: int,
+           runtime: float,
+           next_offset: Callable[[int], int]) -> Tuple[int, int, float]:
+    '''
+    Read (or write) `block_size` blocks at the offsets returned by
+    `next_offset(previous_offset)` for `runtime` seconds.
+    Return the number of bytes, of I/Os and the total latency.
+    '''
+    flags = os.O_WRONLY if write else os.O_RDONLY
+    if direct:
+        flags |= getattr(os, 'O_DIRECT', 0)
+    try:
+        fd = os.open(path, flags)
+    except OSError as e:
+        if direct and e.errno == errno.EINVAL:
+            raise DirectIOUnsupported()
+        raise
+    # an anonymous mmap is page aligned, as required by O_DIRECT
+    buf = mmap.mmap(-1, block_size)
+    total, ios, latency = 0, 0, 0.0
+    offset = -1
+    try:
+        if not direct and not write:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        deadline = time.monotonic() + runtime
+        while True:
+            offset = next_offset(offset)
+            start = time.monotonic()
+            try:
+                done = os.pwritev(fd, [buf], offset) if write else os.preadv(fd, [buf], offset)
+            except OSError as e:
+                if direct and e.errno == errno.EINVAL and not ios:
+                    raise DirectIOUnsupported()
+                raise
+            end = time.monotonic()
+            total += done
+            ios += 1
+            latency += end - start
+            if end >= deadline:
+                break
+        if write:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+        buf.close()
+    return total, ios, latency
+
+
+def sequential(size: int, block_size: int) -> Callable[[int], int]:
+    def next_offset(previous: int) -> int:
+        offset = previous + block_size if previous >= 0 else 0
+        return 0 if offset + block_size > size else offset
+    return next_offset
+
+
+def randomized(size: int, block_size: int, seed: int) -> Callable[[int], int]:
+    rnd = random.Random(seed)
+    blocks = max(size // block_size, 1)
+    return lambda previous: rnd.randrange(blocks) * block_size
+
+
+def run_test(path: str,
+             write: bool,
+             direct: bool,
+             block_size: int,
+             runtime: float,
+             size: int,
+             jobs: int = 1) -> Tuple[int, int, float, float]:
+    '''
+    Run `jobs` concurrent I/O loops, sequential when `jobs` is 1 and
+    random otherwise. Return the number of bytes, of I/Os, the total
+    latency and the elapsed time.
+    '''
+    results: List[Any] = [None] * jobs
+
+    def job(i: int) -> None:
+        try:
+            pattern = sequential(size, block_size) if jobs == 1 else randomized(size, block_size, i)
+            results[i] = run_io(path, write, direct, block_size, runtime, pattern)
+        except Exception as e:
+            results[i] = e
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=job, args=(i,)) for i in range(jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return sum(r[0] for r in results), sum(r[1] for r in results), sum(r[2] for r in results), elapsed
+
+
+def benchmark(path: str,
+              runtime: float,
+              block_size: int,
+              iodepth: int,
+              write: bool) -> Dict[str, Any]:
+    size = device_size(path)
+    if size < block_size:
+        raise ValueError('{} is smaller than the block size'.format(path))
+
+    direct = True
+    try:
+        seq = run_test(path, False, direct, block_size, runtime, size)
+    except DirectIOUnsupported:
+        direct = False
+        seq = run_test(path, False, direct, block_size, runtime, size)
+    rand = run_test(path, False, direct, RANDOM_BLOCK_SIZE, runtime, size, jobs=max(iodepth, 2))
+
+    result = dict(size=size,
+                  direct=direct,
+                  seq_read_mbps=round(seq[0] / seq[3] / 1e6, 1),
+                  rand_read_iops=int(rand[1] / rand[3]),
+                  rand_read_latency_ms=round(rand[2] / rand[1] * 1000, 3),
+                  seq_write_mbps=None)
+    if write:
+        seq_write = run_test(path, True, direct, block_size, runtime, size)
+        result['seq_write_mbps'] = round(seq_write[0] / seq_write[3] / 1e6, 1)
+    return result
+
+
+def find_outliers(devices: List[Dict[str, Any]],
+                  threshold: float,
+                  baseline: Dict[str, Dict[str, Any]],
+                  minimums: Dict[str, Optional[float]]) -> None:
+    '''
+    Set the 'outlier' and 'reasons' of each device of `devices`: a
+    device is an outlier when one of its results is lower than the
+    baseline of its model, or the median of the devices of the same
+    model, by more than `threshold`, or lower than `minimums`.
+    '''
+    by_model: Dict[str, List[Dict[str, Any]]] = {}
+    for device in devices:
+        by_model.setdefault(device.get('model') or '', []).append(device)
+
+    for device in devices:
+        device['reasons'] = []
+        model = device.get('model') or ''
+        for metric in METRICS:
+            value = device.get(metric)
+            if value is None:
+                continue
+            reference = baseline.get(model, {}).get(metric)
+            source = 'baseline'
+            if reference is None:
+                peers = [peer[metric] for peer in by_model[model] if peer.get(metric) is not None]
+                if len(peers) < 2:
+                    continue
+                reference = statistics.median(peers)
+                source = 'median'
+            if value < float(reference) * (1 - threshold):
+                device['reasons'].append('{} {} is {:.0%} lower than the {} of {} ({})'.format(
+                    metric, value, 1 - value / float(reference), source, model or 'the devices', reference))
+        for metric, minimum in minimums.items():
+            if minimum is not None and device.get(metric) is not None and device[metric] < minimum:
+                device['reasons'].append('{} {} is lower than {}'.format(metric, device[metric], minimum))
+        device['outlier'] = bool(device['reasons'])
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            devices=dict(type='list', elements='str', required=False, default=[]),
+            runtime=dict(type='float', required=False, default=5),
+            block_size=dict(type='int', required=False, default=1048576),
+            iodepth=dict(type='int', required=False, default=4),
+            write=dict(type='bool', required=False, default=False),
+            outlier_threshold=dict(type='float', required=False, default=0.2),
+            baseline=dict(type='dict', required=False, default={}),
+            min_seq_read_mbps=dict(type='float', required=False),
+            min_rand_read_iops=dict(type='float', required=False)
+        ),
+        supports_check_mode=True
+    )
+
+    startd = datetime.datetime.now()
+    block_size = module.params.get('block_size')
+    if block_size <= 0 or block_size % RANDOM_BLOCK_SIZE:
+        fatal('block_size must be a multiple of {}'.format(RANDOM_BLOCK_SIZE), module)
+
+    mounts = mounted_devices()
+    paths = module.params.get('devices') or discover_devices(mounts)
+
+    devices = []
+    changed = False
+    for path in paths:
+        if not os.path.exists(path):
+            fatal('{} does not exist'.format(path), module)
+        info = device_info(path, mounts)
+        write = module.params.get('write') and not module.check_mode and is_empty(module, info)
+        try:
+            result = benchmark(path, module.params.get('runtime'), block_size, module.params.get('iodepth'), write)
+        except (OSError, ValueError) as e:
+            fatal("Can't benchmark {}: {}".format(path, e), module)
+        changed = changed or write
+        devices.append(dict(path=path, model=info['model'], rotational=info['rotational'], **result))
+
+    find_outliers(devices,
+                  module.params.get('outlier_threshold'),
+                  module.params.get('baseline'),
+                  dict(seq_read_mbps=module.params.get('min_seq_read_mbps'),
+                       rand_read_iops=module.params.get('min_rand_read_iops')))
+
+    exit_module(
+        module=module,
+        out='{} device(s) tested.'.format(len(devices)),
+        rc=0,
+        cmd=[],
+        err='',
+        startd=startd,
+        changed=changed,
+        devices=devices,
+        outliers=[device['path'] for device in devices if device['outlier']]
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal
+import datetime
+import os
+import re
+import tempfile
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: cephadm_host_tuning
+short_description: tune the kernel of a ceph host
+version_added: "2.9"
+description:
+    - Apply a tuning profile (sysctl settings, transparent huge pages and
+      tuned profile) suited to the role of the host.
+    - The sysctl settings are written to 'sysctl_file' and only the
+      settings whose live value differs are applied.
+    - The transparent huge pages mode is applied live and made
+      persistent with a systemd-tmpfiles entry.
+    - The tuned profile is only set when tuned is installed. A child
+      profile (ceph-<tuned_profile>) including it and setting the
+      transparent huge pages mode is written in /etc/tuned and
+      activated, so that tuned doesn't revert the mode (eg.
+      throughput-performance sets it to always), at boot neither.
+    - The sysctl keys may use '/' as separator, eg.
+      net/ipv4/conf/eth0.1/rp_filter, dotted keys are resolved against
+      /proc/sys so that dotted interface names work too.
+options:
+    profile:
+        description:
+            - 'hdd-dense': dense HDD OSD nodes.
+            - 'nvme': NVMe OSD nodes.
+            - 'mixed': HDD OSDs with NVMe DB/WAL devices, or colocated
+              services.
+        required: true
+    sysctl:
+        description:
+            - sysctl settings merged with (and overriding) the settings of
+              the profile.
+        required: false
+    transparent_hugepage:
+        description:
+            - the transparent huge pages mode (always, madvise or never).
+              Default is the mode of the profile.
+        required: false
+    tuned_profile:
+        description:
+            - the tuned profile the ceph child profile includes. Default
+              is the tuned profile of the profile, an empty string leaves
+              tuned untouched.
+        required: false
+    sysctl_file:
+        description:
+            - the file the sysctl settings are written to.
+        required: false
+        default: /etc/sysctl.d/90-ceph-tuning.conf
+'''
+
+EXAMPLES = '''
+- name: tune the osd nodes
+  cephadm_host_tuning:
+    profile: hdd-dense
+    sysctl:
+      vm.min_free_kbytes: 4194304
+'''
+
+RETURN = '''
+sysctl_changed:
+    description: the sysctl settings applied live, with their [before, after] values.
+    returned: always
+    type: dict
+file_changed:
+    description: whether 'sysctl_file' has been written.
+    returned: always
+    type: bool
+transparent_hugepage:
+    description: the [before, after] transparent huge pages mode, when changed.
+    returned: always
+    type: list
+tuned:
+    description: the [before, after] active tuned profile, when changed.
+    returned: always
+    type: list
+'''
+
+NET_BUFFERS = {
+    'hdd-dense': 56623104,
+    'nvme': 134217728,
+    'mixed': 67108864,
+}
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    name: dict(
+        sysctl={
+            'kernel.pid_max': 4194304,
+            'fs.aio-max-nr': 4194304 if name == 'nvme' else 1048576,
+            'vm.swappiness': 10,
+            'net.core.rmem_max': NET_BUFFERS[name],
+            'net.core.wmem_max': NET_BUFFERS[name],
+            'net.core.netdev_max_backlog': 250000,
+            'net.core.somaxconn': 4096,
+            'net.ipv4.tcp_rmem': '4096 87380 {}'.format(NET_BUFFERS[name]),
+            'net.ipv4.tcp_wmem': '4096 65536 {}'.format(NET_BUFFERS[name]),
+        },
+        transparent_hugepage='madvise',
+        tuned_profile='latency-performance' if name == 'nvme' else 'throughput-performance',
+    ) for name in NET_BUFFERS
+}
+
+PROC_SYS = '/proc/sys'
+THP_PATH = '/sys/kernel/mm/transparent_hugepage/enabled'
+THP_TMPFILES = '/etc/tmpfiles.d/ceph-thp.conf'
+TUNED_DIR = '/etc/tuned'
+THP_MODE_RE = re.compile(r'\[(\w+)\]')
+
+
+def normalize(value: Any) -> str:
+    return ' '.join(str(value).split())
+
+
+def _resolve_sysctl(path: str, parts: List[str]) -> Optional[str]:
+    '''
+    Find the file of the dotted key `parts` under `path`, a component of
+    the key may contain dots (eg. the interface eth0.1).
+    '''
+    if not parts:
+        return path if os.path.isfile(path) else None
+    for i in range(1, len(parts) + 1):
+        candidate = os.path.join(path, '.'.join(parts[:i]))
+        if os.path.exists(candidate):
+            found = _resolve_sysctl(candidate, parts[i:])
+            if found:
+                return found
+    return None
+
+
+def sysctl_path(key: str) -> str:
+    if '/' in key:
+        return os.path.join(PROC_SYS, *key.strip('/').split('/'))
+    return _resolve_sysctl(PROC_SYS, key.split('.')) or os.path.join(PROC_SYS, *key.split('.'))
+
+
+def read_file(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+def write_file(path: str, content: str) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.cephadm-tuning-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def format_sysctl_file(settings: Dict[str, Any]) -> str:
+    lines = ['# Managed by cephadm-ansible, do not edit']
+    lines.extend('{} = {}'.format(key, normalize(value)) for key, value in sorted(settings.items()))
+    return '\n'.join(lines) + '\n'
+
+
+def diff_sysctl(settings: Dict[str, Any]) -> Dict[str, List[Optional[str]]]:
+    '''
+    The settings whose live value differs.
+    '''
+    changes = {}
+    for key, value in sorted(settings.items()):
+        current = read_file(sysctl_path(key))
+        if current is None or normalize(current) != normalize(value):
+            changes[key] = [normalize(current) if current is not None else None, normalize(value)]
+    return changes
+
+
+def get_thp_mode() -> Optional[str]:
+    content = read_file(THP_PATH)
+    match = THP_MODE_RE.search(content or '')
+    return match.group(1) if match else None
+
+
+def tuned_child_profile(tuned_profile: str, thp: str) -> str:
+    return '\n'.join(['# Managed by cephadm-ansible, do not edit',
+                      '[main]',
+                      'summary=Ceph tuning based on {}'.format(tuned_profile),
+                      'include={}'.format(tuned_profile),
+                      '',
+                      '[vm]',
+                      'transparent_hugepages={}'.format(thp)]) + '\n'
+
+
+def get_tuned_profile(module: "AnsibleModule", tuned_adm: str) -> str:
+    rc, out, err = module.run_command([tuned_adm, 'active'])
+    # Current active profile: throughput-performance
+    return out.split(':', 1)[1].strip() if not rc and ':' in out else ''
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            profile=dict(type='str', required=True, choices=sorted(PROFILES)),
+            sysctl=dict(type='dict', required=False, default={}),
+            transparent_hugepage=dict(type='str', required=False, choices=['always', 'madvise', 'never']),
+            tuned_profile=dict(type='str', required=False),
+            sysctl_file=dict(type='path', required=False, default='/etc/sysctl.d/90-ceph-tuning.conf')
+        ),
+        supports_check_mode=True
+    )
+
+    startd = datetime.datetime.now()
+    profile = PROFILES[module.params.get('profile')]
+    settings = dict(profile['sysctl'], **module.params.get('sysctl'))
+    thp = module.params.get('transparent_hugepage') or profile['transparent_hugepage']
+    tuned_profile = module.params.get('tuned_profile')
+    if tuned_profile is None:
+        tuned_profile = profile['tuned_profile']
+
+    unknown = [key for key in settings if not os.path.exists(sysctl_path(key))]
+    if unknown:
+        fatal('Unknown sysctl setting(s): {}'.format(', '.join(unknown)), module)
+
+    sysctl_file = module.params.get('sysctl_file')
+    content = format_sysctl_file(settings)
+    file_changed = read_file(sysctl_file) != content
+    sysctl_changed = diff_sysctl(settings)
+
+    thp_changed: List[Optional[str]] = []
+    current_thp = get_thp_mode()
+    thp_tmpfiles = 'w {} - - - - {}\n'.format(THP_PATH, thp)
+    if current_thp is not None and (current_thp != thp or read_file(THP_TMPFILES) != thp_tmpfiles):
+        thp_changed = [current_thp, thp]
+
+    tuned_changed: List[str] = []
+    tuned_adm = module.get_bin_path('tuned-adm') if tuned_profile else None
+    child_profile = 'ceph-{}'.format(tuned_profile)
+    child_path = os.path.join(TUNED_DIR, child_profile, 'tuned.conf')
+    child_content = tuned_child_profile(tuned_profile, thp)
+    child_changed = False
+    if tuned_profile and not tuned_adm:
+        module.warn('tuned is not installed, the tuned profile {} is not set.'.format(tuned_profile))
+    elif tuned_adm:
+        child_changed = read_file(child_path) != child_content
+        current_tuned = get_tuned_profile(module, tuned_adm)
+        if current_tuned != child_profile or child_changed:
+            tuned_changed = [current_tuned, child_profile]
+
+    if not module.check_mode:
+        # tuned first: the profile it includes may set other sysctl
+        # settings or transparent huge pages mode than ours
+        if tuned_changed:
+            try:
+                if child_changed:
+                    write_file(child_path, child_content)
+            except (IOError, OSError) as e:
+                fatal("Can't write the tuned profile {}: {}".format(child_profile, e), module)
+            rc, out, err = module.run_command([tuned_adm, 'profile', child_profile])
+            if rc:
+                fatal("Can't set the tuned profile {}: {}".format(child_profile, err or out), module)
+            for key, change in diff_sysctl(settings).items():
+                sysctl_changed.setdefault(key, change)
+        try:
+            if file_changed:
+                write_file(sysctl_file, content)
+            for key, (before, after) in sysctl_changed.items():
+                with open(sysctl_path(key), 'w') as f:
+                    f.write(after or '')
+            if thp_changed:
+                write_file(THP_TMPFILES, thp_tmpfiles)
+                with open(THP_PATH, 'w') as f:
+                    f.write(thp)
+        except (IOError, OSError) as e:
+            fatal("Can't apply the tuning: {}".format(e), module)
+
+    exit_module(
+        module=module,
+        out='',
+        rc=0,
+        cmd=[],
+        err='',
+        startd=startd,
+        changed=bool(file_changed or sysctl_changed or thp_changed or tuned_changed),
+        sysctl_changed=sysctl_changed,
+        file_changed=file_changed,
+        transparent_hugepage=thp_changed,
+        tuned=tuned_changed
+    )
+
+
+if __name__ == '__main__':
+    main()
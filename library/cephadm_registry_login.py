@@ -20,9 +20,9 @@ __metaclass__ = type
 from ansible.module_utils.basic import AnsibleModule  # type: ignore
 from typing import List, Tuple
 try:
-    from ansible.module_utils.ceph_common import exit_module, build_base_cmd, fatal  # type: ignore
+    from ansible.module_utils.ceph_common import exit_module, build_base_cmd, fatal, run_command  # type: ignore
 except ImportError:
-    from module_utils.ceph_common import exit_module, build_base_cmd, fatal
+    from module_utils.ceph_common import exit_module, build_base_cmd, fatal, run_command
 import datetime
 
 ANSIBLE_METADATA = {
@@ -65,6 +65,17 @@ options:
             - The path to a json file. This file must be present on remote hosts
               prior to running this task.
               *not supported yet*.
+    command_timeout:
+        description:
+            - the maximum time (in seconds) each command may run (eg. when
+              the registry doesn't answer). When exceeded, the command is
+              killed and the module fails. Default is unlimited.
+        required: false
+    module_timeout:
+        description:
+            - the maximum time (in seconds) the module may run. Default is
+              unlimited.
+        required: false
 author:
     - Guillaume Abrioux <gabrioux@redhat.com>
 '''
@@ -104,7 +115,7 @@ def is_logged(module: "AnsibleModule") -> bool:
 
     cmd.extend(['--get-login', registry_url])
 
-    rc, out, err = module.run_command(cmd)
+    rc, out, err = run_command(module, cmd)
 
     if not rc and out.strip() == registry_username:
         return True
@@ -123,7 +134,7 @@ def do_login_or_logout(module: "AnsibleModule", action: str = 'login') -> Tuple[
     else:
         cmd.extend([registry_url])
 
-    rc, out, err = module.run_command(cmd, data=registry_password)
+    rc, out, err = run_command(module, cmd, data=registry_password)
 
     return rc, cmd, out, err
 
@@ -138,7 +149,9 @@ def main() -> None:
             registry_url=dict(type='str', required=True),
             registry_username=dict(type='str', required=False),
             registry_password=dict(type='str', required=False, no_log=True),
-            registry_json=dict(type='str', required=False)
+            registry_json=dict(type='str', required=False),
+            command_timeout=dict(type='int', required=False),
+            module_timeout=dict(type='int', required=False)
         ),
         supports_check_mode=True,
         mutually_exclusive=[
@@ -0,0 +1,324 @@
+# Copyright Red Hat
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import, division, print_function
+from typing import Any, Dict, List, Optional
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule  # type: ignore
+try:
+    from ansible.module_utils.ceph_common import exit_module, fatal  # type: ignore
+except ImportError:
+    from module_utils.ceph_common import exit_module, fatal
+import datetime
+import json
+import os
+import tempfile
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: cephadm_registry_mirror
+short_description: configure container registry mirrors
+version_added: "2.9"
+description:
+    - Point the container engine at registry mirrors (eg. a site-local
+      pull-through cache). The upstream registry is still used when the
+      mirrors can't serve an image.
+    - With podman, the mirrors are written in a marked block of
+      'registries_conf'. The resulting file is validated with
+      'podman info' before it replaces the current one.
+    - With docker, the mirrors are set as 'registry-mirrors' in
+      'daemon_json'. Docker only supports mirrors of docker.io, the
+      mirrors of other registries are ignored with a warning. Docker
+      must be reloaded for the change to be effective. The entries
+      added to 'insecure-registries' are recorded in
+      '.cephadm-ansible-mirrors.json', next to 'daemon_json', so that
+      state absent removes them without passing the mirrors again.
+    - The files are only written when their content changes.
+options:
+    mirrors:
+        description:
+            - the mirrors to configure. Each item accepts 'registry' (the
+              upstream registry, eg. quay.io), 'mirrors' (the mirror
+              locations, tried in order) and 'insecure' (whether the
+              mirrors are plain http or use an untrusted certificate,
+              default false).
+        required: false
+        default: []
+    state:
+        description:
+            - present or absent.
+        required: false
+        default: present
+    docker:
+        description:
+            - Use docker instead of podman.
+        required: false
+        default: false
+    registries_conf:
+        description:
+            - the podman registries configuration file.
+        required: false
+        default: /etc/containers/registries.conf
+    daemon_json:
+        description:
+            - the docker daemon configuration file.
+        required: false
+        default: /etc/docker/daemon.json
+'''
+
+EXAMPLES = '''
+- name: use the local pull-through cache
+  cephadm_registry_mirror:
+    mirrors:
+      - registry: quay.io
+        mirrors:
+          - registry-cache.lab:5000
+        insecure: true
+      - registry: docker.io
+        mirrors:
+          - registry-cache.lab:5001
+
+- name: stop using the mirrors
+  cephadm_registry_mirror:
+    state: absent
+'''
+
+RETURN = '''
+path:
+    description: the configuration file managed.
+    returned: always
+    type: str
+content:
+    description: the mirror configuration (registries.conf block or daemon.json settings).
+    returned: always
+    type: str
+'''
+
+MARKER = '# {} cephadm-ansible managed : registry mirrors'
+STATE_FILE = '.cephadm-ansible-mirrors.json'
+DOCKER_HUB = ('docker.io', 'registry-1.docker.io', 'index.docker.io')
+
+
+def read_file(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+def write_file(path: str, content: str) -> None:
+    '''
+    Replace `path` atomically, keeping the mode of the current file.
+    '''
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    mode = os.stat(path).st_mode & 0o7777 if os.path.exists(path) else 0o644
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.cephadm-mirror-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    os.chmod(tmp, mode)
+    os.replace(tmp, path)
+
+
+def format_registries_block(mirrors: List[Dict[str, Any]]) -> str:
+    lines = [MARKER.format('BEGIN')]
+    for entry in mirrors:
+        lines.extend(['[[registry]]',
+                      'prefix = "{}"'.format(entry['registry']),
+                      'location = "{}"'.format(entry['registry']),
+                      ''])
+        for location in entry['mirrors']:
+            lines.extend(['[[registry.mirror]]',
+                          'location = "{}"'.format(location)])
+            if entry.get('insecure'):
+                lines.append('insecure = true')
+            lines.append('')
+    lines.append(MARKER.format('END'))
+    return '\n'.join(lines) + '\n'
+
+
+def update_registries_conf(current: str, block: Optional[str]) -> str:
+    '''
+    Replace (or remove when `block` is None) the managed block of
+    `current`. A new block is appended at the end of the file.
+    '''
+    lines = current.splitlines(True)
+    begin = MARKER.format('BEGIN') + '\n'
+    end = MARKER.format('END') + '\n'
+    if begin in lines and end in lines[lines.index(begin):]:
+        start = lines.index(begin)
+        stop = lines.index(end, start) + 1
+        lines[start:stop] = [block] if block else []
+    elif block:
+        if lines and not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
+        lines.append(block)
+    return ''.join(lines)
+
+
+def mirror_url(location: str, insecure: bool) -> str:
+    if '://' in location:
+        return location
+    return '{}://{}'.format('http' if insecure else 'https', location)
+
+
+def insecure_hub_mirrors(mirrors: List[Dict[str, Any]]) -> List[str]:
+    return [location.split('://')[-1] for entry in mirrors
+            if entry['registry'] in DOCKER_HUB and entry.get('insecure') for location in entry['mirrors']]
+
+
+def update_daemon_json(current: Dict[str, Any],
+                       mirrors: List[Dict[str, Any]],
+                       present: bool,
+                       managed: Optional[List[str]] = None) -> Dict[str, Any]:
+    '''
+    Set (or remove) the docker.io mirrors of `current`, the insecure
+    ones are added to (or removed from) 'insecure-registries'. The
+    `managed` entries of 'insecure-registries', added by a previous run,
+    are removed as well.
+    '''
+    config = dict(current)
+    hub = [entry for entry in mirrors if entry['registry'] in DOCKER_HUB]
+    stale = set(insecure_hub_mirrors(mirrors)) | set(managed or [])
+    insecure_registries = [registry for registry in config.get('insecure-registries', []) if registry not in stale]
+
+    config.pop('registry-mirrors', None)
+    if present:
+        urls = [mirror_url(location, bool(entry.get('insecure'))) for entry in hub for location in entry['mirrors']]
+        if urls:
+            config['registry-mirrors'] = urls
+        insecure_registries += insecure_hub_mirrors(mirrors)
+    if insecure_registries:
+        config['insecure-registries'] = insecure_registries
+    else:
+        config.pop('insecure-registries', None)
+    return config
+
+
+def read_managed(path: str) -> List[str]:
+    '''
+    The entries of 'insecure-registries' added by the module, recorded
+    in `path` (docker refuses unknown keys in daemon.json).
+    '''
+    content = read_file(path)
+    try:
+        return json.loads(content).get('insecure-registries', []) if content else []
+    except (ValueError, AttributeError):
+        return []
+
+
+def validate_registries_conf(module: "AnsibleModule", content: str) -> None:
+    '''
+    Check that podman can load `content` as its registries configuration.
+    '''
+    podman = module.get_bin_path('podman')
+    if not podman:
+        module.warn('podman is not installed, the registries configuration is not validated.')
+        return
+    fd, tmp = tempfile.mkstemp(prefix='cephadm-registries-', suffix='.conf')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        rc, out, err = module.run_command([podman, 'info', '--format', 'json'],
+                                          environ_update=dict(CONTAINERS_REGISTRIES_CONF=tmp))
+    finally:
+        os.unlink(tmp)
+    if rc:
+        fatal('Invalid registries configuration: {}'.format(err or out), module)
+
+
+def main() -> None:
+    module = AnsibleModule(
+        argument_spec=dict(
+            mirrors=dict(type='list', elements='dict', required=False, default=[], options=dict(
+                registry=dict(type='str', required=True),
+                mirrors=dict(type='list', elements='str', required=True),
+                insecure=dict(type='bool', required=False, default=False)
+            )),
+            state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
+            docker=dict(type=bool, required=False, default=False),
+            registries_conf=dict(type='path', required=False, default='/etc/containers/registries.conf'),
+            daemon_json=dict(type='path', required=False, default='/etc/docker/daemon.json')
+        ),
+        supports_check_mode=True
+    )
+
+    startd = datetime.datetime.now()
+    mirrors = module.params.get('mirrors')
+    present = module.params.get('state') == 'present'
+
+    if module.params.get('docker'):
+        path = module.params.get('daemon_json')
+        ignored = [entry['registry'] for entry in mirrors if entry['registry'] not in DOCKER_HUB]
+        if ignored and present:
+            module.warn('docker only supports mirrors of docker.io, ignoring the mirrors of: {}'.format(', '.join(ignored)))
+        current_content = read_file(path)
+        try:
+            current = json.loads(current_content) if current_content and current_content.strip() else {}
+        except ValueError as e:
+            fatal("Can't parse {}: {}".format(path, e), module)
+        state_path = os.path.join(os.path.dirname(path), STATE_FILE)
+        managed = read_managed(state_path)
+        config = update_daemon_json(current, mirrors, present, managed)
+        new_managed = insecure_hub_mirrors(mirrors) if present else []
+        changed = config != current
+        content = json.dumps({key: config[key] for key in ['registry-mirrors', 'insecure-registries'] if key in config})
+        new_content = json.dumps(config, indent=4) + '\n'
+    else:
+        path = module.params.get('registries_conf')
+        current_content = read_file(path) or ''
+        content = format_registries_block(mirrors) if present and mirrors else ''
+        new_content = update_registries_conf(current_content, content or None)
+        changed = new_content != current_content
+        if changed and content:
+            validate_registries_conf(module, new_content)
+
+    if changed and not module.check_mode:
+        try:
+            write_file(path, new_content)
+        except (IOError, OSError) as e:
+            fatal("Can't write {}: {}".format(path, e), module)
+    if module.params.get('docker') and new_managed != managed and not module.check_mode:
+        try:
+            if new_managed:
+                write_file(state_path, json.dumps({'insecure-registries': new_managed}) + '\n')
+            elif os.path.exists(state_path):
+                os.unlink(state_path)
+        except (IOError, OSError) as e:
+            fatal("Can't write {}: {}".format(state_path, e), module)
+
+    exit_module(
+        module=module,
+        out='',
+        rc=0,
+        cmd=[],
+        err='',
+        startd=startd,
+        changed=changed,
+        path=path,
+        content=content
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,74 @@
+import contextlib
 import datetime
+import fcntl
+import importlib
+import importlib.machinery
+import importlib.util
+import json
+import os
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import tempfile
 import time
-from typing import TYPE_CHECKING, Any, List, Dict, Callable, Type, TypeVar
+import traceback
+import zipfile
+import zipimport
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Iterator, List, Dict, Callable, Optional, Tuple, Type, TypeVar, Union
 
 if TYPE_CHECKING:
     from ansible.module_utils.basic import AnsibleModule  # type: ignore
 
 ExceptionType = TypeVar('ExceptionType', bound=BaseException)
 
+LIMITER_DIR = '/run/cephadm-ansible'
+KILL_GRACE_PERIOD = 10
+# how long to wait for a concurrency slot when there is no module_timeout
+SLOT_WAIT_TIMEOUT = 3600
+CEPHADM_PATHS = ['/usr/sbin/cephadm', '/usr/bin/cephadm']
+# what the in-process mode relies on: main() parsing sys.argv and the shell command
+CEPHADM_API = ['main', 'command_shell']
+ConfigIndex = Dict[Tuple[str, str, str], str]
+
+IEC_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40, 'P': 1 << 50, 'E': 1 << 60}
+SI_UNITS = {'': 1, 'K': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9, 'T': 10 ** 12, 'P': 10 ** 15, 'E': 10 ** 18}
+UNIT_RE = re.compile(r'^([+-]?\d+(?:\.\d+)?)\s*([KMGTPE]?)(i?)B?$', re.IGNORECASE)
+TIMESPAN_UNITS = {
+    1: ['', 's', 'sec', 'secs', 'second', 'seconds'],
+    60: ['m', 'min', 'mins', 'minute', 'minutes'],
+    3600: ['h', 'hr', 'hrs', 'hour', 'hours'],
+    86400: ['d', 'day', 'days'],
+    604800: ['w', 'wk', 'wks', 'week', 'weeks'],
+    2592000: ['mo', 'month', 'months'],
+    31536000: ['y', 'yr', 'yrs', 'year', 'years']
+}
+TIMESPAN_RE = re.compile(r'(\d+(?:\.\d+)?)\s*([a-z]*)')
+
+BATCH_MARKER = '@@cephadm-ansible'
+BATCH_MARKER_RE = re.compile(r'^' + BATCH_MARKER + r' (\d+) (\d+)$')
+
+METRICS_PREFIX = 'cephadm_ansible_module'
+METRICS_FAMILIES = [
+    ('runs_total', 'counter', 'Number of module runs.'),
+    ('changed_total', 'counter', 'Number of module runs which reported a change.'),
+    ('failed_total', 'counter', 'Number of module runs which failed.'),
+    ('commands_total', 'counter', 'Number of commands (subprocesses) run by the module.'),
+    ('retries_total', 'counter', 'Number of retries of failed calls.'),
+    ('queue_wait_seconds_total', 'counter', 'Time spent waiting for the concurrency and rate limits.'),
+    ('duration_seconds', 'histogram', 'Duration of the module runs.')
+]
+DURATION_BUCKETS = [1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200]
+METRIC_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# process wide counters, which aren't bound to a module instance
+_counters = dict(retries=0)
+_process_start = time.monotonic()
+_cephadm: Dict[str, Any] = dict(module=None, error=None, import_seconds=0.0, startup_seconds=None)
+
 
 def retry(exceptions: Type[ExceptionType], retries: int = 20, delay: int = 1) -> Callable:
     def decorator(f: Callable) -> Callable:
@@ -17,6 +79,7 @@ def retry(exceptions: Type[ExceptionType], retries: int = 20, delay: int = 1) ->
                     print("{}".format(_tries))
                     return f(*args, **kwargs)
                 except exceptions:
+                    _counters['retries'] += 1
                     time.sleep(delay)
                     _tries -= 1
             print("{} has failed after {} tries".format(f, retries))
@@ -57,13 +120,603 @@ def build_base_cmd_orch(module: "AnsibleModule") -> List[str]:
     return cmd
 
 
+_stats: Dict[int, Dict[str, Any]] = {}
+
+
+def get_stats(module: "AnsibleModule") -> Dict[str, Any]:
+    '''
+    Execution statistics of the commands run by `module`.
+    '''
+    return _stats.setdefault(id(module), dict(commands=0, command_time=0.0, queue_wait=0.0, start=time.monotonic()))
+
+
+def acquire_slot(path: str, max_concurrency: int, timeout: Optional[float] = None) -> Optional[int]:
+    '''
+    Hold one of the `max_concurrency` slot files under `path`.
+    The slot is released when the returned fd is closed
+    (or when the process exits). Return None when no slot could be
+    acquired within `timeout` seconds.
+    '''
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        for slot in range(max_concurrency):
+            fd = os.open(os.path.join(path, 'slot-{}.lock'.format(slot)), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+        time.sleep(0.1)
+
+
+def take_token(path: str, rate: float) -> float:
+    '''
+    Token bucket shared by all the processes using `path`: reserve a
+    token and return how long the caller has to wait before using it.
+    The bucket holds at most max(1, rate) tokens.
+    '''
+    fd = os.open(os.path.join(path, 'tokens'), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        now = time.time()
+        burst = max(1.0, rate)
+        try:
+            tokens, last = (float(v) for v in os.read(fd, 64).decode().split())
+        except ValueError:
+            tokens, last = burst, now
+        tokens = min(burst, tokens + (now - last) * rate) - 1
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, '{} {}'.format(tokens, now).encode())
+    finally:
+        os.close(fd)
+
+    return max(0.0, -tokens / rate)
+
+
+@contextlib.contextmanager
+def rate_limit(module: "AnsibleModule") -> Iterator[None]:
+    '''
+    Limit the concurrency and the rate of the commands run by all the
+    modules targeting the same cluster (fsid) from this host.
+    The time spent waiting is accounted in the module stats. The module
+    fails when no slot is free before its module_timeout (or
+    SLOT_WAIT_TIMEOUT without it).
+    '''
+    max_concurrency = module.params.get('max_concurrency')
+    rate = module.params.get('rate_limit')
+    if not max_concurrency and not rate:
+        yield
+        return
+
+    path = os.path.join(LIMITER_DIR, module.params.get('fsid') or 'default')
+    os.makedirs(path, exist_ok=True)
+
+    start = time.monotonic()
+    fd = None
+    if max_concurrency:
+        module_timeout = module.params.get('module_timeout')
+        timeout = _process_start + module_timeout - start if module_timeout else SLOT_WAIT_TIMEOUT
+        fd = acquire_slot(path, max_concurrency, max(timeout, 0.0))
+        if fd is None:
+            fail_module(module,
+                        msg='Timed out after {}s waiting for one of the {} command slot(s) of {}.'.format(
+                            round(time.monotonic() - start, 3), max_concurrency, path),
+                        rc=1,
+                        timed_out=True)
+    try:
+        if rate:
+            time.sleep(take_token(path, rate))
+        get_stats(module)['queue_wait'] += time.monotonic() - start
+        yield
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+def run_command_with_timeout(module: "AnsibleModule",
+                             cmd: List[str],
+                             timeout: float,
+                             data: Optional[str] = None) -> Tuple[int, str, str]:
+    '''
+    Run `cmd` in its own process group. When `timeout` expires, the whole
+    group is sent SIGTERM (podman proxies it to the container), then
+    SIGKILL after KILL_GRACE_PERIOD seconds, and the module fails with
+    the output collected so far.
+    '''
+    if data is not None and not data.endswith('\n'):
+        data += '\n'
+    proc = subprocess.Popen(cmd,
+                            stdin=subprocess.PIPE if data is not None else subprocess.DEVNULL,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            start_new_session=True)
+    try:
+        out, err = proc.communicate(input=data.encode() if data is not None else None, timeout=max(timeout, 0.0))
+        return proc.returncode, out.decode(errors='replace'), err.decode(errors='replace')
+    except subprocess.TimeoutExpired:
+        pass
+
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    try:
+        out, err = proc.communicate(timeout=KILL_GRACE_PERIOD)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        out, err = proc.communicate()
+
+    out, err = out.decode(errors='replace'), err.decode(errors='replace')
+    fail_module(module,
+                msg='Timed out after {}s running: {}'.format(round(timeout, 3), ' '.join(cmd)),
+                cmd=cmd,
+                rc=proc.returncode,
+                stdout=out,
+                stderr=err,
+                timed_out=True)
+    return proc.returncode, out, err
+
+
+def load_cephadm() -> Optional[ModuleType]:
+    '''
+    Import the installed cephadm (zipapp or single file script) once.
+    Return None when it can't be imported or doesn't provide the
+    expected entry points, the reason is kept in _cephadm['error'].
+    '''
+    if _cephadm['module'] or _cephadm['error']:
+        return _cephadm['module']
+
+    start = time.monotonic()
+    try:
+        path = next((p for p in CEPHADM_PATHS if os.path.exists(p)), None)
+        if not path:
+            raise ImportError('cephadm not found in {}'.format(', '.join(CEPHADM_PATHS)))
+        if zipfile.is_zipfile(path):
+            # the zipapp entry point is __main__.py, it imports its
+            # packages (eg. cephadmlib) from the archive
+            if path not in sys.path:
+                sys.path.insert(0, path)
+            code = zipimport.zipimporter(path).get_code('__main__')
+            cephadm = ModuleType('cephadm')
+            cephadm.__file__ = os.path.join(path, '__main__.py')
+            sys.modules['cephadm'] = cephadm
+            try:
+                exec(code, cephadm.__dict__)
+            except BaseException:
+                del sys.modules['cephadm']
+                raise
+        else:
+            loader = importlib.machinery.SourceFileLoader('cephadm', path)
+            spec = importlib.util.spec_from_loader('cephadm', loader)
+            cephadm = importlib.util.module_from_spec(spec)  # type: ignore
+            loader.exec_module(cephadm)
+        missing = [attr for attr in CEPHADM_API if not hasattr(cephadm, attr)]
+        if missing:
+            raise ImportError('incompatible cephadm version, missing: {}'.format(', '.join(missing)))
+        _cephadm['module'] = cephadm
+    except Exception as e:
+        _cephadm['error'] = str(e)
+    _cephadm['import_seconds'] = time.monotonic() - start
+
+    return _cephadm['module']
+
+
+def run_cephadm_inprocess(cephadm: ModuleType,
+                          args: List[str],
+                          data: Optional[str] = None) -> Tuple[int, str, str]:
+    '''
+    Call cephadm.main() with `args` as command line. The standard fds are
+    redirected to temporary files for the duration of the call so the
+    output of cephadm and of the processes it spawns (eg. podman) is
+    captured, and the script in `data` is fed to them.
+    '''
+    if data is not None and not data.endswith('\n'):
+        data += '\n'
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = [os.dup(fd) for fd in (0, 1, 2)]
+    saved_argv = sys.argv
+    saved_streams = sys.stdin, sys.stdout, sys.stderr
+    with tempfile.TemporaryFile() as f_in, tempfile.TemporaryFile() as f_out, tempfile.TemporaryFile() as f_err:
+        f_in.write((data or '').encode())
+        f_in.seek(0)
+        try:
+            for f, fd in ((f_in, 0), (f_out, 1), (f_err, 2)):
+                os.dup2(f.fileno(), fd)
+            # the streams may not be bound to the standard fds (eg. when captured)
+            sys.stdin = open(0, closefd=False)
+            sys.stdout = open(1, 'w', closefd=False)
+            sys.stderr = open(2, 'w', closefd=False)
+            sys.argv = ['cephadm'] + args
+            try:
+                cephadm.main()
+                rc = 0
+            except SystemExit as e:
+                rc = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except Exception:
+                rc = 1
+                sys.stderr.write(traceback.format_exc())
+        finally:
+            for stream in (sys.stdin, sys.stdout, sys.stderr):
+                if stream not in saved_streams:
+                    stream.close()
+            sys.stdin, sys.stdout, sys.stderr = saved_streams
+            for fd, saved_fd in zip((0, 1, 2), saved_fds):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+            sys.argv = saved_argv
+        f_out.seek(0)
+        f_err.seek(0)
+        return rc, f_out.read().decode(errors='replace'), f_err.read().decode(errors='replace')
+
+
+def measure_startup() -> float:
+    '''
+    Time taken to start a new interpreter, measured once per process.
+    '''
+    if _cephadm['startup_seconds'] is None:
+        start = time.monotonic()
+        subprocess.run([sys.executable, '-c', 'pass'], stdin=subprocess.DEVNULL,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _cephadm['startup_seconds'] = time.monotonic() - start
+    return _cephadm['startup_seconds']
+
+
+def get_inprocess_stats(module: "AnsibleModule") -> Dict[str, Any]:
+    '''
+    Report of the in-process cephadm calls: their number, the time taken
+    by the (single) import of cephadm and the time saved. Running cephadm
+    as a command costs an interpreter startup plus the import, for each
+    call.
+    '''
+    calls = get_stats(module).get('inprocess_calls', 0)
+    stats = dict(calls=calls,
+                 import_seconds=round(_cephadm['import_seconds'], 3),
+                 fallback=_cephadm['error'])
+    if calls:
+        overhead = measure_startup() + _cephadm['import_seconds']
+        stats['subprocess_seconds'] = round(overhead, 3)
+        stats['time_saved'] = round(calls * overhead - _cephadm['import_seconds'], 3)
+    return stats
+
+
+def _run_command(module: "AnsibleModule",
+                 cmd: List[str],
+                 **kwargs: Any) -> Tuple[int, str, str]:
+    command_timeout = module.params.get('command_timeout')
+    module_timeout = module.params.get('module_timeout')
+    if not command_timeout and not module_timeout:
+        cephadm = load_cephadm() if module.params.get('cephadm_inprocess') and cmd[0] == 'cephadm' else None
+        if cephadm:
+            stats = get_stats(module)
+            stats['inprocess_calls'] = stats.get('inprocess_calls', 0) + 1
+            return run_cephadm_inprocess(cephadm, cmd[1:], **kwargs)
+        return module.run_command(cmd, **kwargs)
+
+    timeouts = [command_timeout] if command_timeout else []
+    if module_timeout:
+        remaining = _process_start + module_timeout - time.monotonic()
+        if remaining <= 0:
+            fail_module(module,
+                        msg='Module timeout ({}s) exceeded before running: {}'.format(module_timeout, ' '.join(cmd)),
+                        cmd=cmd,
+                        rc=1,
+                        timed_out=True)
+        timeouts.append(remaining)
+    return run_command_with_timeout(module, cmd, min(timeouts), **kwargs)
+
+
+def run_command(module: "AnsibleModule",
+                cmd: List[str],
+                **kwargs: Any) -> Tuple[int, str, str]:
+    '''
+    Wrapper around module.run_command() which applies the rate limits
+    and the timeouts of the module and accounts the executed commands
+    and the time spent running them.
+    With 'cephadm_inprocess', cephadm commands are run within the module
+    process, unless cephadm can't be imported or a timeout is set.
+    '''
+    with rate_limit(module):
+        stats = get_stats(module)
+        stats['commands'] += 1
+        start = time.monotonic()
+        try:
+            return _run_command(module, cmd, **kwargs)
+        finally:
+            stats['command_time'] += time.monotonic() - start
+
+
+def build_batch_script(cmds: List[List[str]]) -> str:
+    '''
+    Build a shell script running each command of `cmds` in turn.
+    Each command output is followed by a marker line carrying
+    the index and the return code of the command.
+    '''
+    lines = []
+    for i, cmd in enumerate(cmds):
+        lines.append(' '.join(shlex.quote(arg) for arg in cmd))
+        lines.append(f"printf '\\n{BATCH_MARKER} {i} %d\\n' $?")
+    return '\n'.join(lines) + '\n'
+
+
+def parse_batch_output(out: str, count: int) -> List[Tuple[int, str]]:
+    '''
+    Split the output of a script built with build_batch_script()
+    into a list of (rc, stdout) tuples, one per command.
+    Commands which didn't report (eg: the shell died) get rc=1.
+    '''
+    results: List[Tuple[int, str]] = [(1, '')] * count
+    current: List[str] = []
+    for line in out.splitlines():
+        match = BATCH_MARKER_RE.match(line)
+        if match:
+            index, rc = int(match.group(1)), int(match.group(2))
+            if index < count:
+                results[index] = (rc, '\n'.join(current).strip())
+            current = []
+        else:
+            current.append(line)
+    return results
+
+
+def run_batch(module: "AnsibleModule",
+              cmds: List[List[str]]) -> Tuple[int, List[str], List[Tuple[int, str]], str]:
+    '''
+    Run several commands within a single `cephadm shell` container.
+    '''
+    cmd = build_base_cmd_shell(module)
+    cmd.extend(['bash', '-s'])
+    rc, out, err = run_command(module, cmd, data=build_batch_script(cmds))
+    results = parse_batch_output(out, len(cmds))
+
+    return rc, cmd, results, err
+
+
+def iter_json_array(data: str) -> Iterator[Any]:
+    '''
+    Decode a json array one element at a time so the caller can
+    filter/project each element without having to build the whole
+    document in memory.
+    '''
+    decoder = json.JSONDecoder()
+    ws = re.compile(r'[\s,]*')
+    idx = ws.match(data, 0).end()  # type: ignore
+    if data[idx:idx + 1] != '[':
+        raise ValueError('Expecting a json array')
+    idx += 1
+    while True:
+        idx = ws.match(data, idx).end()  # type: ignore
+        if idx >= len(data):
+            raise ValueError('Unterminated json array')
+        if data[idx] == ']':
+            return
+        item, idx = decoder.raw_decode(data, idx)
+        yield item
+
+
+def host_domains(nodes: List[Dict[str, Any]], failure_domain: str) -> Dict[str, str]:
+    '''
+    Map each CRUSH host to its ancestor of type `failure_domain`.
+    '''
+    parents = {child: node for node in nodes for child in node.get('children', [])}
+    domains = {}
+    for node in nodes:
+        if node.get('type') != 'host':
+            continue
+        ancestor: Optional[Dict[str, Any]] = node
+        while ancestor is not None and ancestor.get('type') != failure_domain:
+            ancestor = parents.get(ancestor['id'])
+        domains[node['name']] = ancestor['name'] if ancestor is not None else node['name']
+    return domains
+
+
+def parse_who(who: str) -> Tuple[str, str]:
+    '''
+    Split a `who` (eg: 'osd/host:ceph-osd-02', 'osd/class:ssd/rack:r1')
+    into the section and the mask as reported by `ceph config dump`,
+    ie: the crush location first and then the device class.
+    '''
+    section, _, masks = who.partition('/')
+    location = ''
+    device_class = ''
+    for mask in masks.split('/') if masks else []:
+        if mask.startswith('class:'):
+            device_class = mask
+        else:
+            location = mask
+    return section, '/'.join(mask for mask in [location, device_class] if mask)
+
+
+def build_config_index(config_dump: List[Dict[str, Any]]) -> ConfigIndex:
+    '''
+    Index the output of `ceph config dump` by (section, mask, option).
+    '''
+    return {(config['section'], config.get('mask') or '', config['name']): config['value']
+            for config in config_dump}
+
+
+def lookup_config(config_index: ConfigIndex, who: str, option: str) -> Optional[str]:
+    section, mask = parse_who(who)
+    return config_index.get((section, mask, option))
+
+
+def _parse_unit(value: str, units: Dict[str, int]) -> int:
+    match = UNIT_RE.match(value)
+    if not match:
+        raise ValueError(value)
+    return int(float(match.group(1)) * units[match.group(2).upper()])
+
+
+def _parse_timespan(value: str) -> Union[int, float]:
+    value = value.lower()
+    if not value or TIMESPAN_RE.sub('', value).strip():
+        raise ValueError(value)
+    total = 0.0
+    for number, unit in TIMESPAN_RE.findall(value):
+        factor = [f for f, names in TIMESPAN_UNITS.items() if unit in names]
+        if not factor:
+            raise ValueError(value)
+        total += float(number) * factor[0]
+    return int(total) if total.is_integer() else total
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in ['true', 'yes', 'on']:
+        return True
+    if value.lower() in ['false', 'no', 'off']:
+        return False
+    return int(value) != 0
+
+
+def normalize_config_value(value: str, option_type: Optional[str]) -> Any:
+    '''
+    Convert a config value to its canonical form according to the type
+    of the option (as reported by `ceph config help`), so '5G' and
+    '5368709120' or 'true' and '1' compare equal.
+    Values which can't be parsed are returned as is.
+    '''
+    value = value.strip()
+    parsers: Dict[str, Callable[[str], Any]] = {
+        'size': lambda v: _parse_unit(v, IEC_UNITS),
+        'uint': lambda v: _parse_unit(v, SI_UNITS),
+        'int': lambda v: _parse_unit(v, SI_UNITS),
+        'float': float,
+        'bool': _parse_bool,
+        'secs': _parse_timespan,
+        'millisecs': lambda v: int(v) if v.isdigit() else int(_parse_timespan(v) * 1000)
+    }
+    if option_type is None:
+        return value.lower()
+    try:
+        return parsers[option_type](value) if option_type in parsers else value
+    except ValueError:
+        return value
+
+
+Labels = Tuple[Tuple[str, str], ...]
+Samples = Dict[Tuple[str, Labels], float]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def read_metrics(path: str) -> Samples:
+    '''
+    Parse the samples of a Prometheus textfile (comments are ignored).
+    '''
+    samples: Samples = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                match = METRIC_RE.match(line.strip())
+                if not match:
+                    continue
+                name, labels, value = match.groups()
+                try:
+                    samples[(name, tuple(LABEL_RE.findall(labels or '')))] = float(value)
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return samples
+
+
+def format_metrics(samples: Samples) -> str:
+    def sort_key(sample: Tuple[str, Labels]) -> Tuple[str, Labels, float]:
+        name, labels = sample
+        le = dict(labels).get('le')
+        return (name, tuple(label for label in labels if label[0] != 'le'),
+                float(le) if le is not None else 0.0)
+
+    def format_value(value: float) -> str:
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+    lines = []
+    for family, metric_type, description in METRICS_FAMILIES:
+        name = '{}_{}'.format(METRICS_PREFIX, family)
+        family_samples = sorted((s for s in samples if s[0] == name or s[0].startswith(name + '_')), key=sort_key)
+        if not family_samples:
+            continue
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for sample in family_samples:
+            labels = ','.join('{}="{}"'.format(k, v) for k, v in sample[1])
+            lines.append('{}{{{}}} {}'.format(sample[0], labels, format_value(samples[sample])))
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(module: "AnsibleModule",
+                  duration: float,
+                  changed: bool,
+                  failed: bool) -> None:
+    '''
+    Add the execution metrics of `module` to the cumulative counters of
+    <metrics_dir>/cephadm_ansible_<module>.prom, to be collected by the
+    node_exporter textfile collector. Errors are ignored: metrics must
+    never fail a module.
+    '''
+    metrics_dir = module.params.get('metrics_dir')
+    if not metrics_dir:
+        return
+
+    module_name = getattr(module, '_name', None) or 'unknown'
+    if module_name.endswith('.py'):
+        module_name = module_name[:-3]
+    labels = (('module', _escape_label(module_name)),
+              ('fsid', _escape_label(module.params.get('fsid') or '')))
+    stats = get_stats(module)
+
+    increments = {
+        'runs_total': 1,
+        'changed_total': int(changed),
+        'failed_total': int(failed),
+        'commands_total': stats['commands'],
+        'retries_total': _counters['retries'],
+        'queue_wait_seconds_total': stats['queue_wait'],
+        'duration_seconds_sum': duration,
+        'duration_seconds_count': 1
+    }
+    updates: Samples = {('{}_{}'.format(METRICS_PREFIX, name), labels): value for name, value in increments.items()}
+    for bucket in DURATION_BUCKETS + [float('inf')]:
+        le = '+Inf' if bucket == float('inf') else str(bucket)
+        updates[('{}_duration_seconds_bucket'.format(METRICS_PREFIX), labels + (('le', le),))] = int(duration <= bucket)
+
+    path = os.path.join(metrics_dir, 'cephadm_ansible_{}.prom'.format(module_name))
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        lock = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            samples = read_metrics(path)
+            for sample, value in updates.items():
+                samples[sample] = samples.get(sample, 0) + value
+            # the textfile collector only reads *.prom files
+            fd, tmp = tempfile.mkstemp(dir=metrics_dir, prefix='.cephadm_ansible_', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(format_metrics(samples))
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        finally:
+            os.close(lock)
+    except OSError:
+        pass
+
+
 def exit_module(module: "AnsibleModule",
                 rc: int, cmd: List[str],
                 startd: datetime.datetime,
                 out: str = '',
                 err: str = '',
                 changed: bool = False,
-                diff: Dict[str, str] = dict(before="", after="")) -> None:
+                diff: Dict[str, str] = dict(before="", after=""),
+                **kwargs: Any) -> None:
     endd = datetime.datetime.now()
     delta = endd - startd
 
@@ -76,17 +729,32 @@ def exit_module(module: "AnsibleModule",
         stdout=out.rstrip("\r\n"),
         stderr=err.rstrip("\r\n"),
         changed=changed,
-        diff=diff
+        diff=diff,
+        commands=get_stats(module)['commands'],
+        command_time=round(get_stats(module)['command_time'], 3),
+        queue_wait=round(get_stats(module)['queue_wait'], 3)
     )
+    if module.params.get('cephadm_inprocess'):
+        result['cephadm_inprocess'] = get_inprocess_stats(module)
+    result.update(kwargs)
+    write_metrics(module, delta.total_seconds(), changed, False)
     module.exit_json(**result)
 
 
+def fail_module(module: "AnsibleModule", **kwargs: Any) -> None:
+    '''
+    Record the execution metrics of a failed run and exit
+    '''
+    write_metrics(module, time.monotonic() - get_stats(module)['start'], False, True)
+    module.fail_json(**kwargs)
+
+
 def fatal(message: str, module: "AnsibleModule") -> None:
     '''
     Report a fatal error and exit
     '''
 
     if module:
-        module.fail_json(msg=message, rc=1)
+        fail_module(module, msg=message, rc=1)
     else:
         raise Exception(message)
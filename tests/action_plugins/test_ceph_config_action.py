@@ -0,0 +1,76 @@
+from ansible.plugins.loader import action_loader
+from mock.mock import MagicMock, patch
+import os
+
+action_loader.add_directory(os.path.join(os.path.dirname(__file__), '..', '..', 'action_plugins'))
+
+
+def get_action(args, run_once=True):
+    task = MagicMock(args=args, run_once=run_once, async_val=0, check_mode=False)
+    connection = MagicMock()
+    connection._shell.tmpdir = '/tmp'
+    return action_loader.get('ceph_config', task=task, connection=connection, play_context=MagicMock(),
+                             loader=MagicMock(), templar=MagicMock(), shared_loader_obj=MagicMock())
+
+
+def task_vars(options):
+    return dict(inventory_hostname='ceph-node0',
+                ansible_play_batch=list(options),
+                hostvars={host: dict(ceph_config_options=host_options) if host_options is not None else {}
+                          for host, host_options in options.items()})
+
+
+def option(host, value):
+    return dict(who='osd/host:{}'.format(host), option='osd_memory_target', value=value)
+
+
+class TestCephConfigAction(object):
+
+    def test_without_options_var(self):
+        action = get_action({'action': 'get', 'who': 'global', 'option': 'osd_pool_default_size'})
+        with patch.object(action, '_execute_module', return_value=dict(changed=False, stdout='3')) as m_execute_module:
+            result = action.run(task_vars=task_vars({'ceph-node0': None}))
+
+        assert result['stdout'] == '3'
+        assert m_execute_module.call_args[1]['module_args'] == {'action': 'get', 'who': 'global', 'option': 'osd_pool_default_size'}
+
+    def test_requires_run_once(self):
+        action = get_action({'action': 'set', 'options_var': 'ceph_config_options'}, run_once=False)
+        with patch.object(action, '_execute_module') as m_execute_module:
+            result = action.run(task_vars=task_vars({'ceph-node0': [option('ceph-node0', '4G')]}))
+
+        assert result['failed']
+        assert result['msg'] == "'options_var' requires 'run_once: true'."
+        m_execute_module.assert_not_called()
+
+    def test_merge_options(self):
+        options = {'ceph-node0': [option('ceph-node0', '4G')],
+                   'ceph-node1': None,
+                   'ceph-node2': [option('ceph-node2', '6G'), dict(who='osd.3', option='osd_max_backfills', value='2')]}
+        module_result = dict(changed=True, results=[dict(who='osd/host:ceph-node0', changed=False),
+                                                    dict(who='osd/host:ceph-node2', changed=True),
+                                                    dict(who='osd.3', changed=False)])
+        action = get_action({'action': 'set', 'options_var': 'ceph_config_options', 'fsid': 'foo'})
+        with patch.object(action, '_execute_module', return_value=module_result) as m_execute_module:
+            result = action.run(task_vars=task_vars(options))
+
+        # a single call with the options of all the hosts, in order
+        m_execute_module.assert_called_once()
+        assert m_execute_module.call_args[1]['module_args'] == {'action': 'set', 'fsid': 'foo',
+                                                                'options': options['ceph-node0'] + options['ceph-node2']}
+        # the results are mapped back to the host defining the option
+        assert result['changed']
+        assert result['per_host'] == {
+            'ceph-node0': dict(changed=False, results=[module_result['results'][0]]),
+            'ceph-node1': dict(changed=False, results=[]),
+            'ceph-node2': dict(changed=True, results=module_result['results'][1:]),
+        }
+
+    def test_no_options(self):
+        action = get_action({'action': 'set', 'options_var': 'ceph_config_options'})
+        with patch.object(action, '_execute_module') as m_execute_module:
+            result = action.run(task_vars=task_vars({'ceph-node0': [], 'ceph-node1': None}))
+
+        assert not result['changed']
+        assert result['per_host'] == {'ceph-node0': dict(changed=False, results=[]), 'ceph-node1': dict(changed=False, results=[])}
+        m_execute_module.assert_not_called()
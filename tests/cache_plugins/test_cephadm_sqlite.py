@@ -0,0 +1,58 @@
+from ansible.plugins.loader import cache_loader
+from mock.mock import patch
+import os
+import pytest
+import sqlite3
+
+cache_loader.add_directory(os.path.join(os.path.dirname(__file__), '..', '..', 'cache_plugins'))
+
+
+def get_cache(path, timeout=3600, prefix=''):
+    return cache_loader.get('cephadm_sqlite', _uri=str(path), _timeout=timeout, _prefix=prefix)
+
+
+class TestCephadmSqliteCache(object):
+
+    def test_set_get(self, tmp_path):
+        cache = get_cache(tmp_path)
+        cache.set('ceph-node0', {'ansible_hostname': 'ceph-node0', 'ansible_memtotal_mb': 64000})
+        cache.set('ceph-node1', {'ansible_hostname': 'ceph-node1'})
+
+        # another run reads the database
+        cache = get_cache(tmp_path)
+        assert sorted(cache.keys()) == ['ceph-node0', 'ceph-node1']
+        assert cache.contains('ceph-node0')
+        assert not cache.contains('ceph-node2')
+        assert cache.get('ceph-node0')['ansible_memtotal_mb'] == 64000
+        with pytest.raises(KeyError):
+            cache.get('ceph-node2')
+
+        cache.delete('ceph-node0')
+        assert cache.keys() == ['ceph-node1']
+        cache.flush()
+        assert cache.keys() == []
+
+    def test_lazy_load(self, tmp_path):
+        cache = get_cache(tmp_path)
+        for i in range(10):
+            cache.set('ceph-node{}'.format(i), {'i': i})
+
+        cache = get_cache(tmp_path)
+        with patch('zlib.decompress', side_effect=__import__('zlib').decompress) as m_decompress:
+            assert cache.get('ceph-node3') == {'i': 3}
+            assert cache.get('ceph-node3') == {'i': 3}
+        assert m_decompress.call_count == 1
+
+    def test_compressed_rows(self, tmp_path):
+        cache = get_cache(tmp_path / 'facts.sqlite')
+        cache.set('ceph-node0', {'ansible_mounts': [{'mount': '/', 'size_total': 1}] * 100})
+        data, = sqlite3.connect(str(tmp_path / 'facts.sqlite')).execute('SELECT data FROM facts').fetchone()
+        assert len(data) < 200
+
+    def test_timeout_and_prefix(self, tmp_path):
+        cache = get_cache(tmp_path, prefix='a_')
+        cache.set('ceph-node0', {})
+        assert get_cache(tmp_path, prefix='b_').keys() == []
+        with patch('time.time', return_value=__import__('time').time() + 7200):
+            assert get_cache(tmp_path, prefix='a_').keys() == []
+        assert get_cache(tmp_path, timeout=0, prefix='a_').keys() == ['ceph-node0']
@@ -0,0 +1,67 @@
+from ansible.plugins.loader import callback_loader
+from mock.mock import MagicMock
+import json
+import os
+import sys
+
+callback_loader.add_directory(os.path.join(os.path.dirname(__file__), '..', '..', 'callback_plugins'))
+
+
+def get_callback(**options):
+    callback = callback_loader.get('cephadm_perf')
+    callback.set_options(direct=options)
+    callback._display = MagicMock()
+    return callback
+
+
+def result(host, task, action='ceph_orch_host', **data):
+    res = MagicMock()
+    res._host.get_name.return_value = host
+    res._task._uuid = task
+    res._task.get_name.return_value = task
+    res._task.action = action
+    res._task.args = {}
+    res._result = data
+    return res
+
+
+class TestCephadmPerfCallback(object):
+
+    def test_parse_delta(self):
+        module = sys.modules[callback_loader.get('cephadm_perf', class_only=True).__module__]
+        assert module.parse_delta('0:00:01.500000') == 1.5
+        assert module.parse_delta('1 day, 1:00:00') == 90000
+        assert module.parse_delta(None) is None
+
+    def test_records(self):
+        callback = get_callback()
+        callback.v2_runner_on_ok(result('ceph-node0', 'add host', delta='0:00:02.000000', commands=2, command_time=1.5, queue_wait=0.25,
+                                        invocation=dict(module_args=dict(fsid='foo'))))
+        # loops: the items are aggregated
+        items = [dict(delta='0:00:01.000000', commands=1), dict(delta='0:00:03.000000', commands=2)]
+        callback.v2_runner_on_ok(result('ceph-node1', 'add host', results=items))
+        callback.v2_runner_on_failed(result('ceph-node2', 'add host', delta='0:00:01.000000', commands=1))
+        callback.v2_runner_on_skipped(result('ceph-node3', 'add host', skipped=True))
+        callback.v2_runner_on_unreachable(result('ceph-node4', 'add host', unreachable=True))
+
+        assert [(r['host'], r['status'], r['module_time'], r['commands']) for r in callback.records] == [
+            ('ceph-node0', 'ok', 2.0, 2), ('ceph-node1', 'ok', 4.0, 3), ('ceph-node2', 'failed', 1.0, 1),
+            ('ceph-node3', 'skipped', None, None), ('ceph-node4', 'unreachable', None, None)]
+        report = callback.build_report()
+        summary = report['by_module']['ceph_orch_host']
+        assert (summary['tasks'], summary['failed'], summary['skipped'], summary['commands']) == (5, 2, 1, 6)
+        assert report['by_fsid']['foo']['queue_wait'] == 0.25
+
+    def test_report_is_opt_in(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('HOME', str(tmp_path))
+        callback = get_callback()
+        callback.v2_runner_on_ok(result('ceph-node0', 'add host'))
+        callback.v2_playbook_on_stats(MagicMock())
+        assert os.listdir(str(tmp_path)) == []
+
+        report_dir = tmp_path / 'reports'
+        callback = get_callback(report_dir=str(report_dir))
+        callback.v2_runner_on_ok(result('ceph-node0', 'add host'))
+        callback.v2_playbook_on_stats(MagicMock())
+        report, = os.listdir(str(report_dir))
+        assert json.loads((report_dir / report).read_text())['tasks'][0]['host'] == 'ceph-node0'
@@ -0,0 +1,96 @@
+from ansible.inventory.data import InventoryData
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.loader import inventory_loader
+from mock.mock import patch, MagicMock
+import json
+import os
+import pytest
+
+inventory_loader.add_directory(os.path.join(os.path.dirname(__file__), '..', '..', 'inventory_plugins'))
+
+fake_hosts = [
+    {"addr": "10.10.10.10", "hostname": "ceph-node0", "labels": ["_admin", "mon"], "status": ""},
+    {"addr": "10.10.10.11", "hostname": "ceph-node1", "labels": ["client"], "status": "maintenance"}
+]
+
+
+def parse(tmp_path, config, cache=False):
+    path = tmp_path / 'ceph_orch.yml'
+    path.write_text(config)
+    plugin = inventory_loader.get('ceph_orch')
+    inventory = InventoryData()
+    plugin.parse(inventory, DataLoader(), str(path), cache=cache)
+    # as done by the inventory manager after parsing a source
+    plugin.update_cache_if_changed()
+    return inventory
+
+
+class TestCephOrchInventory(object):
+
+    @patch('subprocess.run')
+    def test_groups_and_vars(self, m_run, tmp_path):
+        m_run.return_value = MagicMock(returncode=0, stdout=json.dumps(fake_hosts).encode())
+        inventory = parse(tmp_path, 'plugin: ceph_orch\n'
+                                    'admin_host: ceph-node0\n'
+                                    'fsid: 123\n'
+                                    'label_groups:\n'
+                                    '  _admin: admin\n'
+                                    '  client: clients\n'
+                                    'keyed_groups:\n'
+                                    '  - key: ceph_labels\n'
+                                    '    prefix: label\n')
+
+        assert m_run.call_args[0][0] == ['ssh', '-o', 'BatchMode=yes', 'ceph-node0', '--', 'cephadm', 'shell', '--fsid', '123',
+                                         'ceph', 'orch', 'host', 'ls', '--format', 'json']
+        assert sorted(h.name for h in inventory.groups['ceph_cluster'].get_hosts()) == ['ceph-node0', 'ceph-node1']
+        assert [h.name for h in inventory.groups['admin'].get_hosts()] == ['ceph-node0']
+        assert [h.name for h in inventory.groups['clients'].get_hosts()] == ['ceph-node1']
+        assert [h.name for h in inventory.groups['label_mon'].get_hosts()] == ['ceph-node0']
+        host_vars = inventory.get_host('ceph-node1').vars
+        assert host_vars['ansible_host'] == '10.10.10.11'
+        assert host_vars['ceph_status'] == 'maintenance'
+
+    @patch('subprocess.run')
+    def test_command_failure(self, m_run, tmp_path):
+        m_run.return_value = MagicMock(returncode=1, stdout=b'', stderr=b'connection refused')
+        with pytest.raises(Exception, match='connection refused'):
+            parse(tmp_path, 'plugin: ceph_orch\n')
+
+    @patch('subprocess.run')
+    def test_become(self, m_run, tmp_path):
+        m_run.return_value = MagicMock(returncode=0, stdout=json.dumps(fake_hosts).encode())
+        parse(tmp_path, 'plugin: ceph_orch\n'
+                        'admin_host: ceph-node0\n'
+                        'ssh_user: cephadm\n'
+                        'become: true\n')
+
+        assert m_run.call_args[0][0] == ['ssh', '-o', 'BatchMode=yes', 'cephadm@ceph-node0', '--', 'sudo', '-n', 'cephadm', 'shell',
+                                         'ceph', 'orch', 'host', 'ls', '--format', 'json']
+
+    @patch('subprocess.run')
+    def test_cache(self, m_run, tmp_path):
+        m_run.return_value = MagicMock(returncode=0, stdout=json.dumps(fake_hosts).encode())
+        config = ('plugin: ceph_orch\n'
+                  'cache: true\n'
+                  'cache_plugin: jsonfile\n'
+                  'cache_connection: {}\n'.format(tmp_path / 'cache'))
+
+        # the cache is empty: the hosts are fetched and cached
+        inventory = parse(tmp_path, config, cache=True)
+        assert m_run.call_count == 1
+        assert len(os.listdir(str(tmp_path / 'cache'))) == 1
+
+        # the next runs use the cache
+        m_run.return_value = MagicMock(returncode=1, stdout=b'', stderr=b'connection refused')
+        inventory = parse(tmp_path, config, cache=True)
+        assert m_run.call_count == 1
+        assert sorted(h.name for h in inventory.groups['ceph_cluster'].get_hosts()) == ['ceph-node0', 'ceph-node1']
+
+        # unless a refresh is requested (eg. ansible-inventory --flush-cache)
+        m_run.return_value = MagicMock(returncode=0, stdout=json.dumps(fake_hosts[:1]).encode())
+        inventory = parse(tmp_path, config, cache=False)
+        assert m_run.call_count == 2
+        assert [h.name for h in inventory.groups['ceph_cluster'].get_hosts()] == ['ceph-node0']
+        inventory = parse(tmp_path, config, cache=True)
+        assert m_run.call_count == 2
+        assert [h.name for h in inventory.groups['ceph_cluster'].get_hosts()] == ['ceph-node0']
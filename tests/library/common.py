@@ -27,3 +27,15 @@ def exit_json(*args, **kwargs):
 
 def fail_json(*args, **kwargs):
     raise AnsibleFailJson(kwargs)
+
+
+def batch_output(*outputs):
+    '''
+    Forge the stdout of a script built with ceph_common.build_batch_script().
+    `outputs` are (rc, stdout) tuples.
+    '''
+    lines = []
+    for i, (rc, out) in enumerate(outputs):
+        lines.append(out)
+        lines.append('@@cephadm-ansible {} {}'.format(i, rc))
+    return '\n'.join(lines) + '\n'
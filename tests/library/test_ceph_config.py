@@ -0,0 +1,285 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import ceph_config
+
+fake_config_dump = [
+    {"section": "global", "name": "osd_pool_default_size", "value": "3", "level": "advanced",
+     "can_update_at_runtime": True, "mask": ""},
+    {"section": "osd", "name": "osd_max_backfills", "value": "2", "level": "advanced",
+     "can_update_at_runtime": True, "mask": ""},
+    {"section": "osd", "name": "osd_memory_target", "value": "5368709120", "level": "basic",
+     "can_update_at_runtime": True, "mask": "host:ceph-osd-02", "location_type": "host", "location_value": "ceph-osd-02"}
+]
+fake_version = '{"version": "ceph version 18.2.0 (5dd24139a1eada541a3bc16b6941c5dde975e26d) reef (stable)"}'
+fake_schema = {
+    "osd_max_backfills": {"type": "uint"},
+    "osd_recovery_max_active": {"type": "uint"},
+    "osd_pool_default_size": {"type": "uint"},
+    "osd_memory_target": {"type": "size"}
+}
+
+
+def config_dump_output(config_dump=fake_config_dump):
+    return 0, common.batch_output((0, json.dumps(config_dump)), (0, fake_version)), ''
+
+
+@pytest.fixture
+def schema_cache_dir(tmp_path):
+    path = tmp_path / 'config-schema-ceph_version_18.2.0_5dd24139a1eada541a3bc16b6941c5dde975e26d_reef_stable_.json'
+    path.write_text(json.dumps(fake_schema))
+    return str(tmp_path)
+
+
+class TestCephConfig(object):
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_set_already_set(self, m_run_command, m_exit_json, schema_cache_dir):
+        common.set_module_args({
+            'schema_cache_dir': schema_cache_dir,
+            'who': 'osd',
+            'option': 'osd_max_backfills',
+            'value': '2'
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = config_dump_output()
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_config.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert m_run_command.call_count == 1
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_set_masked_already_set(self, m_run_command, m_exit_json, schema_cache_dir):
+        common.set_module_args({
+            'schema_cache_dir': schema_cache_dir,
+            'who': 'osd/host:ceph-osd-02',
+            'option': 'osd_memory_target',
+            'value': '5368709120'
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = config_dump_output()
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_config.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert m_run_command.call_count == 1
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_set(self, m_run_command, m_exit_json, schema_cache_dir):
+        common.set_module_args({
+            'schema_cache_dir': schema_cache_dir,
+            'who': 'osd',
+            'option': 'osd_max_backfills',
+            'value': '4'
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.side_effect = [config_dump_output(), (0, '', '')]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_config.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert result['cmd'] == ['cephadm', 'shell', 'ceph', 'config', 'set', 'osd', 'osd_max_backfills', '4']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_set_options_batch(self, m_run_command, m_exit_json, schema_cache_dir):
+        common.set_module_args({
+            'schema_cache_dir': schema_cache_dir,
+            'options': [
+                {'who': 'osd', 'option': 'osd_max_backfills', 'value': '2'},
+                {'who': 'osd', 'option': 'osd_recovery_max_active', 'value': '8'},
+                {'who': 'global', 'option': 'osd_pool_default_size', 'value': '2'}
+            ]
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.side_effect = [
+            config_dump_output(),
+            (0, common.batch_output((0, ''), (0, '')), '')
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_config.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert m_run_command.call_count == 2
+        script = m_run_command.call_args[1]['data']
+        assert 'ceph config set osd osd_recovery_max_active 8' in script
+        assert 'ceph config set global osd_pool_default_size 2' in script
+        assert 'osd_max_backfills' not in script
+        assert [r['changed'] for r in result['results']] == [False, True, True]
+        assert result['results'][2]['before'] == '3'
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_set_options_batch_failure(self, m_run_command, m_fail_json, schema_cache_dir):
+        common.set_module_args({
+            'schema_cache_dir': schema_cache_dir,
+            'options': [
+                {'who': 'osd', 'option': 'foo', 'value': '1'}
+            ]
+        })
+        m_fail_json.side_effect = common.fail_json
+        m_run_command.side_effect = [
+            config_dump_output(),
+            (0, common.batch_output((2, 'Error ENOENT:')), ''),
+            (0, common.batch_output((22, 'Error EINVAL: unrecognized config option \'foo\'')), '')
+        ]
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_config.main()
+
+        result = result.value.args[0]
+        assert result['rc'] == 22
+        assert 'unrecognized config option' in result['msg']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_get_options(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'action': 'get',
+            'options': [
+                {'who': 'osd', 'option': 'osd_max_backfills'},
+                {'who': 'mon', 'option': 'foo'}
+            ]
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = config_dump_output()
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_config.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert [r['value'] for r in result['results']] == ['2', None]
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_set_normalized_value(self, m_run_command, m_exit_json, schema_cache_dir):
+        common.set_module_args({
+            'schema_cache_dir': schema_cache_dir,
+            'who': 'osd/host:ceph-osd-02',
+            'option': 'osd_memory_target',
+            'value': '5G'
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = config_dump_output()
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_config.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert result['diff'] == {'before': '5368709120', 'after': '5G'}
+        assert result['normalized'] == {'before': 5368709120, 'after': 5368709120}
+        assert m_run_command.call_count == 1
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_schema_cache_miss(self, m_run_command, m_exit_json, tmp_path):
+        common.set_module_args({
+            'schema_cache_dir': str(tmp_path),
+            'who': 'osd',
+            'option': 'osd_max_backfills',
+            'value': '3'
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.side_effect = [
+            config_dump_output(),
+            (0, common.batch_output((0, '{"name": "osd_max_backfills", "type": "uint", "default": 1}')), ''),
+            (0, '', '')
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_config.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert 'ceph config help osd_max_backfills --format json' in m_run_command.call_args_list[1][1]['data']
+        cache = list(tmp_path.iterdir())
+        assert len(cache) == 1
+        assert json.loads(cache[0].read_text()) == {'osd_max_backfills': {'type': 'uint'}}
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_schema_not_needed(self, m_run_command, m_exit_json, tmp_path):
+        common.set_module_args({
+            'schema_cache_dir': str(tmp_path),
+            'options': [{'who': 'osd', 'option': 'osd_max_backfills', 'value': '2'},
+                        {'who': 'global', 'option': 'osd_pool_default_size', 'value': '3'}]
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = config_dump_output()
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_config.main()
+
+        # the raw values are already set, no `ceph config help`
+        assert not result.value.args[0]['changed']
+        assert m_run_command.call_count == 1
+        assert list(tmp_path.iterdir()) == []
+
+    @patch('ansible.module_utils.basic.AnsibleModule.warn')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_schema_cache_versions(self, m_run_command, m_exit_json, m_warn, tmp_path):
+        common.set_module_args({
+            'schema_cache_dir': str(tmp_path),
+            'who': 'osd',
+            'option': 'osd_max_backfills',
+            'value': '3'
+        })
+        m_exit_json.side_effect = common.exit_json
+        versions = {"mon": {"ceph version 18.2.0 (5dd24139a1eada541a3bc16b6941c5dde975e26d) reef (stable)": 3},
+                    "overall": {"ceph version 18.2.0 (5dd24139a1eada541a3bc16b6941c5dde975e26d) reef (stable)": 3}}
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, json.dumps(fake_config_dump)), (1, 'unknown command')), ''),
+            (0, common.batch_output((0, json.dumps(versions))), ''),
+            (0, common.batch_output((0, '{"name": "osd_max_backfills", "type": "uint", "default": 1}')), ''),
+            (0, '', '')
+        ]
+
+        with pytest.raises(common.AnsibleExitJson):
+            ceph_config.main()
+
+        assert 'ceph versions --format json' in m_run_command.call_args_list[1][1]['data']
+        assert [path.name for path in tmp_path.iterdir()] == [
+            'config-schema-ceph_version_18.2.0_5dd24139a1eada541a3bc16b6941c5dde975e26d_reef_stable_.json'
+        ]
+        m_warn.assert_not_called()
+
+    @patch('ansible.module_utils.basic.AnsibleModule.warn')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_schema_cache_not_writable(self, m_run_command, m_exit_json, m_warn, tmp_path):
+        cache_dir = tmp_path / 'cache'
+        cache_dir.write_text('not a directory')
+        common.set_module_args({
+            'schema_cache_dir': str(cache_dir),
+            'who': 'osd',
+            'option': 'osd_max_backfills',
+            'value': '3'
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.side_effect = [
+            config_dump_output(),
+            (0, common.batch_output((0, '{"name": "osd_max_backfills", "type": "uint", "default": 1}')), ''),
+            (0, '', '')
+        ]
+
+        with pytest.raises(common.AnsibleExitJson):
+            ceph_config.main()
+
+        assert m_warn.call_count == 1
+        assert "Can't cache the type of the options" in m_warn.call_args[0][0]
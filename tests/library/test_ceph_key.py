@@ -0,0 +1,97 @@
+from mock.mock import patch
+import pytest
+import json
+import os
+import common
+import ceph_key
+
+
+auth_ls = json.dumps({"auth_dump": [
+    {"entity": "client.admin", "key": "AQAdminKey==", "caps": {"mds": "allow *", "mgr": "allow *", "mon": "allow *", "osd": "allow *"}},
+    {"entity": "client.glance", "key": "AQGlanceKey==", "caps": {"mon": "profile rbd", "osd": "profile rbd pool=images"}},
+    {"entity": "client.old", "key": "AQOldKey==", "caps": {"mon": "allow r"}},
+]})
+
+
+class TestCephKey(object):
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_bulk_changes(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'entities': [
+                {'name': 'client.glance', 'caps': {'mon': 'profile rbd', 'osd': 'profile rbd pool=images'}},
+                {'name': 'client.cinder', 'caps': {'mon': 'profile rbd', 'osd': 'profile rbd pool=volumes'}},
+                {'name': 'client.admin', 'caps': {'mon': 'allow *'}},
+                {'name': 'client.old', 'state': 'absent'},
+                {'name': 'client.gone', 'state': 'absent'},
+            ]
+        })
+        m_exit_json.side_effect = common.exit_json
+        created = json.dumps([{"entity": "client.cinder", "key": "AQCinderKey==", "caps": {"mon": "profile rbd"}}])
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, auth_ls)), ''),
+            (0, common.batch_output((0, created), (0, ''), (0, '')), ''),
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_key.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert [(e['name'], e['action']) for e in result['entities']] == [('client.glance', 'none'),
+                                                                          ('client.cinder', 'created'),
+                                                                          ('client.admin', 'updated'),
+                                                                          ('client.old', 'removed'),
+                                                                          ('client.gone', 'none')]
+        assert m_run_command.call_count == 2
+        script = m_run_command.call_args_list[1][1]['data'].splitlines()
+        assert script[0] == "ceph auth get-or-create client.cinder mon 'profile rbd' osd 'profile rbd pool=volumes' --format json"
+        assert script[2] == "ceph auth caps client.admin mon 'allow *'"
+        assert script[4] == 'ceph auth rm client.old'
+        assert 'AQ' not in json.dumps(result['entities'])
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_no_change(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'entities': [
+                {'name': 'client.glance', 'caps': {'osd': 'profile rbd pool=images', 'mon': 'profile rbd'}},
+                {'name': 'client.old'},
+            ]
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, auth_ls)), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_key.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert m_run_command.call_count == 1
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_write_keyring(self, m_run_command, m_exit_json, tmp_path):
+        dest = str(tmp_path / 'ceph.client.glance.keyring')
+        common.set_module_args({
+            'entities': [{'name': 'client.glance', 'dest': dest}]
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, auth_ls)), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_key.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert result['entities'] == [dict(name='client.glance', action='none', dest_changed=True)]
+        with open(dest) as f:
+            assert f.read() == ('[client.glance]\n\tkey = AQGlanceKey==\n'
+                                '\tcaps mon = "profile rbd"\n\tcaps osd = "profile rbd pool=images"\n')
+        assert os.stat(dest).st_mode & 0o777 == 0o600
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_key.main()
+
+        assert not result.value.args[0]['changed']
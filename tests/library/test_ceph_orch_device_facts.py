@@ -0,0 +1,91 @@
+from mock.mock import patch
+import datetime
+import pytest
+import json
+import common
+import ceph_orch_device_facts
+
+fresh = (datetime.datetime.utcnow() - datetime.timedelta(seconds=60)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+old = '2020-01-01T00:00:00.000000Z'
+hosts = [{"hostname": "ceph-node0", "addr": "10.10.10.10"}, {"hostname": "ceph-node1", "addr": "10.10.10.11"}]
+
+
+def device(path, size, rotational, available, created, model='HDD1'):
+    return {"path": path, "available": available, "created": created, "device_id": "dev-{}".format(path[-3:]),
+            "human_readable_type": "hdd" if rotational else "ssd",
+            "rejected_reasons": [] if available else ["Has a FileSystem"],
+            "sys_api": {"size": size, "rotational": "1" if rotational else "0", "model": model}}
+
+
+class TestCephOrchDeviceFacts(object):
+
+    @patch('time.sleep')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_refresh_stale_host_only(self, m_run_command, m_exit_json, m_sleep):
+        common.set_module_args({
+            'available': True
+        })
+        m_exit_json.side_effect = common.exit_json
+        cached = [{"name": "ceph-node0", "devices": [device('/dev/sdb', 4000787030016, True, True, fresh)]},
+                  {"name": "ceph-node1", "devices": [device('/dev/sdb', 4000787030016, True, True, old)]}]
+        refreshed = [{"name": "ceph-node1", "devices": [device('/dev/sdb', 4000787030016, True, False, fresh)]}]
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, json.dumps(hosts)), (0, json.dumps(cached))), ''),
+            (0, common.batch_output((0, json.dumps([cached[1]]))), ''),
+            (0, common.batch_output((0, json.dumps(refreshed))), '')
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_device_facts.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert result['refreshed_hosts'] == ['ceph-node1']
+        assert result['stale_hosts'] == []
+        assert 'ceph orch device ls ceph-node1 --format json --refresh' in m_run_command.call_args_list[1][1]['data']
+        assert result['devices'] == [{"host": "ceph-node0", "path": "/dev/sdb", "size": 4000787030016, "rotational": True,
+                                      "available": True, "rejected_reasons": [], "model": "HDD1",
+                                      "device_id": "dev-sdb", "type": "hdd"}]
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_never_refresh(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'refresh': 'never',
+            'rotational': False,
+            'max_size': '1T'
+        })
+        m_exit_json.side_effect = common.exit_json
+        cached = [{"name": "ceph-node0", "devices": [device('/dev/sdb', 4000787030016, True, True, old),
+                                                     device('/dev/nvme0n1', 960197124096, False, True, old, 'NVME1')]}]
+        m_run_command.return_value = 0, common.batch_output((0, json.dumps(hosts)), (0, json.dumps(cached))), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_device_facts.main()
+
+        result = result.value.args[0]
+        assert m_run_command.call_count == 1
+        assert result['stale_hosts'] == ['ceph-node0', 'ceph-node1']
+        assert [d['path'] for d in result['devices']] == ['/dev/nvme0n1']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_invalid_size(self, m_run_command, m_fail_json):
+        common.set_module_args({
+            'min_size': 'foo'
+        })
+        m_fail_json.side_effect = common.fail_json
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_device_facts.main()
+
+        assert result.value.args[0]['msg'] == 'Invalid size for min_size: foo'
+        m_run_command.assert_not_called()
+
+    def test_find_stale_hosts(self):
+        now = datetime.datetime(2023, 1, 1, 1, 0, 0)
+        inventory = {"ceph-node0": {"devices": [device('/dev/sdb', 1, True, True, '2023-01-01T00:50:00.000000Z')]},
+                     "ceph-node1": {"devices": [device('/dev/sdb', 1, True, True, '2023-01-01T00:00:00.000000Z')]}}
+        assert ceph_orch_device_facts.find_stale_hosts(inventory, ['ceph-node0', 'ceph-node1', 'ceph-node2'],
+                                                       1800, now) == ['ceph-node1', 'ceph-node2']
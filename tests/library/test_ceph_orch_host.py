@@ -2,6 +2,8 @@ from mock.mock import patch
 import pytest
 import common
 import ceph_orch_host
+import json
+import re
 
 
 class TestCephOrchHost(object):
@@ -178,15 +180,16 @@ osd                  7"""
         assert result['rc'] == 0
 
     @patch('ceph_orch_host.get_current_state')
-    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
     @patch('ansible.module_utils.basic.AnsibleModule.run_command')
-    def test_state_present_label_diff_error(self, m_run_command, m_exit_json, m_get_current_state):
+    def test_state_present_label_diff_error(self, m_run_command, m_fail_json, m_get_current_state, tmp_path):
         common.set_module_args({
             'state': 'present',
             'name': 'ceph-node5',
-            'labels': ["label1", "label2"]
+            'labels': ["label1", "label2"],
+            'metrics_dir': str(tmp_path)
         })
-        m_exit_json.side_effect = common.exit_json
+        m_fail_json.side_effect = common.fail_json
         stdout = ''
         stderr = 'fake error'
         rc = 0
@@ -201,6 +204,138 @@ osd                  7"""
                                                 "--format",
                                                 "json"], m_get_current_state_stdout, stderr
 
-        with pytest.raises(RuntimeError) as result:
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_host.main()
+
+        assert result.value.args[0]['msg'] == 'fake error'
+        # the failure is accounted in the metrics
+        metrics, = tmp_path.glob('cephadm_ansible_*.prom')
+        assert re.search(r'^cephadm_ansible_module_failed_total{.*} 1$', metrics.read_text(), re.M)
+
+    @patch('time.sleep')
+    @patch('ceph_orch_host.get_current_state')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_state_drain_wait_multiple_hosts(self, m_run_command, m_exit_json, m_get_current_state, m_sleep):
+        common.set_module_args({
+            'state': 'drain',
+            'names': ['ceph-node5', 'ceph-node6'],
+            'wait': True,
+            'poll_interval': 1
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_get_current_state.return_value = 0, [], json.dumps([
+            {"addr": "10.10.10.11", "hostname": "ceph-node5", "labels": [], "status": ""},
+            {"addr": "10.10.10.12", "hostname": "ceph-node6", "labels": [], "status": ""}
+        ]), ''
+        ps = [
+            {"daemon_type": "osd", "daemon_id": "3", "daemon_name": "osd.3", "hostname": "ceph-node5"},
+            {"daemon_type": "osd", "daemon_id": "4", "daemon_name": "osd.4", "hostname": "ceph-node6"}
+        ]
+        rm_status = [
+            {"osd_id": 3, "hostname": "ceph-node5", "draining": True},
+            {"osd_id": 4, "hostname": "ceph-node6", "draining": True}
+        ]
+        osd_df = {"nodes": [{"id": 3, "pgs": 40, "kb_used": 4096}, {"id": 4, "pgs": 20, "kb_used": 2048}]}
+        m_run_command.side_effect = [
+            (0, "Scheduled to remove the following daemons from host 'ceph-node5'", ''),
+            (0, "Scheduled to remove the following daemons from host 'ceph-node6'", ''),
+            (0, common.batch_output((0, json.dumps(ps)), (0, json.dumps(rm_status)), (0, json.dumps(osd_df))), ''),
+            (0, common.batch_output((0, '[]'), (0, 'No OSD remove/replace operations reported'), (0, '{"nodes": []}')), '')
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_host.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert m_run_command.call_count == 4
+        assert m_run_command.call_args_list[0][0][0][-2:] == ['drain', 'ceph-node5']
+        assert m_run_command.call_args_list[1][0][0][-2:] == ['drain', 'ceph-node6']
+        status = result['drain_status']
+        assert status['ceph-node5']['done']
+        assert status['ceph-node5']['pgs_moved'] == 40
+        assert status['ceph-node5']['bytes_moved'] == 4096 * 1024
+        assert status['ceph-node6']['daemons'] == []
+        assert status['ceph-node6']['eta_seconds'] == 0
+        assert result['drain_results']['ceph-node5']['stdout'] == "Scheduled to remove the following daemons from host 'ceph-node5'"
+        assert result['drain_results']['ceph-node6']['cmd'][-2:] == ['drain', 'ceph-node6']
+
+    @patch('ceph_orch_host.get_current_state')
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_state_drain_multiple_hosts_error(self, m_run_command, m_fail_json, m_get_current_state):
+        common.set_module_args({
+            'state': 'drain',
+            'names': ['ceph-node5', 'ceph-node6', 'ceph-node7']
+        })
+        m_fail_json.side_effect = common.fail_json
+        m_get_current_state.return_value = 0, [], json.dumps([
+            {"addr": "10.10.10.11", "hostname": "ceph-node5", "labels": [], "status": ""},
+            {"addr": "10.10.10.12", "hostname": "ceph-node6", "labels": [], "status": ""}
+        ]), ''
+        m_run_command.side_effect = [
+            (1, '', 'Error EINVAL: ceph-node5 is the last _admin host'),
+            (0, "Scheduled to remove the following daemons from host 'ceph-node6'", ''),
+        ]
+
+        with pytest.raises(common.AnsibleFailJson) as result:
             ceph_orch_host.main()
-            assert result == 'fake error'
+
+        result = result.value.args[0]
+        assert result['msg'] == "Can't drain ceph-node5: Error EINVAL: ceph-node5 is the last _admin host"
+        # the drain of the other hosts is still scheduled and reported
+        assert result['drain_results']['ceph-node5']['rc'] == 1
+        assert result['drain_results']['ceph-node6']['changed']
+        assert result['drain_results']['ceph-node7']['stdout'] == 'ceph-node7 is not present, skipping.'
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_get_drain_state_error(self, m_run_command, m_fail_json):
+        common.set_module_args({'name': 'ceph-node5'})
+        m_fail_json.side_effect = common.fail_json
+        m_run_command.return_value = 0, common.batch_output((0, '[]'), (0, '[]'), (1, 'Error: no mgr')), ''
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_host.get_drain_state(ceph_orch_host.AnsibleModule(argument_spec=dict(name=dict(type='str'))))
+
+        assert result.value.args[0]['msg'] == "Can't get the drain progress: Error: no mgr"
+
+    def test_get_drain_progress(self):
+        daemons = [
+            {"daemon_type": "osd", "daemon_id": "3", "daemon_name": "osd.3", "hostname": "ceph-node5"},
+            {"daemon_type": "crash", "daemon_id": "ceph-node5", "daemon_name": "crash.ceph-node5", "hostname": "ceph-node5"},
+            {"daemon_type": "osd", "daemon_id": "1", "daemon_name": "osd.1", "hostname": "ceph-node1"}
+        ]
+        rm_queue = [{"osd_id": 7, "hostname": "ceph-node5"}]
+        osd_df = [{"id": 3, "pgs": 10, "kb_used": 1}, {"id": 7, "pgs": 5, "kb_used": 2}, {"id": 1, "pgs": 99, "kb_used": 99}]
+        progress = ceph_orch_host.get_drain_progress(['ceph-node5'], daemons, rm_queue, osd_df)
+        assert progress['ceph-node5']['osds'] == [3, 7]
+        assert progress['ceph-node5']['pgs'] == 15
+        assert progress['ceph-node5']['bytes_used'] == 3 * 1024
+        assert not progress['ceph-node5']['done']
+
+        # osd.7 missing from `osd df` keeps its last known usage, osd.3 is removed
+        tracked = {'ceph-node5': {3: dict(pgs=10, bytes_used=1024), 7: dict(pgs=5, bytes_used=2048)}}
+        progress = ceph_orch_host.get_drain_progress(['ceph-node5'], daemons[1:], rm_queue, [], tracked)
+        assert progress['ceph-node5']['osds'] == [7]
+        assert progress['ceph-node5']['pgs'] == 5
+        assert tracked['ceph-node5'][3] == dict(pgs=0, bytes_used=0)
+
+        baseline = {'ceph-node5': dict(progress['ceph-node5'], pgs=35, bytes_used=3 * 1024)}
+        ceph_orch_host.update_drain_rates(progress, baseline, 120)
+        assert progress['ceph-node5']['pgs_per_minute'] == 15
+        assert progress['ceph-node5']['eta_seconds'] == 20
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    def test_names_with_state_present(self, m_fail_json):
+        common.set_module_args({
+            'state': 'present',
+            'names': ['ceph-node5']
+        })
+        m_fail_json.side_effect = common.fail_json
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_host.main()
+
+        assert result.value.args[0]['msg'] == "'names' is only supported when state is 'drain'."
@@ -0,0 +1,230 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import ceph_orch_host_maintenance
+
+
+def osd_tree(down=()):
+    nodes = [{"id": -1, "name": "default", "type": "root", "children": [-2, -3]},
+             {"id": -2, "name": "r1", "type": "rack", "children": [-4, -5]},
+             {"id": -3, "name": "r2", "type": "rack", "children": [-6]},
+             {"id": -4, "name": "ceph-node1", "type": "host", "children": [0, 1]},
+             {"id": -5, "name": "ceph-node2", "type": "host", "children": [2]},
+             {"id": -6, "name": "ceph-node3", "type": "host", "children": [3]}]
+    nodes += [{"id": i, "name": "osd.{}".format(i), "type": "osd", "status": "down" if i in down else "up"} for i in range(4)]
+    return json.dumps({"nodes": nodes, "stray": []})
+
+
+def host_ls(maintenance=()):
+    return json.dumps([{"hostname": name, "addr": "192.168.1.{}".format(i), "labels": [],
+                        "status": "Maintenance" if name in maintenance else ""}
+                       for i, name in enumerate(['ceph-node1', 'ceph-node2', 'ceph-node3', 'ceph-node4'])])
+
+
+def pg_stat(**states):
+    return json.dumps({"pg_ready": True,
+                       "pg_summary": {"num_pg_by_state": [{"name": name.replace('_', '+'), "num": num} for name, num in states.items()],
+                                      "num_pgs": sum(states.values())}})
+
+
+class TestCephOrchHostMaintenance(object):
+
+    def test_plan_waves(self):
+        nodes = json.loads(osd_tree())['nodes']
+        hosts = ['ceph-node3', 'ceph-node1', 'ceph-node4', 'ceph-node2']
+
+        waves = ceph_orch_host_maintenance.plan_waves(hosts, nodes, 'rack', None)
+        assert waves == [dict(domain='r2', hosts=['ceph-node3']),
+                         dict(domain='r1', hosts=['ceph-node1', 'ceph-node2']),
+                         dict(domain='ceph-node4', hosts=['ceph-node4'])]
+
+        waves = ceph_orch_host_maintenance.plan_waves(hosts, nodes, 'rack', 1)
+        assert [wave['hosts'] for wave in waves] == [['ceph-node3'], ['ceph-node1'], ['ceph-node2'], ['ceph-node4']]
+
+        waves = ceph_orch_host_maintenance.plan_waves(hosts, nodes, 'host', None)
+        assert [wave['domain'] for wave in waves] == hosts
+
+    def test_is_settled(self):
+        is_settled = ceph_orch_host_maintenance.is_settled
+        degraded = {'active+undersized+degraded': 10, 'active+clean': 20}
+        assert is_settled('enter', degraded, {0: 'down'}, [0])
+        assert not is_settled('enter', degraded, {0: 'up'}, [0])
+        assert not is_settled('enter', {'peering': 2, 'active+clean': 20}, {0: 'down'}, [0])
+        assert not is_settled('exit', degraded, {0: 'up'}, [0])
+        assert is_settled('exit', {'active+clean+scrubbing': 1, 'active+clean': 20}, {0: 'up'}, [0])
+
+    @patch('time.sleep')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_enter_wave(self, m_run_command, m_exit_json, m_sleep):
+        common.set_module_args({
+            'hosts': ['ceph-node1', 'ceph-node2', 'ceph-node3'],
+            'failure_domain': 'rack',
+            'wave': 0
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, host_ls()), (0, osd_tree())), ''),
+            # r1: ok-to-stop, enter, not settled yet, settled
+            (0, common.batch_output((0, ''), (0, ''), (0, '')), ''),
+            (0, common.batch_output((0, ''), (0, '')), ''),
+            (0, common.batch_output((0, pg_stat(peering=5, active_clean=20)), (0, osd_tree(down=[0, 1, 2]))), ''),
+            (0, common.batch_output((0, pg_stat(active_undersized_degraded=15, active_clean=10)), (0, osd_tree(down=[0, 1, 2]))), ''),
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_host_maintenance.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert [(wave['domain'], wave['changed']) for wave in result['waves']] == [('r1', ['ceph-node1', 'ceph-node2'])]
+        assert all('duration' in wave and 'settle_time' in wave for wave in result['waves'])
+        assert m_sleep.call_count == 1
+
+        ok_to_stop = m_run_command.call_args_list[1][1]['data']
+        assert 'ceph orch host ok-to-stop ceph-node1' in ok_to_stop
+        assert 'ceph osd ok-to-stop 0 1 2' in ok_to_stop
+        enter = m_run_command.call_args_list[2][1]['data']
+        assert 'ceph orch host maintenance enter ceph-node1' in enter
+        assert 'ceph orch host maintenance enter ceph-node2' in enter
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_enter_without_wave(self, m_run_command, m_fail_json):
+        common.set_module_args({
+            'hosts': ['ceph-node1', 'ceph-node2', 'ceph-node3'],
+            'failure_domain': 'rack'
+        })
+        m_fail_json.side_effect = common.fail_json
+        m_run_command.return_value = 0, common.batch_output((0, host_ls()), (0, osd_tree())), ''
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_host_maintenance.main()
+
+        assert "'wave' is required" in result.value.args[0]['msg']
+        # r1 and r2 are never in maintenance at the same time
+        assert not any('maintenance enter' in call[1].get('data', '') for call in m_run_command.call_args_list)
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_not_ok_to_stop(self, m_run_command, m_fail_json):
+        common.set_module_args({
+            'hosts': ['ceph-node1', 'ceph-node2'],
+            'wave': 0
+        })
+        m_fail_json.side_effect = common.fail_json
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, host_ls()), (0, osd_tree())), ''),
+            (0, common.batch_output((1, 'unsafe to stop osd(s) at this time (12 PGs are or would become offline)'), (1, '')), ''),
+        ]
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_host_maintenance.main()
+
+        result = result.value.args[0]
+        assert 'ceph-node1: unsafe to stop' in result['msg']
+        assert m_run_command.call_count == 2
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_skip_not_ok_to_stop(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'hosts': ['ceph-node1', 'ceph-node2'],
+            'failure_domain': 'rack',
+            'wave': 0,
+            'ok_to_stop': 'skip',
+            'wait': False
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, host_ls()), (0, osd_tree())), ''),
+            (0, common.batch_output((1, 'It is NOT safe to stop mon.ceph-node1'), (0, ''), (0, '')), ''),
+            (0, common.batch_output((0, '')), ''),
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_host_maintenance.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert result['skipped_hosts'] == ['ceph-node1']
+        assert [wave['changed'] for wave in result['waves']] == [['ceph-node2']]
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_exit_already_done(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'hosts': ['ceph-node1', 'ceph-node2'],
+            'state': 'exit'
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, host_ls()), (0, osd_tree())), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_host_maintenance.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert m_run_command.call_count == 1
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_exit_check_mode(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'hosts': ['ceph-node1', 'ceph-node2'],
+            'state': 'exit',
+            '_ansible_check_mode': True
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, host_ls(maintenance=['ceph-node2'])), (0, osd_tree())), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_host_maintenance.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert [wave['changed'] for wave in result['waves']] == [[], ['ceph-node2']]
+        assert m_run_command.call_count == 1
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_single_wave(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'hosts': ['ceph-node1', 'ceph-node2', 'ceph-node3'],
+            'failure_domain': 'rack',
+            'max_batch_size': 1,
+            'wave': 1,
+            'wait': False
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, host_ls()), (0, osd_tree())), ''),
+            (0, common.batch_output((0, ''), (0, '')), ''),
+            (0, common.batch_output((0, '')), ''),
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_host_maintenance.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        # only the second wave (ceph-node2 of r1) is processed
+        assert [(wave['domain'], wave['changed']) for wave in result['waves']] == [('r1', ['ceph-node2'])]
+        assert m_run_command.call_args_list[1][1]['data'].count('ceph osd ok-to-stop 2') == 1
+        assert 'ceph orch host maintenance enter ceph-node2' in m_run_command.call_args_list[2][1]['data']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_invalid_wave(self, m_run_command, m_fail_json):
+        common.set_module_args({
+            'hosts': ['ceph-node1'],
+            'wave': 1
+        })
+        m_fail_json.side_effect = common.fail_json
+        m_run_command.return_value = 0, common.batch_output((0, host_ls()), (0, osd_tree())), ''
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_host_maintenance.main()
+
+        assert result.value.args[0]['msg'] == 'Invalid wave 1, there are 1 wave(s).'
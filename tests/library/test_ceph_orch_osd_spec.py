@@ -0,0 +1,88 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import ceph_orch_osd_spec
+
+
+TB = 1000 ** 4
+
+
+def devices(host, hdd=0, nvme=0, hdd_size=16 * TB, nvme_size=1600 * 1000 ** 3, used=0):
+    result = [dict(host=host, path='/dev/sd{}'.format(chr(ord('a') + i)), size=hdd_size, rotational=True,
+                   available=i >= used, model='ST16000NM001G') for i in range(hdd)]
+    result += [dict(host=host, path='/dev/nvme{}n1'.format(i), size=nvme_size, rotational=False,
+                    available=True, model='PM1735') for i in range(nvme)]
+    return result
+
+
+class TestCephOrchOsdSpec(object):
+
+    def test_group_hosts(self):
+        inventory = (devices('ceph-node1', hdd=12, nvme=2) + devices('ceph-node2', nvme=4)
+                     + devices('ceph-node3', hdd=12, nvme=2) + devices('ceph-node4', hdd=2, used=2)
+                     + devices('ceph-node5', hdd=13, nvme=2, used=1))
+        groups, skipped = ceph_orch_osd_spec.group_hosts(inventory)
+
+        # the used devices don't count
+        assert [group['hosts'] for group in groups] == [['ceph-node1', 'ceph-node3', 'ceph-node5'], ['ceph-node2']]
+        assert skipped == ['ceph-node4']
+
+    def test_plan_group(self):
+        group = dict(devices=devices('ceph-node1', hdd=12, nvme=2))
+        spec = ceph_orch_osd_spec.plan_group(group, 12, None, 1, 4 * TB)
+
+        assert spec == dict(data_devices=dict(rotational=1), db_devices=dict(rotational=0), db_slots=6, block_db_size=248 * 1024 ** 3)
+        assert (group['data_devices'], group['db_devices'], group['osds_per_host']) == (12, 2, 12)
+
+        with pytest.raises(ValueError, match='12 data devices for 2 DB devices, more than 4 per DB device'):
+            ceph_orch_osd_spec.plan_group(group, 4, None, 1, 4 * TB)
+        with pytest.raises(ValueError, match='6 DB of 300000000000 bytes do not fit'):
+            ceph_orch_osd_spec.plan_group(group, 12, 300 * 1000 ** 3, 1, 4 * TB)
+
+    def test_split_large_nvme(self):
+        group = dict(devices=devices('ceph-node1', nvme=4, nvme_size=7680 * 1000 ** 3))
+        assert ceph_orch_osd_spec.plan_group(group, 12, None, 2, 4 * 1024 ** 4) == dict(data_devices=dict(rotational=0), osds_per_device=2)
+        assert group['osds_per_host'] == 8
+
+        group = dict(devices=devices('ceph-node1', nvme=4))
+        assert ceph_orch_osd_spec.plan_group(group, 12, None, 2, 4 * 1024 ** 4) == dict(data_devices=dict(rotational=0))
+        assert group['osds_per_host'] == 4
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    def test_specs(self, m_exit_json):
+        common.set_module_args({
+            'devices': (devices('ceph-node1', hdd=12, nvme=2) + devices('ceph-node2', hdd=12, nvme=2)
+                        + devices('ceph-node3', hdd=12, nvme=2, nvme_size=3200 * 1000 ** 3) + devices('ceph-node4', hdd=4)),
+            'block_db_size': '200G',
+            'extra_spec': {'encrypted': True}
+        })
+        m_exit_json.side_effect = common.exit_json
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_osd_spec.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        db_spec = dict(data_devices=dict(rotational=1), db_devices=dict(rotational=0), db_slots=6, block_db_size=200 * 1024 ** 3, encrypted=True)
+        assert result['specs'] == [
+            dict(service_type='osd', service_id='osd-12hdd-2ssd', placement=dict(hosts=['ceph-node1', 'ceph-node2']), spec=db_spec),
+            dict(service_type='osd', service_id='osd-12hdd-2ssd-2', placement=dict(hosts=['ceph-node3']), spec=db_spec),
+            dict(service_type='osd', service_id='osd-4hdd', placement=dict(hosts=['ceph-node4']),
+                 spec=dict(data_devices=dict(rotational=1), encrypted=True)),
+        ]
+        assert [json.loads(doc) for doc in result['spec'].split('\n---\n')] == result['specs']
+        assert result['groups'][2] == dict(service_id='osd-4hdd', hosts=['ceph-node4'], data_devices=4, db_devices=0, osds_per_host=4)
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    def test_invalid_size(self, m_fail_json):
+        common.set_module_args({
+            'devices': devices('ceph-node1', hdd=1),
+            'block_db_size': 'big'
+        })
+        m_fail_json.side_effect = common.fail_json
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_osd_spec.main()
+
+        assert result.value.args[0]['msg'] == 'Invalid size for block_db_size: big'
@@ -0,0 +1,140 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import ceph_orch_placement
+
+
+racks = dict(r1=['ceph-node1', 'ceph-node2'], r2=['ceph-node3', 'ceph-node4'], r3=['ceph-node5', 'ceph-node6'])
+
+
+def osd_tree():
+    nodes = [{"id": -1, "name": "default", "type": "root", "children": [-2, -3, -4]}]
+    hosts = []
+    for i, (rack, names) in enumerate(sorted(racks.items())):
+        children = [-10 - len(hosts) - j for j in range(len(names))]
+        nodes.append({"id": -2 - i, "name": rack, "type": "rack", "children": children})
+        hosts.extend(names)
+    nodes += [{"id": -10 - i, "name": name, "type": "host", "children": []} for i, name in enumerate(hosts)]
+    return nodes
+
+
+def host_ls(maintenance=(), small=('ceph-node1',)):
+    return [{"hostname": name, "addr": "192.168.1.{}".format(i), "labels": ["mon", "rgw"],
+             "status": "Maintenance" if name in maintenance else "",
+             "cpu_count": 8 if name in small else 32,
+             "memory_total_kb": 32 * 1024 * 1024 if name in small else 128 * 1024 * 1024}
+            for i, name in enumerate(['ceph-node{}'.format(n) for n in range(1, 7)])]
+
+
+def daemon(host, daemon_type, service_name=None):
+    return dict(hostname=host, daemon_type=daemon_type, service_name=service_name or daemon_type)
+
+
+class TestCephOrchPlacement(object):
+
+    def test_host_weights(self):
+        weights = ceph_orch_placement.host_weights(host_ls() + [{"hostname": "ceph-node7"}])
+        assert weights['ceph-node1'] == 0.25
+        assert weights['ceph-node2'] == 1.0
+        assert weights['ceph-node7'] == 1.0
+
+    def test_spread_across_domains(self):
+        services = [dict(service_type='mgr', count=3), dict(service_type='mon', count=5)]
+        placements, errors = ceph_orch_placement.plan_placement(services, host_ls(), osd_tree(), [], 'rack')
+
+        assert errors == []
+        # one mgr per rack, on the largest hosts
+        assert placements['mgr'] == dict(hosts=['ceph-node2', 'ceph-node3', 'ceph-node5'], domains=dict(r1=1, r2=1, r3=1))
+        # the mons prefer the hosts without mgr, the small host comes last
+        assert placements['mon'] == dict(hosts=['ceph-node2', 'ceph-node3', 'ceph-node4', 'ceph-node5', 'ceph-node6'],
+                                         domains=dict(r1=1, r2=2, r3=2))
+
+    def test_keep_running_daemons(self):
+        services = [dict(service_type='mgr', count=2)]
+        daemons = [daemon('ceph-node1', 'mgr'), daemon('ceph-node6', 'mgr'), daemon('ceph-node4', 'mds', 'mds.cephfs')]
+        placements, errors = ceph_orch_placement.plan_placement(services, host_ls(), osd_tree(), daemons, 'rack')
+
+        # the running mgrs stay where they are, even on the small host
+        assert placements['mgr']['hosts'] == ['ceph-node1', 'ceph-node6']
+
+        # two mgrs in a rack: the one of the smallest host is moved to another rack
+        daemons = [daemon('ceph-node1', 'mgr'), daemon('ceph-node2', 'mgr')]
+        placements, errors = ceph_orch_placement.plan_placement(services, host_ls(maintenance=['ceph-node3']), osd_tree(), daemons, 'rack')
+
+        assert placements['mgr']['hosts'] == ['ceph-node2', 'ceph-node4']
+
+    def test_anti_affinity(self):
+        services = [dict(service_type='rgw', service_id='default', count=4, label='rgw', anti_affinity=['mds'])]
+        daemons = [daemon('ceph-node2', 'mds', 'mds.cephfs'), daemon('ceph-node4', 'mds', 'mds.cephfs')]
+        placements, errors = ceph_orch_placement.plan_placement(services, host_ls(), osd_tree(), daemons, 'rack')
+
+        assert placements['rgw.default']['hosts'] == ['ceph-node1', 'ceph-node3', 'ceph-node5', 'ceph-node6']
+
+        services[0]['count'] = 5
+        placements, errors = ceph_orch_placement.plan_placement(services, host_ls(), osd_tree(), daemons, 'rack')
+        assert placements == {}
+        assert errors == ['rgw.default: only 4 host(s) available for 5 daemon(s)']
+
+        # the services planned after rgw avoid it as well
+        services = [dict(service_type='rgw', service_id='default', count=4, label='rgw', anti_affinity=['mds']),
+                    dict(service_type='mds', service_id='cephfs', count=2)]
+        placements, errors = ceph_orch_placement.plan_placement(services, host_ls(), osd_tree(), [], 'rack')
+        assert errors == []
+        assert placements['rgw.default']['hosts'] == ['ceph-node2', 'ceph-node3', 'ceph-node4', 'ceph-node5']
+        assert placements['mds.cephfs']['hosts'] == ['ceph-node1', 'ceph-node6']
+
+        # and rgw avoids the mds which are running, even if they are planned afterwards
+        daemons = [daemon('ceph-node2', 'mds', 'mds.cephfs'), daemon('ceph-node3', 'mds', 'mds.cephfs')]
+        placements, errors = ceph_orch_placement.plan_placement(services, host_ls(), osd_tree(), daemons, 'rack')
+        assert errors == []
+        assert placements['rgw.default']['hosts'] == ['ceph-node1', 'ceph-node4', 'ceph-node5', 'ceph-node6']
+        assert placements['mds.cephfs']['hosts'] == ['ceph-node2', 'ceph-node3']
+
+        services[1]['count'] = 3
+        placements, errors = ceph_orch_placement.plan_placement(services, host_ls(), osd_tree(), daemons, 'rack')
+        assert errors == ['mds.cephfs: only 2 host(s) available for 3 daemon(s)']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_specs(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'failure_domain': 'rack',
+            'services': [
+                {'service_type': 'mgr', 'count': 3, 'label': 'mon'},
+                {'service_type': 'rgw', 'service_id': 'default', 'count': 2, 'extra': {'spec': {'rgw_frontend_port': 8080}}}
+            ]
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, json.dumps(host_ls())),
+                                                            (0, json.dumps({"nodes": osd_tree(), "stray": []})),
+                                                            (0, json.dumps([daemon('ceph-node1', 'mgr')]))), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_placement.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert result['specs'] == [
+            {'service_type': 'mgr', 'placement': {'hosts': ['ceph-node1', 'ceph-node3', 'ceph-node5']}},
+            {'service_type': 'rgw', 'service_id': 'default', 'placement': {'hosts': ['ceph-node2', 'ceph-node4']},
+             'spec': {'rgw_frontend_port': 8080}}
+        ]
+        assert [json.loads(doc) for doc in result['spec'].split('\n---\n')] == result['specs']
+        assert m_run_command.call_count == 1
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_not_enough_hosts(self, m_run_command, m_fail_json):
+        common.set_module_args({
+            'services': [{'service_type': 'mon', 'count': 5, 'hosts': ['ceph-node1', 'ceph-node2', 'ceph-node3']}]
+        })
+        m_fail_json.side_effect = common.fail_json
+        m_run_command.return_value = 0, common.batch_output((0, json.dumps(host_ls())),
+                                                            (0, json.dumps({"nodes": osd_tree(), "stray": []})),
+                                                            (0, '[]')), ''
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_placement.main()
+
+        assert result.value.args[0]['msg'] == "Can't place the service(s):\nmon: only 3 host(s) available for 5 daemon(s)"
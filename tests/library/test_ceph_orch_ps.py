@@ -0,0 +1,82 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import ceph_orch_ps
+
+fake_ps = [
+    {"daemon_type": "osd", "daemon_id": "0", "daemon_name": "osd.0", "hostname": "ceph-node0",
+     "status": 1, "status_desc": "running", "container_image_name": "quay.io/ceph/ceph:v18",
+     "memory_usage": 123456, "events": ["2023-01-01T00:00:00Z daemon:osd.0 [INFO] \"Deployed osd.0\""]},
+    {"daemon_type": "osd", "daemon_id": "1", "daemon_name": "osd.1", "hostname": "ceph-node1",
+     "status": 0, "status_desc": "stopped", "container_image_name": "quay.io/ceph/ceph:v18",
+     "memory_usage": 654321, "events": []}
+]
+
+
+class TestCephOrchPs(object):
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_filters_and_fields(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'daemon_type': 'osd',
+            'hostname': 'ceph-node0',
+            'fields': ['daemon_name', 'container_image_name']
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, json.dumps(fake_ps[:1], indent=2), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_ps.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert result['cmd'] == ['cephadm', 'shell', 'ceph', 'orch', 'ps', 'ceph-node0',
+                                 '--daemon_type', 'osd', '--format', 'json']
+        assert result['daemons'] == [{'daemon_name': 'osd.0', 'container_image_name': 'quay.io/ceph/ceph:v18'}]
+        assert 'events' not in result['stdout']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_status_filter(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'status': 'stopped',
+            'refresh': True
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, json.dumps(fake_ps), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_ps.main()
+
+        result = result.value.args[0]
+        assert result['cmd'][-1] == '--refresh'
+        assert result['daemons'] == [{'daemon_name': 'osd.1', 'daemon_type': 'osd', 'daemon_id': '1',
+                                      'hostname': 'ceph-node1', 'status': 0, 'status_desc': 'stopped'}]
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_no_daemon(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'daemon_type': 'rgw'
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, 'No daemons reported', ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_ps.main()
+
+        assert result.value.args[0]['daemons'] == []
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_failure(self, m_run_command, m_fail_json):
+        common.set_module_args({})
+        m_fail_json.side_effect = common.fail_json
+        m_run_command.return_value = 1, '', 'Error ENOENT: Module not found'
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_ps.main()
+
+        assert result.value.args[0]['msg'] == "Can't list daemons: Error ENOENT: Module not found"
@@ -0,0 +1,157 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import ceph_orch_upgrade
+
+target = 'quay.io/ceph/ceph:v18.2.1'
+idle_status = {"target_image": None, "in_progress": False, "which": "<unknown>",
+               "services_complete": [], "progress": None, "message": "", "is_paused": False}
+check_needed = {"needs_update": {"mgr.ceph-node0.abcdef": {"current_name": "quay.io/ceph/ceph:v17"},
+                                 "osd.0": {"current_name": "quay.io/ceph/ceph:v17"}},
+                "up_to_date": [], "target_name": target, "target_digest": "quay.io/ceph/ceph@sha256:1234"}
+check_done = {"needs_update": {}, "up_to_date": ["mgr.ceph-node0.abcdef", "osd.0"],
+              "target_name": target, "target_digest": "quay.io/ceph/ceph@sha256:1234"}
+
+
+def running_status(progress, is_paused=False, message=''):
+    return {"target_image": "quay.io/ceph/ceph@sha256:1234", "in_progress": True, "which": "Upgrading all daemon types on all hosts",
+            "services_complete": [], "progress": progress, "message": message, "is_paused": is_paused}
+
+
+class TestCephOrchUpgrade(object):
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_already_upgraded(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'target_image': target
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, json.dumps(idle_status)), (0, json.dumps(check_done))), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_upgrade.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert result['pending'] == []
+        assert m_run_command.call_count == 1
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_staggered_start(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'target_image': target,
+            'daemon_types': ['mgr', 'mon'],
+            'hosts': ['ceph-node0'],
+            'limit': 2
+        })
+        m_exit_json.side_effect = common.exit_json
+        ps = [{"daemon_name": "mgr.ceph-node0.abcdef", "hostname": "ceph-node0", "service_name": "mgr"},
+              {"daemon_name": "osd.0", "hostname": "ceph-node0", "service_name": "osd.default"}]
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, json.dumps(idle_status)), (0, json.dumps(check_needed)), (0, json.dumps(ps))), ''),
+            (0, 'Initiating upgrade to quay.io/ceph/ceph:v18.2.1', '')
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_upgrade.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert result['pending'] == ['mgr.ceph-node0.abcdef']
+        assert result['cmd'] == ['cephadm', 'shell', 'ceph', 'orch', 'upgrade', 'start', '--image', target,
+                                 '--daemon-types', 'mgr,mon', '--hosts', 'ceph-node0', '--limit', '2']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_selection_already_upgraded(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'target_image': target,
+            'daemon_types': ['mon']
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, json.dumps(idle_status)), (0, json.dumps(check_needed))), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_upgrade.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert m_run_command.call_count == 1
+
+    @patch('time.sleep')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_wait_pause_on_health(self, m_run_command, m_exit_json, m_sleep):
+        common.set_module_args({
+            'target_image': target,
+            'wait': True,
+            'poll_interval': 1,
+            'pause_on_health': ['PG_AVAILABILITY']
+        })
+        m_exit_json.side_effect = common.exit_json
+        health_warn = {"status": "HEALTH_WARN", "checks": {"PG_AVAILABILITY": {"severity": "HEALTH_WARN"}}}
+        health_ok = {"status": "HEALTH_OK", "checks": {}}
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, json.dumps(idle_status)), (0, json.dumps(check_needed))), ''),
+            (0, 'Initiating upgrade to quay.io/ceph/ceph:v18.2.1', ''),
+            (0, common.batch_output((0, json.dumps(running_status('1/10 daemons upgraded'))), (0, json.dumps(health_warn))), ''),
+            (0, 'Paused upgrade to quay.io/ceph/ceph@sha256:1234', ''),
+            (0, common.batch_output((0, json.dumps(running_status('1/10 daemons upgraded', True))), (0, json.dumps(health_ok))), ''),
+            (0, 'Resumed upgrade to quay.io/ceph/ceph@sha256:1234', ''),
+            (0, common.batch_output((0, json.dumps(idle_status)), (0, json.dumps(health_ok))), '')
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_upgrade.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert m_run_command.call_args_list[3][0][0][-2:] == ['upgrade', 'pause']
+        assert m_run_command.call_args_list[5][0][0][-2:] == ['upgrade', 'resume']
+        assert not result['upgrade_status']['in_progress']
+
+    @patch('time.sleep')
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_wait_upgrade_error(self, m_run_command, m_fail_json, m_sleep):
+        common.set_module_args({
+            'target_image': target,
+            'wait': True
+        })
+        m_fail_json.side_effect = common.fail_json
+        health = {"status": "HEALTH_WARN", "checks": {"UPGRADE_FAILED_PULL": {"severity": "HEALTH_WARN"}}}
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, json.dumps(running_status('0/10 daemons upgraded'))), (0, json.dumps(check_needed))), ''),
+            (0, common.batch_output((0, json.dumps(running_status('0/10 daemons upgraded', True, 'Error: UPGRADE_FAILED_PULL'))),
+                                    (0, json.dumps(health))), '')
+        ]
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_orch_upgrade.main()
+
+        result = result.value.args[0]
+        assert 'UPGRADE_FAILED_PULL' in result['msg']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_pause_not_in_progress(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'state': 'paused'
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, json.dumps(idle_status))), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_orch_upgrade.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+
+    def test_update_rates(self):
+        status = {'daemons_upgraded': 7, 'daemons_total': 10}
+        ceph_orch_upgrade.update_rates(status, 1, 120)
+        assert status['daemons_per_minute'] == 3
+        assert status['eta_seconds'] == 60
@@ -0,0 +1,118 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import ceph_osd_flags
+
+
+def osd_dump(flags=('sortbitwise', 'recovery_deletes'), osd_states=None, crush_node_flags=None):
+    osd_states = osd_states or {}
+    return json.dumps({"epoch": 42,
+                       "flags": ','.join(flags),
+                       "flags_set": list(flags),
+                       "osds": [{"osd": i, "up": 1, "in": 1, "state": ["exists", "up"] + osd_states.get(i, [])} for i in range(3)],
+                       "crush_node_flags": crush_node_flags or {},
+                       "device_class_flags": {}})
+
+
+class TestCephOsdFlags(object):
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_set_cluster_flags(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'flags': ['noout', 'norebalance']
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, osd_dump(flags=['sortbitwise', 'norebalance']))), ''),
+            (0, common.batch_output((0, 'noout is set')), ''),
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_osd_flags.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert result['flags_changed'] == [dict(flag='noout', target=None, action='set')]
+        assert m_run_command.call_args_list[1][1]['data'].splitlines()[0] == 'ceph osd set noout'
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_set_group_flags(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'flags': ['noout', 'noin'],
+            'targets': ['1', 'ceph-node0']
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, osd_dump(osd_states={1: ['noout']}, crush_node_flags={'ceph-node0': ['noin']}))), ''),
+            (0, common.batch_output((0, ''), (0, '')), ''),
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_osd_flags.main()
+
+        result = result.value.args[0]
+        assert result['flags_changed'] == [dict(flag='noin', target='osd.1', action='set'),
+                                           dict(flag='noout', target='ceph-node0', action='set')]
+        script = m_run_command.call_args_list[1][1]['data']
+        assert 'ceph osd set-group noin osd.1' in script
+        assert 'ceph osd set-group noout ceph-node0' in script
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_already_set(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'flags': ['noout'],
+            'targets': ['osd.2']
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, osd_dump(osd_states={2: ['noout']}))), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_osd_flags.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert result['flags_changed'] == []
+        assert m_run_command.call_count == 1
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_restore(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'state': 'restored',
+            'restore': [dict(flag='noout', target=None, action='set'),
+                        dict(flag='noout', target='osd.1', action='set'),
+                        dict(flag='noup', target='osd.2', action='set')]
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.side_effect = [
+            # osd.2 noup has been unset meanwhile
+            (0, common.batch_output((0, osd_dump(flags=['noout'], osd_states={1: ['noout']}))), ''),
+            (0, common.batch_output((0, ''), (0, '')), ''),
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_osd_flags.main()
+
+        result = result.value.args[0]
+        assert result['flags_changed'] == [dict(flag='noout', target=None, action='unset'),
+                                           dict(flag='noout', target='osd.1', action='unset')]
+        script = m_run_command.call_args_list[1][1]['data']
+        assert 'ceph osd unset noout' in script
+        assert 'ceph osd unset-group noout osd.1' in script
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    def test_invalid_group_flag(self, m_fail_json):
+        common.set_module_args({
+            'flags': ['norebalance'],
+            'targets': ['osd.1']
+        })
+        m_fail_json.side_effect = common.fail_json
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_osd_flags.main()
+
+        assert "norebalance can't be set on OSDs" in result.value.args[0]['msg']
@@ -0,0 +1,74 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import ceph_osd_memory_target
+
+GIB = 1024 * 1024 * 1024
+
+fake_hosts = [
+    {"addr": "10.10.10.11", "hostname": "ceph-node0", "labels": [], "status": "", "memory_total_kb": 64 * 1024 * 1024},
+    {"addr": "10.10.10.12", "hostname": "ceph-node1", "labels": [], "status": "", "memory_total_kb": 32 * 1024 * 1024},
+    {"addr": "10.10.10.13", "hostname": "ceph-node2", "labels": [], "status": "", "memory_total_kb": 16 * 1024 * 1024}
+]
+fake_ps = [
+    {"daemon_type": "mon", "daemon_id": "ceph-node0", "hostname": "ceph-node0"},
+    {"daemon_type": "mgr", "daemon_id": "ceph-node0.abc", "hostname": "ceph-node0"},
+    {"daemon_type": "osd", "daemon_id": "0", "hostname": "ceph-node0"},
+    {"daemon_type": "osd", "daemon_id": "1", "hostname": "ceph-node0"},
+    {"daemon_type": "osd", "daemon_id": "2", "hostname": "ceph-node1"},
+    {"daemon_type": "crash", "daemon_id": "ceph-node2", "hostname": "ceph-node2"}
+]
+
+
+class TestCephOsdMemoryTarget(object):
+
+    def test_compute_osd_memory_target(self):
+        reserved = ceph_osd_memory_target.DEFAULT_RESERVED_MEMORY
+        # (64G * 0.7 - 2G (mon) - 4G (mgr)) / 2
+        assert ceph_osd_memory_target.compute_osd_memory_target(64 * GIB, ['mon', 'mgr', 'osd', 'osd'], 0.7, reserved) == 20829962240
+        assert ceph_osd_memory_target.compute_osd_memory_target(64 * GIB, ['mon', 'mgr', 'osd', 'osd'], 0.7, reserved, 8 * GIB) == 8 * GIB
+        assert ceph_osd_memory_target.compute_osd_memory_target(64 * GIB, ['mon'], 0.7, reserved) is None
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_set_changed_values_only(self, m_run_command, m_exit_json):
+        common.set_module_args({})
+        m_exit_json.side_effect = common.exit_json
+        config_dump = [{"section": "osd", "mask": "host:ceph-node1", "name": "osd_memory_target",
+                        "value": str(int(32 * GIB * 0.7) // 1048576 * 1048576)}]
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, json.dumps(fake_hosts)), (0, json.dumps(fake_ps)), (0, json.dumps(config_dump))), ''),
+            (0, common.batch_output((0, '')), '')
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_osd_memory_target.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert sorted(result['targets']) == ['ceph-node0', 'ceph-node1']
+        assert result['targets']['ceph-node0']['changed']
+        assert not result['targets']['ceph-node1']['changed']
+        script = m_run_command.call_args[1]['data']
+        assert 'ceph config set osd/host:ceph-node0 osd_memory_target 20829962240' in script
+        assert 'ceph-node1' not in script
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_check_mode(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'hosts': ['ceph-node1'],
+            'memory_total': {'ceph-node1': 16 * GIB},
+            '_ansible_check_mode': True
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, json.dumps(fake_hosts)), (0, json.dumps(fake_ps)), (0, '[]')), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_osd_memory_target.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert m_run_command.call_count == 1
+        assert result['targets']['ceph-node1']['target'] == int(16 * GIB * 0.7) // 1048576 * 1048576
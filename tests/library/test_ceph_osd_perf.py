@@ -0,0 +1,84 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import ceph_osd_perf
+
+fake_perf_dump = {
+    "rocksdb": {"get_latency": {"avgcount": 4, "sum": 0.02}, "submit_latency": {"avgcount": 0, "sum": 0.0},
+                "compact": 3, "compact_range": 0},
+    "bluefs": {"db_total_bytes": 1000, "db_used_bytes": 500, "slow_used_bytes": 0},
+    "bluestore": {"kv_commit_lat": {"avgcount": 2, "sum": 0.004}}
+}
+fake_bench = {"bytes_written": 1073741824, "blocksize": 4194304, "elapsed_sec": 2.0,
+              "bytes_per_sec": 536870912, "iops": 128}
+
+
+class TestCephOsdPerf(object):
+
+    def test_compare_metrics(self):
+        comparison = ceph_osd_perf.compare_metrics({'a': 10, 'b': 0, 'c': None}, {'a': 5, 'b': 1, 'c': 2})
+        assert comparison['a'] == {'before': 10, 'after': 5, 'change_pct': -50.0}
+        assert comparison['b']['change_pct'] is None
+        assert comparison['c']['change_pct'] is None
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_capture_with_baseline(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'osd_id': 0,
+            'baseline': {'bench_iops': 64, 'rocksdb_get_latency': 0.01}
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, ''), (0, json.dumps(fake_bench)), (0, json.dumps(fake_perf_dump))), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_osd_perf.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        # the counters are reset so that they only cover the bench
+        script = [line for line in m_run_command.call_args[1]['data'].splitlines() if not line.startswith('printf')]
+        assert script == ['ceph tell osd.0 perf reset all',
+                          'ceph tell osd.0 bench 1073741824 4194304 --format json',
+                          'ceph tell osd.0 perf dump --format json']
+        assert result['metrics']['rocksdb_get_latency'] == 0.005
+        assert result['metrics']['rocksdb_submit_latency'] is None
+        assert result['metrics']['bluefs_db_used_bytes'] == 500
+        assert result['comparison']['bench_iops']['change_pct'] == 100.0
+        assert result['comparison']['rocksdb_get_latency']['change_pct'] == -50.0
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_check_mode(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'osd_id': 0,
+            '_ansible_check_mode': True
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, json.dumps(fake_perf_dump))), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_osd_perf.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        # neither reset nor bench, only the dump
+        script = [line for line in m_run_command.call_args[1]['data'].splitlines() if not line.startswith('printf')]
+        assert script == ['ceph tell osd.0 perf dump --format json']
+        assert 'bench_iops' not in result['metrics']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_osd_down(self, m_run_command, m_fail_json):
+        common.set_module_args({
+            'osd_id': 0,
+            'bench': False
+        })
+        m_fail_json.side_effect = common.fail_json
+        m_run_command.return_value = 0, common.batch_output((6, 'Error ENXIO: problem getting command descriptions from osd.0')), ''
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            ceph_osd_perf.main()
+
+        assert 'ENXIO' in result.value.args[0]['msg']
@@ -0,0 +1,106 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import ceph_pool
+
+
+def pool_detail(name, pool_type=1, size=3, min_size=2, pg_num=32, autoscale='on', ratio=None, bulk=False, applications=()):
+    return {"pool_name": name, "type": pool_type, "size": size, "min_size": min_size,
+            "pg_num": pg_num, "pg_num_target": pg_num, "pg_autoscale_mode": autoscale,
+            "flags_names": "hashpspool,bulk" if bulk else "hashpspool",
+            "options": {"target_size_ratio": ratio} if ratio is not None else {},
+            "application_metadata": {app: {} for app in applications}}
+
+
+osd_stat = json.dumps({"epoch": 120, "num_osds": 24, "num_up_osds": 24, "num_in_osds": 24})
+
+
+class TestCephPool(object):
+
+    def test_nearest_power_of_two(self):
+        assert [ceph_pool.nearest_power_of_two(n) for n in [0, 1, 3, 5, 6, 100, 383, 384, 385]] == [1, 1, 2, 4, 4, 128, 256, 256, 512]
+
+    def test_plan_pg_num(self):
+        pools = [dict(name='volumes', pool_size=3, target_size_ratio=0.6),
+                 dict(name='images', pool_size=3, target_size_ratio=0.2),
+                 dict(name='backups', pool_size=6, target_size_ratio=0.2),
+                 dict(name='misc', pool_size=3)]
+        # 24 osds * 100 pgs: volumes 480 -> 512, images 160 -> 128, backups 80 -> 64
+        assert ceph_pool.plan_pg_num(pools, [], 24, 100) == dict(volumes=512, images=128, backups=64, misc=32)
+        # ratios are normalized when their sum is greater than 1
+        pools = [dict(name='a', pool_size=3, target_size_ratio=2), dict(name='b', pool_size=3, target_size_ratio=2)]
+        assert ceph_pool.plan_pg_num(pools, [], 24, 100) == dict(a=512, b=512)
+        assert ceph_pool.plan_pg_num(pools, [], 3, 100) == dict(a=64, b=64)
+
+    def test_plan_pg_num_existing_pools(self):
+        pools = [dict(name='images', pool_size=3, target_size_ratio=0.5)]
+        assert ceph_pool.plan_pg_num(pools, [], 24, 100) == dict(images=512)
+        # the ratios of the existing pools count in the normalization: 0.5 / 2 * 800 -> 256
+        existing = [dict(target_size_ratio=1.5, bulk=False)]
+        assert ceph_pool.plan_pg_num(pools, existing, 24, 100) == dict(images=256)
+
+    def test_plan_pg_num_bulk(self):
+        pools = [dict(name='data', pool_size=3, bulk=True), dict(name='meta', pool_size=3)]
+        existing = [dict(target_size_ratio=0.5, bulk=False)]
+        # the bulk pool gets the capacity left by the ratios
+        assert ceph_pool.plan_pg_num(pools, existing, 24, 100) == dict(data=512, meta=32)
+        # and shares it with the existing bulk pools
+        existing.append(dict(target_size_ratio=0.0, bulk=True))
+        assert ceph_pool.plan_pg_num(pools, existing, 24, 100) == dict(data=256, meta=32)
+        # nothing is left
+        existing.append(dict(target_size_ratio=0.5, bulk=False))
+        assert ceph_pool.plan_pg_num(pools, existing, 24, 100) == dict(data=32, meta=32)
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_reconcile(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'pools': [
+                {'name': 'images', 'application': 'rbd', 'target_size_ratio': 0.2},
+                {'name': 'volumes', 'application': 'rbd', 'target_size_ratio': 0.6, 'bulk': True},
+                {'name': 'backups', 'type': 'erasure', 'erasure_profile': 'ec42', 'target_size_ratio': 0.2},
+            ]
+        })
+        m_exit_json.side_effect = common.exit_json
+        current = [pool_detail('images', ratio=0.2, applications=['rbd']),
+                   pool_detail('volumes', applications=[]),
+                   pool_detail('old')]
+        m_run_command.side_effect = [
+            (0, common.batch_output((0, json.dumps(current)), (0, osd_stat), (0, json.dumps({"k": "4", "m": "2", "plugin": "jerasure"}))), ''),
+            (0, common.batch_output(*[(0, '')] * 5), ''),
+        ]
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_pool.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert result['pg_plan'] == dict(backups=64)
+        assert [(pool['name'], pool['action']) for pool in result['pools']] == [('images', 'none'), ('volumes', 'updated'),
+                                                                                ('backups', 'created')]
+        assert result['pools'][1]['changes'] == dict(target_size_ratio=[0.0, 0.6], bulk=[False, True], application=[[], 'rbd'])
+
+        assert 'erasure-code-profile get ec42' in m_run_command.call_args_list[0][1]['data']
+        script = [line for line in m_run_command.call_args_list[1][1]['data'].splitlines() if not line.startswith('printf')]
+        assert script == ['ceph osd pool set volumes target_size_ratio 0.6',
+                          'ceph osd pool set volumes bulk true',
+                          'ceph osd pool application enable volumes rbd',
+                          'ceph osd pool create backups 64 64 erasure ec42',
+                          'ceph osd pool set backups target_size_ratio 0.2']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_no_change(self, m_run_command, m_exit_json):
+        common.set_module_args({
+            'pools': [{'name': 'rbd', 'size': 3, 'min_size': 2, 'application': 'rbd', 'pg_autoscale_mode': 'on', 'bulk': False}]
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, common.batch_output((0, json.dumps([pool_detail('rbd', applications=['rbd'])])), (0, osd_stat)), ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            ceph_pool.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert m_run_command.call_count == 1
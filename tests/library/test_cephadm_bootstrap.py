@@ -302,3 +302,22 @@ class TestCephadmBootstrapModule(object):
         assert result['cmd'] == ['cephadm', 'bootstrap', '--mon-ip', fake_ip,
                                  '--registry-json', fake_registry_json]
         assert result['rc'] == 0
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('module_utils.ceph_common.run_command_with_timeout')
+    def test_with_command_timeout(self, m_run_command_with_timeout, m_exit_json):
+        common.set_module_args({
+            'mon_ip': fake_ip,
+            'command_timeout': 600
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command_with_timeout.return_value = 0, '', ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_bootstrap.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        # the timeout isn't passed to cephadm
+        assert result['cmd'] == ['cephadm', 'bootstrap', '--mon-ip', fake_ip]
+        assert m_run_command_with_timeout.call_args[0][1:] == (result['cmd'], 600)
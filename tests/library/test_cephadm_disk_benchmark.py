@@ -0,0 +1,80 @@
+from mock.mock import patch
+import pytest
+import common
+import cephadm_disk_benchmark
+
+
+@pytest.fixture
+def device(tmp_path):
+    # a regular file, the same code path as a loop device
+    path = tmp_path / 'disk.img'
+    with open(str(path), 'wb') as f:
+        f.truncate(16 * 1024 * 1024)
+    return str(path)
+
+
+class TestCephadmDiskBenchmark(object):
+
+    def test_find_outliers(self):
+        devices = [dict(path='/dev/sda', model='ST8000', seq_read_mbps=250.0, rand_read_iops=180, seq_write_mbps=None),
+                   dict(path='/dev/sdb', model='ST8000', seq_read_mbps=240.0, rand_read_iops=175, seq_write_mbps=None),
+                   dict(path='/dev/sdc', model='ST8000', seq_read_mbps=120.0, rand_read_iops=170, seq_write_mbps=None),
+                   dict(path='/dev/nvme0n1', model='PM1733', seq_read_mbps=3000.0, rand_read_iops=90000, seq_write_mbps=None)]
+        cephadm_disk_benchmark.find_outliers(devices, 0.2, {}, dict(seq_read_mbps=None, rand_read_iops=None))
+
+        assert [device['outlier'] for device in devices] == [False, False, True, False]
+        assert devices[2]['reasons'] == ['seq_read_mbps 120.0 is 50% lower than the median of ST8000 (240.0)']
+
+        # a single device of a model is only compared with the baseline and the minimums
+        cephadm_disk_benchmark.find_outliers(devices[3:], 0.2, dict(PM1733=dict(rand_read_iops=200000)), dict(seq_read_mbps=5000, rand_read_iops=None))
+        assert devices[3]['reasons'] == ['rand_read_iops 90000 is 55% lower than the baseline of PM1733 (200000)',
+                                         'seq_read_mbps 3000.0 is lower than 5000']
+
+    def test_benchmark(self, device):
+        result = cephadm_disk_benchmark.benchmark(device, 0.1, 1048576, 2, False)
+
+        assert result['size'] == 16 * 1024 * 1024
+        assert result['seq_read_mbps'] > 0
+        assert result['rand_read_iops'] > 0
+        assert result['seq_write_mbps'] is None
+
+    @patch('ansible.module_utils.basic.AnsibleModule.get_bin_path', return_value='/usr/sbin/blkid')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_write_empty_device(self, m_run_command, m_exit_json, m_get_bin_path, device):
+        common.set_module_args({
+            'devices': [device],
+            'runtime': 0.1,
+            'write': True
+        })
+        m_exit_json.side_effect = common.exit_json
+        # blkid -p: no signature found
+        m_run_command.return_value = 2, '', ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_disk_benchmark.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert result['devices'][0]['seq_write_mbps'] > 0
+        assert result['outliers'] == []
+        m_run_command.assert_called_once_with(['/usr/sbin/blkid', '-p', device])
+
+    @patch('ansible.module_utils.basic.AnsibleModule.get_bin_path', return_value='/usr/sbin/blkid')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_no_write_on_used_device(self, m_run_command, m_exit_json, m_get_bin_path, device):
+        common.set_module_args({
+            'devices': [device],
+            'runtime': 0.1,
+            'write': True
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, '/dev/sdb: UUID="f3b0" TYPE="LVM2_member"', ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_disk_benchmark.main()
+
+        result = result.value.args[0]
+        assert not result['changed']
+        assert result['devices'][0]['seq_write_mbps'] is None
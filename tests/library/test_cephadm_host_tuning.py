@@ -0,0 +1,153 @@
+from mock.mock import patch
+import pytest
+import os
+import common
+import cephadm_host_tuning
+
+
+@pytest.fixture
+def host(tmp_path, monkeypatch):
+    '''
+    A fake /proc/sys and transparent huge pages setting.
+    '''
+    proc_sys = tmp_path / 'proc' / 'sys'
+    for key, value in cephadm_host_tuning.PROFILES['nvme']['sysctl'].items():
+        path = proc_sys.joinpath(*key.split('.'))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('{}\n'.format(value).replace(' ', '\t'))
+    (proc_sys / 'vm' / 'swappiness').write_text('60\n')
+    (proc_sys / 'vm' / 'min_free_kbytes').write_text('67584\n')
+    thp = tmp_path / 'thp_enabled'
+    thp.write_text('[always] madvise never\n')
+
+    monkeypatch.setattr(cephadm_host_tuning, 'PROC_SYS', str(proc_sys))
+    monkeypatch.setattr(cephadm_host_tuning, 'THP_PATH', str(thp))
+    monkeypatch.setattr(cephadm_host_tuning, 'THP_TMPFILES', str(tmp_path / 'tmpfiles.d' / 'ceph-thp.conf'))
+    monkeypatch.setattr(cephadm_host_tuning, 'TUNED_DIR', str(tmp_path / 'tuned'))
+    return tmp_path
+
+
+class TestCephadmHostTuning(object):
+
+    @patch('ansible.module_utils.basic.AnsibleModule.get_bin_path', return_value=None)
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    def test_apply(self, m_exit_json, m_get_bin_path, host):
+        sysctl_file = str(host / 'sysctl.d' / '90-ceph-tuning.conf')
+        common.set_module_args({
+            'profile': 'nvme',
+            'sysctl': {'vm.min_free_kbytes': 4194304},
+            'tuned_profile': '',
+            'sysctl_file': sysctl_file
+        })
+        m_exit_json.side_effect = common.exit_json
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_host_tuning.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert result['file_changed']
+        # the tcp_rmem/tcp_wmem values only differ by their whitespaces
+        assert result['sysctl_changed'] == {'vm.min_free_kbytes': ['67584', '4194304'],
+                                            'vm.swappiness': ['60', '10']}
+        assert result['transparent_hugepage'] == ['always', 'madvise']
+        assert (host / 'proc' / 'sys' / 'vm' / 'swappiness').read_text() == '10'
+        assert (host / 'thp_enabled').read_text() == 'madvise'
+        with open(sysctl_file) as f:
+            content = f.read()
+        assert 'vm.min_free_kbytes = 4194304\n' in content
+        assert 'net.ipv4.tcp_rmem = 4096 87380 134217728\n' in content
+
+        # the second run is a no-op
+        (host / 'thp_enabled').write_text('always [madvise] never\n')
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_host_tuning.main()
+
+        assert not result.value.args[0]['changed']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.get_bin_path', return_value='/usr/sbin/tuned-adm')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_check_mode(self, m_run_command, m_exit_json, m_get_bin_path, host):
+        sysctl_file = str(host / '90-ceph-tuning.conf')
+        common.set_module_args({
+            'profile': 'hdd-dense',
+            'sysctl_file': sysctl_file,
+            '_ansible_check_mode': True
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, 'Current active profile: virtual-guest\n', ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_host_tuning.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        assert result['tuned'] == ['virtual-guest', 'ceph-throughput-performance']
+        assert not (host / 'tuned').exists()
+        assert 'net.core.rmem_max' in result['sysctl_changed']
+        assert not os.path.exists(sysctl_file)
+        assert (host / 'proc' / 'sys' / 'vm' / 'swappiness').read_text() == '60\n'
+        m_run_command.assert_called_once_with(['/usr/sbin/tuned-adm', 'active'])
+
+    @patch('ansible.module_utils.basic.AnsibleModule.get_bin_path', return_value='/usr/sbin/tuned-adm')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_tuned_child_profile(self, m_run_command, m_exit_json, m_get_bin_path, host):
+        common.set_module_args({
+            'profile': 'hdd-dense',
+            'sysctl_file': str(host / '90-ceph-tuning.conf')
+        })
+        m_exit_json.side_effect = common.exit_json
+        thp = host / 'thp_enabled'
+
+        def run_command(cmd):
+            if cmd[1] == 'profile':
+                # the profile sets the transparent huge pages before the module does
+                assert not (host / 'tmpfiles.d').exists()
+                thp.write_text('[always] madvise never\n')
+                return 0, '', ''
+            return 0, 'Current active profile: {}\n'.format(active), ''
+        m_run_command.side_effect = run_command
+
+        active = 'throughput-performance'
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_host_tuning.main()
+
+        result = result.value.args[0]
+        assert result['tuned'] == ['throughput-performance', 'ceph-throughput-performance']
+        m_run_command.assert_called_with(['/usr/sbin/tuned-adm', 'profile', 'ceph-throughput-performance'])
+        assert 'include=throughput-performance\n' in (host / 'tuned' / 'ceph-throughput-performance' / 'tuned.conf').read_text()
+        assert 'transparent_hugepages=madvise\n' in (host / 'tuned' / 'ceph-throughput-performance' / 'tuned.conf').read_text()
+        assert thp.read_text() == 'madvise'
+
+        # the child profile is active and keeps the mode: nothing to do
+        active = 'ceph-throughput-performance'
+        thp.write_text('always [madvise] never\n')
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_host_tuning.main()
+
+        assert not result.value.args[0]['changed']
+
+    def test_sysctl_path(self, host):
+        conf = host / 'proc' / 'sys' / 'net' / 'ipv4' / 'conf'
+        for interface in ['eth0', 'eth0.1']:
+            (conf / interface).mkdir(parents=True)
+            (conf / interface / 'rp_filter').write_text('1\n')
+
+        assert cephadm_host_tuning.sysctl_path('net.ipv4.conf.eth0.1.rp_filter') == str(conf / 'eth0.1' / 'rp_filter')
+        assert cephadm_host_tuning.sysctl_path('net.ipv4.conf.eth0.rp_filter') == str(conf / 'eth0' / 'rp_filter')
+        assert cephadm_host_tuning.sysctl_path('net/ipv4/conf/eth0.1/rp_filter') == str(conf / 'eth0.1' / 'rp_filter')
+
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    def test_unknown_sysctl(self, m_fail_json, host):
+        common.set_module_args({
+            'profile': 'mixed',
+            'sysctl': {'vm.does_not_exist': 1}
+        })
+        m_fail_json.side_effect = common.fail_json
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            cephadm_host_tuning.main()
+
+        assert result.value.args[0]['msg'] == 'Unknown sysctl setting(s): vm.does_not_exist'
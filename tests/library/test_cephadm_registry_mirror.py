@@ -0,0 +1,175 @@
+from mock.mock import patch
+import pytest
+import json
+import common
+import cephadm_registry_mirror
+
+
+registries_conf = '''unqualified-search-registries = ["registry.access.redhat.com", "docker.io"]
+
+# BEGIN cephadm-ansible managed : localhost:5000
+[[registry]]
+location = 'localhost:5000'
+insecure = true
+# END cephadm-ansible managed : localhost:5000'''
+
+mirrors = [{'registry': 'quay.io', 'mirrors': ['registry-cache.lab:5000', 'registry-cache2.lab:5000'], 'insecure': True},
+           {'registry': 'docker.io', 'mirrors': ['https://registry-cache.lab:5001']}]
+
+
+class TestCephadmRegistryMirror(object):
+
+    def test_update_registries_conf(self):
+        block = cephadm_registry_mirror.format_registries_block(mirrors[:1])
+        assert block == '''# BEGIN cephadm-ansible managed : registry mirrors
+[[registry]]
+prefix = "quay.io"
+location = "quay.io"
+
+[[registry.mirror]]
+location = "registry-cache.lab:5000"
+insecure = true
+
+[[registry.mirror]]
+location = "registry-cache2.lab:5000"
+insecure = true
+
+# END cephadm-ansible managed : registry mirrors
+'''
+        content = cephadm_registry_mirror.update_registries_conf(registries_conf, block)
+        assert content == registries_conf + '\n' + block
+
+        new_block = cephadm_registry_mirror.format_registries_block(mirrors[1:])
+        assert cephadm_registry_mirror.update_registries_conf(content, new_block) == registries_conf + '\n' + new_block
+        assert cephadm_registry_mirror.update_registries_conf(content, None) == registries_conf + '\n'
+
+    def test_update_daemon_json(self):
+        current = {'log-driver': 'journald', 'insecure-registries': ['localhost:5000']}
+        insecure_hub = [dict(mirrors[1], insecure=True, mirrors=['registry-cache.lab:5001'])]
+
+        config = cephadm_registry_mirror.update_daemon_json(current, mirrors[:1] + insecure_hub, True)
+        assert config == {'log-driver': 'journald',
+                          'registry-mirrors': ['http://registry-cache.lab:5001'],
+                          'insecure-registries': ['localhost:5000', 'registry-cache.lab:5001']}
+        assert cephadm_registry_mirror.update_daemon_json(config, insecure_hub, False) == current
+        # the entries added by a previous run are removed without the mirrors
+        assert cephadm_registry_mirror.update_daemon_json(config, [], False, ['registry-cache.lab:5001']) == current
+
+    @patch('ansible.module_utils.basic.AnsibleModule.get_bin_path', return_value='/usr/bin/podman')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_podman(self, m_run_command, m_exit_json, m_get_bin_path, tmp_path):
+        path = tmp_path / 'registries.conf'
+        path.write_text(registries_conf)
+        common.set_module_args({
+            'mirrors': mirrors,
+            'registries_conf': str(path)
+        })
+        m_exit_json.side_effect = common.exit_json
+        m_run_command.return_value = 0, '{}', ''
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_registry_mirror.main()
+
+        assert result.value.args[0]['changed']
+        assert path.read_text() == registries_conf + '\n' + cephadm_registry_mirror.format_registries_block(mirrors)
+        args, kwargs = m_run_command.call_args
+        assert args[0] == ['/usr/bin/podman', 'info', '--format', 'json']
+        assert 'CONTAINERS_REGISTRIES_CONF' in kwargs['environ_update']
+
+        # the second run is a no-op, the file isn't validated again
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_registry_mirror.main()
+
+        assert not result.value.args[0]['changed']
+        assert m_run_command.call_count == 1
+
+    @patch('ansible.module_utils.basic.AnsibleModule.get_bin_path', return_value='/usr/bin/podman')
+    @patch('ansible.module_utils.basic.AnsibleModule.fail_json')
+    @patch('ansible.module_utils.basic.AnsibleModule.run_command')
+    def test_podman_invalid(self, m_run_command, m_fail_json, m_get_bin_path, tmp_path):
+        path = tmp_path / 'registries.conf'
+        path.write_text('[registries.search]\nregistries = ["docker.io"]\n')
+        common.set_module_args({
+            'mirrors': mirrors,
+            'registries_conf': str(path)
+        })
+        m_fail_json.side_effect = common.fail_json
+        m_run_command.return_value = 125, '', 'mixing sysregistry v1/v2 is not supported'
+
+        with pytest.raises(common.AnsibleFailJson) as result:
+            cephadm_registry_mirror.main()
+
+        assert result.value.args[0]['msg'] == 'Invalid registries configuration: mixing sysregistry v1/v2 is not supported'
+        assert path.read_text() == '[registries.search]\nregistries = ["docker.io"]\n'
+
+    @patch('ansible.module_utils.basic.AnsibleModule.warn')
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    def test_docker(self, m_exit_json, m_warn, tmp_path):
+        path = tmp_path / 'daemon.json'
+        path.write_text('{"log-driver": "journald"}')
+        common.set_module_args({
+            'mirrors': mirrors,
+            'docker': True,
+            'daemon_json': str(path)
+        })
+        m_exit_json.side_effect = common.exit_json
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_registry_mirror.main()
+
+        result = result.value.args[0]
+        assert result['changed']
+        m_warn.assert_called_once_with('docker only supports mirrors of docker.io, ignoring the mirrors of: quay.io')
+        assert json.loads(path.read_text()) == {'log-driver': 'journald', 'registry-mirrors': ['https://registry-cache.lab:5001']}
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_registry_mirror.main()
+
+        assert not result.value.args[0]['changed']
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    def test_docker_absent(self, m_exit_json, tmp_path):
+        path = tmp_path / 'daemon.json'
+        path.write_text('{"log-driver": "journald", "insecure-registries": ["localhost:5000"]}')
+        common.set_module_args({
+            'mirrors': [dict(mirrors[1], insecure=True)],
+            'docker': True,
+            'daemon_json': str(path)
+        })
+        m_exit_json.side_effect = common.exit_json
+
+        with pytest.raises(common.AnsibleExitJson):
+            cephadm_registry_mirror.main()
+
+        assert json.loads(path.read_text())['insecure-registries'] == ['localhost:5000', 'registry-cache.lab:5001']
+
+        # absent, without passing the mirrors again
+        common.set_module_args({
+            'state': 'absent',
+            'docker': True,
+            'daemon_json': str(path)
+        })
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_registry_mirror.main()
+
+        assert result.value.args[0]['changed']
+        assert json.loads(path.read_text()) == {'log-driver': 'journald', 'insecure-registries': ['localhost:5000']}
+        assert not (tmp_path / cephadm_registry_mirror.STATE_FILE).exists()
+
+    @patch('ansible.module_utils.basic.AnsibleModule.exit_json')
+    def test_check_mode(self, m_exit_json, tmp_path):
+        path = tmp_path / 'daemon.json'
+        common.set_module_args({
+            'mirrors': mirrors[1:],
+            'docker': True,
+            'daemon_json': str(path),
+            '_ansible_check_mode': True
+        })
+        m_exit_json.side_effect = common.exit_json
+
+        with pytest.raises(common.AnsibleExitJson) as result:
+            cephadm_registry_mirror.main()
+
+        assert result.value.args[0]['changed']
+        assert not path.exists()
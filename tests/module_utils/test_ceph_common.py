@@ -1,6 +1,10 @@
 import ceph_common
+import fcntl
+import os
 import pytest
-from mock.mock import MagicMock
+import sys
+import zipfile
+from mock.mock import MagicMock, patch
 
 
 class TestCephCommon(object):
@@ -37,3 +41,213 @@ class TestCephCommon(object):
         self.fake_module.fail_json.assert_called_with(msg='error', rc=1)
         with pytest.raises(Exception):
             ceph_common.fatal("error", False)
+
+    def test_parse_batch_output(self):
+        out = "[1]\n\n@@cephadm-ansible 0 0\nError ENOENT\n@@cephadm-ansible 1 2\n"
+        results = ceph_common.parse_batch_output(out, 3)
+        assert results == [(0, '[1]'), (2, 'Error ENOENT'), (1, '')]
+
+    def test_build_batch_script(self):
+        script = ceph_common.build_batch_script([['ceph', 'config', 'set', 'osd', 'foo', 'a b']])
+        assert script.splitlines()[0] == "ceph config set osd foo 'a b'"
+        assert '@@cephadm-ansible 0 %d' in script.splitlines()[1]
+
+    def test_run_batch(self):
+        self.fake_module.params = {'fsid': '123'}
+        self.fake_module.run_command.return_value = 0, "foo\n@@cephadm-ansible 0 0\n", ''
+        rc, cmd, results, err = ceph_common.run_batch(self.fake_module, [['ceph', 'fsid']])
+        assert cmd == ['cephadm', 'shell', '--fsid', '123', 'bash', '-s']
+        assert results == [(0, 'foo')]
+        assert self.fake_module.run_command.call_args[1]['data'].startswith('ceph fsid\n')
+
+    def test_iter_json_array(self):
+        assert list(ceph_common.iter_json_array(' [ {"a": [1, 2]},\n {"b": "]"} ]\n')) == [{'a': [1, 2]}, {'b': ']'}]
+        assert list(ceph_common.iter_json_array('[]')) == []
+        with pytest.raises(ValueError):
+            list(ceph_common.iter_json_array('{"a": 1}'))
+        with pytest.raises(ValueError):
+            list(ceph_common.iter_json_array('[{"a": 1}'))
+
+    def test_parse_who(self):
+        assert ceph_common.parse_who('osd') == ('osd', '')
+        assert ceph_common.parse_who('osd.0') == ('osd.0', '')
+        assert ceph_common.parse_who('osd/host:ceph-osd-02') == ('osd', 'host:ceph-osd-02')
+        assert ceph_common.parse_who('osd/class:ssd') == ('osd', 'class:ssd')
+        assert ceph_common.parse_who('osd/class:ssd/rack:r1') == ('osd', 'rack:r1/class:ssd')
+
+    def test_lookup_config(self):
+        config_dump = [
+            {"section": "osd", "name": "osd_memory_target", "value": "4294967296", "mask": ""},
+            {"section": "osd", "name": "osd_memory_target", "value": "5368709120", "mask": "host:ceph-osd-02"},
+            {"section": "osd", "name": "osd_memory_target", "value": "6442450944", "mask": "rack:r1/class:ssd"}
+        ]
+        index = ceph_common.build_config_index(config_dump)
+        assert ceph_common.lookup_config(index, 'osd', 'osd_memory_target') == '4294967296'
+        assert ceph_common.lookup_config(index, 'osd/host:ceph-osd-02', 'osd_memory_target') == '5368709120'
+        assert ceph_common.lookup_config(index, 'osd/class:ssd/rack:r1', 'osd_memory_target') == '6442450944'
+        assert ceph_common.lookup_config(index, 'osd/host:ceph-osd-03', 'osd_memory_target') is None
+
+    def test_normalize_config_value(self):
+        assert ceph_common.normalize_config_value('5G', 'size') == ceph_common.normalize_config_value('5368709120', 'size')
+        assert ceph_common.normalize_config_value('5GiB', 'size') == 5368709120
+        assert ceph_common.normalize_config_value('2K', 'uint') == 2000
+        assert ceph_common.normalize_config_value('true', 'bool') == ceph_common.normalize_config_value('1', 'bool')
+        assert ceph_common.normalize_config_value('no', 'bool') is False
+        assert ceph_common.normalize_config_value('0.50', 'float') == 0.5
+        assert ceph_common.normalize_config_value('1h30m', 'secs') == 5400
+        assert ceph_common.normalize_config_value('2s', 'millisecs') == 2000
+        assert ceph_common.normalize_config_value('Foo', 'str') == 'Foo'
+        assert ceph_common.normalize_config_value('TRUE', None) == 'true'
+        assert ceph_common.normalize_config_value('abc', 'size') == 'abc'
+
+    def test_acquire_slot(self, tmp_path):
+        fd1 = ceph_common.acquire_slot(str(tmp_path), 2)
+        fd2 = ceph_common.acquire_slot(str(tmp_path), 2)
+        with pytest.raises(BlockingIOError):
+            fd3 = os.open(str(tmp_path / 'slot-0.lock'), os.O_RDWR)
+            try:
+                fcntl.flock(fd3, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            finally:
+                os.close(fd3)
+        os.close(fd1)
+        fd1 = ceph_common.acquire_slot(str(tmp_path), 2)
+        assert ceph_common.acquire_slot(str(tmp_path), 2, timeout=0.2) is None
+        os.close(fd1)
+        os.close(fd2)
+
+    def test_run_command_slot_wait_timeout(self, tmp_path):
+        self.fake_module.params = {'fsid': '123', 'max_concurrency': 1, 'module_timeout': 10}
+        (tmp_path / '123').mkdir()
+        fd = ceph_common.acquire_slot(str(tmp_path / '123'), 1)
+        try:
+            with patch('ceph_common.LIMITER_DIR', str(tmp_path)), \
+                    patch('ceph_common._process_start', ceph_common.time.monotonic() - 9.8):
+                ceph_common.run_command(self.fake_module, ['true'])
+        finally:
+            os.close(fd)
+        kwargs = self.fake_module.fail_json.call_args_list[0][1]
+        assert kwargs['timed_out']
+        assert 'waiting for one of the 1 command slot(s)' in kwargs['msg']
+
+    def test_take_token(self, tmp_path):
+        assert ceph_common.take_token(str(tmp_path), 2) == 0
+        assert ceph_common.take_token(str(tmp_path), 2) == 0
+        assert 0.4 < ceph_common.take_token(str(tmp_path), 2) <= 0.5
+
+    @patch('time.sleep')
+    def test_run_command_rate_limited(self, m_sleep, tmp_path):
+        self.fake_module.params = {'fsid': '123', 'max_concurrency': 1, 'rate_limit': 1}
+        self.fake_module.run_command.return_value = 0, 'foo', ''
+        with patch('ceph_common.LIMITER_DIR', str(tmp_path)):
+            assert ceph_common.run_command(self.fake_module, ['ceph', 'fsid']) == (0, 'foo', '')
+            ceph_common.run_command(self.fake_module, ['ceph', 'fsid'])
+        assert (tmp_path / '123' / 'slot-0.lock').exists()
+        assert 0.9 < m_sleep.call_args_list[-1][0][0] <= 1
+        assert ceph_common.get_stats(self.fake_module)['commands'] == 2
+
+    def test_write_metrics(self, tmp_path):
+        self.fake_module.params = {'fsid': '123', 'metrics_dir': str(tmp_path)}
+        self.fake_module._name = 'ceph_config'
+        ceph_common.get_stats(self.fake_module)['commands'] = 2
+        ceph_common.write_metrics(self.fake_module, 3.5, True, False)
+        ceph_common.write_metrics(self.fake_module, 42, False, True)
+
+        path = tmp_path / 'cephadm_ansible_ceph_config.prom'
+        content = path.read_text()
+        labels = 'module="ceph_config",fsid="123"'
+        assert '# TYPE cephadm_ansible_module_duration_seconds histogram' in content
+        assert 'cephadm_ansible_module_runs_total{%s} 2' % labels in content
+        assert 'cephadm_ansible_module_changed_total{%s} 1' % labels in content
+        assert 'cephadm_ansible_module_failed_total{%s} 1' % labels in content
+        assert 'cephadm_ansible_module_commands_total{%s} 4' % labels in content
+        assert 'cephadm_ansible_module_duration_seconds_sum{%s} 45.5' % labels in content
+        assert 'cephadm_ansible_module_duration_seconds_bucket{%s,le="5"} 1' % labels in content
+        assert 'cephadm_ansible_module_duration_seconds_bucket{%s,le="60"} 2' % labels in content
+        assert content.index('le="5"}') < content.index('le="10"}') < content.index('le="+Inf"}')
+        assert sorted(p.name for p in tmp_path.iterdir() if not p.name.endswith('.lock')) == ['cephadm_ansible_ceph_config.prom']
+
+    def test_run_command_timeout(self):
+        self.fake_module.params = {'command_timeout': 1}
+        with patch('ceph_common.KILL_GRACE_PERIOD', 1):
+            rc, out, err = ceph_common.run_command(self.fake_module, ['sh', '-c', 'echo partial; exec sleep 30'])
+        kwargs = self.fake_module.fail_json.call_args[1]
+        assert kwargs['timed_out']
+        assert kwargs['stdout'] == 'partial\n'
+        assert rc == -15
+        self.fake_module.run_command.assert_not_called()
+
+    def test_run_command_within_timeout(self):
+        self.fake_module.params = {'command_timeout': 10}
+        assert ceph_common.run_command(self.fake_module, ['cat'], data='foo') == (0, 'foo\n', '')
+        self.fake_module.fail_json.assert_not_called()
+
+    def test_run_command_module_timeout_exceeded(self):
+        self.fake_module.params = {'module_timeout': 10}
+        with patch('ceph_common._process_start', ceph_common.time.monotonic() - 20):
+            ceph_common.run_command(self.fake_module, ['true'])
+        assert self.fake_module.fail_json.call_args_list[0][1]['timed_out']
+
+    @pytest.fixture
+    def fake_cephadm(self, tmp_path):
+        path = tmp_path / 'cephadm'
+        with patch('ceph_common.CEPHADM_PATHS', [str(path)]), \
+                patch('ceph_common._cephadm', dict(module=None, error=None, import_seconds=0.0, startup_seconds=None)), \
+                patch.dict('sys.modules'), \
+                patch('sys.path', list(sys.path)):
+            yield path
+
+    def test_run_command_inprocess(self, fake_cephadm):
+        fake_cephadm.write_text(
+            'import sys\n'
+            'def command_shell(ctx):\n'
+            '    pass\n'
+            'def main():\n'
+            '    print(" ".join(sys.argv[1:]))\n'
+            '    sys.stdout.write(sys.stdin.read())\n'
+            '    sys.exit(3)\n'
+        )
+        self.fake_module.params = {'cephadm_inprocess': True}
+        assert ceph_common.run_command(self.fake_module, ['cephadm', 'shell', 'bash', '-s'], data='foo') == (3, 'shell bash -s\nfoo\n', '')
+        ceph_common.run_command(self.fake_module, ['cephadm', 'shell', 'ceph', 'fsid'])
+        self.fake_module.run_command.assert_not_called()
+        stats = ceph_common.get_inprocess_stats(self.fake_module)
+        assert stats['calls'] == 2
+        assert stats['fallback'] is None
+
+        # each command would start an interpreter and import cephadm again
+        with patch.dict('ceph_common._cephadm', import_seconds=0.2, startup_seconds=0.05):
+            stats = ceph_common.get_inprocess_stats(self.fake_module)
+        assert stats['subprocess_seconds'] == 0.25
+        assert stats['time_saved'] == 0.3
+
+    def test_run_command_inprocess_zipapp(self, fake_cephadm):
+        # the layout of the cephadm zipapp: __main__.py and its packages
+        with zipfile.ZipFile(str(fake_cephadm), 'w') as zipapp:
+            zipapp.writestr('cephadmlib/__init__.py', '')
+            zipapp.writestr('cephadmlib/constants.py', 'DEFAULT_IMAGE = "quay.io/ceph/ceph:v18"\n')
+            zipapp.writestr('__main__.py',
+                            'import sys\n'
+                            'from cephadmlib.constants import DEFAULT_IMAGE\n'
+                            'def command_shell(ctx):\n'
+                            '    pass\n'
+                            'def main():\n'
+                            '    print(DEFAULT_IMAGE, " ".join(sys.argv[1:]))\n'
+                            'if __name__ == "__main__":\n'
+                            '    main()\n')
+        self.fake_module.params = {'cephadm_inprocess': True}
+        assert ceph_common.run_command(self.fake_module, ['cephadm', 'shell', 'ceph', 'fsid']) == (0, 'quay.io/ceph/ceph:v18 shell ceph fsid\n', '')
+        self.fake_module.run_command.assert_not_called()
+        stats = ceph_common.get_inprocess_stats(self.fake_module)
+        assert stats['calls'] == 1
+        assert stats['fallback'] is None
+        assert stats['subprocess_seconds'] > stats['import_seconds']
+        assert stats['time_saved'] == pytest.approx(stats['subprocess_seconds'] - stats['import_seconds'], abs=0.002)
+
+    def test_run_command_inprocess_incompatible(self, fake_cephadm):
+        fake_cephadm.write_text('def main():\n    pass\n')
+        self.fake_module.params = {'cephadm_inprocess': True}
+        self.fake_module.run_command.return_value = 0, 'foo', ''
+        assert ceph_common.run_command(self.fake_module, ['cephadm', 'shell', 'ceph', 'fsid']) == (0, 'foo', '')
+        stats = ceph_common.get_inprocess_stats(self.fake_module)
+        assert 'command_shell' in stats['fallback']
+        assert 'time_saved' not in stats